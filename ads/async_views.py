@@ -0,0 +1,122 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import Http404, HttpResponse
+from rest_framework.authentication import (BasicAuthentication,
+                                           SessionAuthentication)
+from rest_framework.request import ForcedAuthentication
+from rest_framework.response import Response
+
+ASYNC_METHODS = ('get', 'head')
+
+
+async def aauthenticate(request):
+    authenticators = request.authenticators
+    if all(isinstance(authenticator, ForcedAuthentication)
+           for authenticator in authenticators):
+        return request.user
+    if 'HTTP_AUTHORIZATION' in request.META or not all(
+            isinstance(authenticator, (SessionAuthentication,
+                                       BasicAuthentication))
+            for authenticator in authenticators):
+        return await sync_to_async(lambda: request.user)()
+    user = await request._request.auser()
+    if user.is_authenticated:
+        request._authenticator = next(
+            authenticator for authenticator in authenticators
+            if isinstance(authenticator, SessionAuthentication))
+        request.user, request.auth = user, None
+    else:
+        request._not_authenticated()
+    return request.user
+
+
+def render_response(response):
+    if not hasattr(response, 'render'):
+        return response
+    response.render()
+    rendered = HttpResponse(response.content, status=response.status_code,
+                            headers=response.headers)
+    rendered.data = response.data
+    return rendered
+
+
+class AsyncReadMixin:
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+        if not getattr(settings, 'ASYNC_READ_VIEWS', False):
+            return view
+        async_actions = {
+            method: f'a{action}' for method, action in actions.items()
+            if method in ASYNC_METHODS and hasattr(cls, f'a{action}')}
+        if 'get' in async_actions and 'head' not in actions:
+            async_actions['head'] = async_actions['get']
+        if not async_actions:
+            return view
+        sync_view = sync_to_async(view)
+
+        async def async_view(request, *args, **kwargs):
+            handler = async_actions.get(request.method.lower())
+            if handler is None:
+                return await sync_view(request, *args, **kwargs)
+            self = cls(**initkwargs)
+            self.action_map = actions
+            return await self.adispatch(request, handler, *args, **kwargs)
+
+        async_view.cls = view.cls
+        async_view.initkwargs = view.initkwargs
+        async_view.actions = view.actions
+        async_view.csrf_exempt = True
+        return async_view
+
+    async def adispatch(self, request, handler, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            await aauthenticate(request)
+            self.initial(request, *args, **kwargs)
+            response = await getattr(self, handler)(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        self.response = self.finalize_response(
+            request, response, *args, **kwargs)
+        return render_response(self.response)
+
+    async def aget_object(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            obj = await queryset.aget(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (queryset.model.DoesNotExist, TypeError, ValueError,
+                ValidationError):
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    async def aprepare_objects(self, objects):
+        pass
+
+    def paginated_response(self, queryset, serializer):
+        page = self.paginate_queryset(queryset)
+        data = serializer(page if page is not None else queryset,
+                          many=True).data
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    async def apaginated_response(self, queryset, serializer):
+        page = await self.paginator.apaginate_queryset(
+            queryset, self.request, view=self)
+        objects = page if page is not None else [
+            obj async for obj in queryset]
+        await self.aprepare_objects(objects)
+        data = serializer(objects, many=True).data
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
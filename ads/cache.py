@@ -0,0 +1,78 @@
+import hashlib
+import json
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.utils.encoders import JSONEncoder
+
+AD_CACHE_TIMEOUT = 60 * 60
+AD_CACHE_KEY = 'ads:ad:{pk}:{base}'
+VERSION_KEY = 'ads:version:{label}:{pk}'
+USER_LABEL = settings.AUTH_USER_MODEL.lower()
+
+
+def version_key(label, pk):
+    return VERSION_KEY.format(label=label, pk=pk)
+
+
+def bump_version(label, pk):
+    cache.set(version_key(label, pk), uuid.uuid4().hex, timeout=None)
+
+
+def bump_versions(label, pks):
+    cache.set_many({version_key(label, pk): uuid.uuid4().hex for pk in pks},
+                   timeout=None)
+
+
+def get_version(label, pk):
+    return cache.get(version_key(label, pk))
+
+
+def get_versions(keys):
+    versions = cache.get_many(keys)
+    missing = {key: uuid.uuid4().hex for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return versions
+
+
+def ad_cache_key(pk, request):
+    base = hashlib.md5(request.build_absolute_uri('/').encode()).hexdigest()
+    return AD_CACHE_KEY.format(pk=pk, base=base)
+
+
+def ad_dependencies(ad):
+    keys = [version_key('ads.ad', ad.pk), version_key(USER_LABEL, ad.user_id)]
+    if ad.condition_id is not None:
+        keys.append(version_key('ads.condition', ad.condition_id))
+    keys.extend(version_key('ads.category', pk) for pk in ad.category_ids)
+    return keys
+
+
+def get_cached_ad(pk, request):
+    entry = cache.get(ad_cache_key(pk, request))
+    if entry is None:
+        return None
+    if cache.get_many(list(entry['versions'])) != entry['versions']:
+        return None
+    return entry
+
+
+def cache_ad(ad, data, request, ad_version):
+    ad_key = version_key('ads.ad', ad.pk)
+    if ad_version is None:
+        ad_version = uuid.uuid4().hex
+        if not cache.add(ad_key, ad_version, timeout=None):
+            return None
+    versions = get_versions(ad_dependencies(ad))
+    if versions[ad_key] != ad_version:
+        return None
+    etag = hashlib.md5(''.join(
+        f'{key}={versions[key]};' for key in sorted(versions)
+    ).encode()).hexdigest()
+    entry = {'data': json.loads(json.dumps(data, cls=JSONEncoder)),
+             'versions': versions, 'etag': f'"{etag}"'}
+    cache.set(ad_cache_key(ad.pk, request), entry, AD_CACHE_TIMEOUT)
+    return entry
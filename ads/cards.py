@@ -0,0 +1,112 @@
+import json
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models import Prefetch
+
+from .fast_serializers import AdCardPayloadSerializer
+from .geo import encode_geohash
+from .models import Ad, AdCard, AdCategory
+from .pagination import invalidate_counts
+
+CARD_CHUNK_SIZE = 1000
+CARD_FIELDS = ('title', 'description', 'condition', 'category_slugs',
+               'latitude', 'longitude', 'geohash', 'created_at', 'payload')
+
+pending_cards = ContextVar('pending_cards', default=None)
+
+
+def card_queryset():
+    return Ad.objects.select_related('user', 'condition').prefetch_related(
+        Prefetch('adcategory_set',
+                 queryset=AdCategory.objects.select_related(
+                     'category').order_by('id'))
+    ).defer('search_vector')
+
+
+def ad_location(ad):
+    if ad.latitude is not None and ad.longitude is not None:
+        return ad.latitude, ad.longitude
+    return ad.user.latitude, ad.user.longitude
+
+
+def render_card(ad, payload):
+    latitude, longitude = ad_location(ad)
+    geohash = None
+    if latitude is not None and longitude is not None:
+        geohash = encode_geohash(latitude, longitude)
+    return AdCard(
+        ad_id=ad.pk, title=ad.title, description=ad.description,
+        condition_id=ad.condition_id,
+        category_slugs=[link.category.slug
+                        for link in ad.adcategory_set.all()],
+        latitude=latitude, longitude=longitude, geohash=geohash,
+        created_at=ad.created_at,
+        payload=json.dumps(payload, ensure_ascii=False,
+                           separators=(',', ':')))
+
+
+def render_cards(ads):
+    payloads = AdCardPayloadSerializer(ads, many=True).data
+    return [render_card(ad, payload) for ad, payload in zip(ads, payloads)]
+
+
+def chunked(ids, size=CARD_CHUNK_SIZE):
+    ids = sorted(set(ids))
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def refresh_cards(ad_ids):
+    refreshed = False
+    for chunk in chunked(ad_ids):
+        ads = list(card_queryset().filter(pk__in=chunk))
+        if ads:
+            AdCard.objects.bulk_create(
+                render_cards(ads), update_conflicts=True,
+                unique_fields=['ad'], update_fields=CARD_FIELDS)
+        missing = set(chunk) - {ad.pk for ad in ads}
+        if missing:
+            AdCard.objects.filter(ad__in=missing).delete()
+        refreshed = True
+    if refreshed:
+        invalidate_counts(AdCard)
+
+
+def mark_cards(ad_ids):
+    pending = pending_cards.get()
+    if pending is None:
+        refresh_cards(ad_ids)
+    else:
+        pending.update(ad_ids)
+
+
+@contextmanager
+def batched_cards():
+    if pending_cards.get() is not None:
+        yield
+        return
+    pending = set()
+    token = pending_cards.set(pending)
+    try:
+        yield
+    finally:
+        pending_cards.reset(token)
+    refresh_cards(pending)
+
+
+def card_values(card):
+    return tuple(getattr(card, AdCard._meta.get_field(name).attname)
+                 for name in CARD_FIELDS)
+
+
+def stale_cards():
+    stale = []
+    for chunk in chunked(Ad.objects.values_list('pk', flat=True)):
+        expected = render_cards(list(card_queryset().filter(pk__in=chunk)))
+        actual = AdCard.objects.in_bulk(chunk)
+        stale.extend(
+            card.ad_id for card in expected
+            if card.ad_id not in actual
+            or card_values(actual[card.ad_id]) != card_values(card))
+    return stale
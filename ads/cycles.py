@@ -0,0 +1,238 @@
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connections, router
+
+from .events import BARTER_CYCLE, publish_many
+from .exchanges import PENDING
+from .models import (Ad, AdCategory, BarterCycle, ExchangeProposal,
+                     MatchPosting)
+
+logger = logging.getLogger(__name__)
+
+CYCLE_MIN_LENGTH = 3
+CYCLE_MAX_LENGTH = 4
+CYCLE_FANOUT = 50
+CYCLE_FRONTIER = 500
+CYCLE_INTEREST_DEPTH = 20
+
+OFFER = 0
+INTEREST = 1
+
+PROPOSAL_SQL = '''
+    SELECT sender.user_id FROM {proposals} AS proposal
+    JOIN {ads} AS sender ON sender.id = proposal.ad_sender_id
+    WHERE proposal.id = %s AND proposal.status = %s
+'''
+
+WANTED_BY_SQL = '''
+    WITH owned AS (
+        SELECT id FROM {ads} WHERE user_id = %s
+    ), offers AS (
+        SELECT sender.user_id AS source, proposal.ad_receiver_id AS ad
+        FROM owned
+        JOIN {proposals} AS proposal
+          ON proposal.ad_receiver_id = owned.id AND proposal.status = %s
+        JOIN {ads} AS sender ON sender.id = proposal.ad_sender_id
+    ), listed AS (
+        SELECT link.category_id, link.ad_id AS ad
+        FROM owned JOIN {links} AS link ON link.ad_id = owned.id
+        WHERE link.ad_id IN (
+            SELECT ad_id FROM {postings}
+            WHERE category_id = link.category_id
+            ORDER BY ad_id DESC
+            LIMIT %s)
+    ), interests AS (
+        SELECT DISTINCT sender.user_id AS source, listed.ad
+        FROM listed
+        JOIN {links} AS wanted ON wanted.category_id = listed.category_id
+        JOIN {proposals} AS proposal
+          ON proposal.ad_receiver_id = wanted.ad_id AND proposal.status = %s
+        JOIN {ads} AS sender ON sender.id = proposal.ad_sender_id
+    ), edges AS (
+        SELECT source, ad, {offer} AS kind FROM offers
+        UNION ALL
+        SELECT source, ad, {interest} FROM interests
+    )
+    SELECT source, ad FROM edges
+    WHERE source <> %s
+    ORDER BY kind, ad DESC
+'''
+
+WANTS_SQL = '''
+    WITH offers AS (
+        SELECT sender.user_id AS source, receiver.user_id AS target,
+               proposal.ad_receiver_id AS ad
+        FROM {ads} AS sender
+        JOIN {proposals} AS proposal
+          ON proposal.ad_sender_id = sender.id AND proposal.status = %s
+        JOIN {ads} AS receiver ON receiver.id = proposal.ad_receiver_id
+        WHERE sender.user_id = ANY(%s)
+    ), interests AS (
+        SELECT DISTINCT offers.source, link.category_id
+        FROM offers JOIN {links} AS link ON link.ad_id = offers.ad
+    ), candidates AS (
+        SELECT category.category_id, posting.ad_id, posting.user_id
+        FROM (SELECT DISTINCT category_id FROM interests) AS category
+        CROSS JOIN LATERAL (
+            SELECT ad_id, user_id FROM {postings}
+            WHERE category_id = category.category_id
+            ORDER BY ad_id DESC
+            LIMIT %s
+        ) AS posting
+    ), edges AS (
+        SELECT source, target, ad, {offer} AS kind FROM offers
+        UNION ALL
+        SELECT interests.source, candidates.user_id, candidates.ad_id,
+               {interest}
+        FROM interests JOIN candidates USING (category_id)
+        WHERE candidates.user_id <> interests.source
+    )
+    SELECT source, target, ad, kind FROM edges
+    WHERE cardinality(%s::bigint[]) = 0 OR target = ANY(%s)
+    ORDER BY source, kind, ad DESC
+'''
+
+
+def get_connection():
+    return connections[router.db_for_read(ExchangeProposal)]
+
+
+def format_sql(sql, connection):
+    return sql.format(
+        proposals=connection.ops.quote_name(ExchangeProposal._meta.db_table),
+        ads=connection.ops.quote_name(Ad._meta.db_table),
+        links=connection.ops.quote_name(AdCategory._meta.db_table),
+        postings=connection.ops.quote_name(MatchPosting._meta.db_table),
+        offer=OFFER, interest=INTEREST)
+
+
+def fetch_wants(connection, cursor, users, targets=(),
+                fanout=CYCLE_FANOUT):
+    targets = list(targets)
+    cursor.execute(format_sql(WANTS_SQL, connection), [
+        PENDING, list(users), CYCLE_INTEREST_DEPTH, targets, targets])
+    wants = defaultdict(dict)
+    for source, target, ad, kind in cursor.fetchall():
+        edges = wants[source]
+        if target not in edges and len(edges) < fanout:
+            edges[target] = ad
+    return wants
+
+
+def fetch_wanted_by(connection, cursor, user):
+    cursor.execute(format_sql(WANTED_BY_SQL, connection), [
+        user, PENDING, CYCLE_INTEREST_DEPTH, PENDING, user])
+    wanted_by = {}
+    for source, ad in cursor.fetchall():
+        wanted_by.setdefault(source, ad)
+    return wanted_by
+
+
+def find_cycles(proposal_id, max_length=CYCLE_MAX_LENGTH,
+                fanout=CYCLE_FANOUT, frontier_size=CYCLE_FRONTIER):
+    connection = get_connection()
+    with connection.cursor() as cursor:
+        cursor.execute(format_sql(PROPOSAL_SQL, connection),
+                       [proposal_id, PENDING])
+        row = cursor.fetchone()
+        if row is None:
+            return []
+        origin = row[0]
+        wanted_by = fetch_wanted_by(connection, cursor, origin)
+        if not wanted_by:
+            return []
+        cycles = []
+        paths = [((origin,), ())]
+        for depth in range(1, max_length):
+            last = depth == max_length - 1
+            frontier = {users[-1] for users, _ in paths}
+            wants = fetch_wants(connection, cursor, frontier,
+                                wanted_by if last else (), fanout)
+            extended = []
+            for users, ads in paths:
+                for target, ad in wants[users[-1]].items():
+                    if target == origin or target in users:
+                        continue
+                    path = users + (target,), ads + (ad,)
+                    if (target in wanted_by
+                            and len(path[0]) >= CYCLE_MIN_LENGTH):
+                        cycles.append((path[0],
+                                       path[1] + (wanted_by[target],)))
+                    if not last:
+                        extended.append(path)
+            paths = []
+            reached = set()
+            for users, ads in extended:
+                if users[-1] in reached or len(reached) < frontier_size:
+                    reached.add(users[-1])
+                    paths.append((users, ads))
+            if not paths:
+                break
+    return cycles
+
+
+def canonical_cycle(users, ads):
+    start = users.index(min(users))
+    users = users[start:] + users[:start]
+    ads = ads[start:] + ads[:start]
+    return users, ads, '{}/{}'.format(':'.join(map(str, users)),
+                                      ':'.join(map(str, ads)))
+
+
+def save_cycles(cycles):
+    candidates = {}
+    for users, ads in cycles:
+        users, ads, key = canonical_cycle(users, ads)
+        candidates[key] = BarterCycle(key=key, users=users, ads=ads)
+    if not candidates:
+        return []
+    existing = set(BarterCycle.objects.filter(
+        key__in=candidates).values_list('key', flat=True))
+    created = [cycle for key, cycle in candidates.items()
+               if key not in existing]
+    return BarterCycle.objects.bulk_create(created, ignore_conflicts=True)
+
+
+class CycleDetector:
+
+    def __init__(self):
+        self._threads = None
+
+    @property
+    def workers(self):
+        return getattr(settings, 'CYCLE_DETECTION_WORKERS', 0)
+
+    def submit(self, proposal_id):
+        if not self.workers:
+            return self.run(proposal_id)
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix='cycle-detector')
+        return self._threads.submit(self.run_in_thread, proposal_id)
+
+    def run_in_thread(self, proposal_id):
+        close_old_connections()
+        try:
+            return self.run(proposal_id)
+        finally:
+            connections.close_all()
+
+    def run(self, proposal_id):
+        try:
+            cycles = save_cycles(find_cycles(proposal_id))
+        except Exception:
+            logger.exception('Failed to detect barter cycles of exchange %s',
+                             proposal_id)
+            return []
+        publish_many([
+            (cycle.users, BARTER_CYCLE,
+             {'key': cycle.key, 'users': cycle.users, 'ads': cycle.ads})
+            for cycle in cycles])
+        return cycles
+
+
+detector = CycleDetector()
@@ -0,0 +1,144 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+EXCHANGE_CREATED = 'exchange.created'
+EXCHANGE_STATUS = 'exchange.status'
+BARTER_CYCLE = 'cycle.found'
+EVENTS_OVERFLOW = 'overflow'
+
+EVENT_BUFFER_SIZE = 100
+EVENT_KEEPALIVE = 15
+EVENT_RETRY = 3000
+
+
+class Subscription:
+
+    def __init__(self, broker, user_id, maxsize):
+        self.broker = broker
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.closed = False
+        self.overflowed = False
+
+    def put(self, event):
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.broker.unsubscribe(self)
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+    async def get(self, timeout=None):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class LocalBroker:
+
+    def __init__(self, buffer_size=None):
+        self.buffer_size = buffer_size or getattr(
+            settings, 'EXCHANGE_EVENTS_BUFFER_SIZE', EVENT_BUFFER_SIZE)
+        self.subscriptions = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        subscription = Subscription(self, user_id, self.buffer_size)
+        with self.lock:
+            self.subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self.subscriptions[subscription.user_id]
+
+    def publish(self, user_ids, event):
+        with self.lock:
+            subscriptions = [
+                subscription for user_id in set(user_ids)
+                for subscription in self.subscriptions.get(user_id, ())]
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(
+                    subscription.put, event)
+            except RuntimeError:
+                self.unsubscribe(subscription)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(getattr(
+                    settings, 'EXCHANGE_EVENTS_BROKER',
+                    'ads.events.LocalBroker'))()
+    return _broker
+
+
+def reset_broker():
+    global _broker
+    with _broker_lock:
+        _broker = None
+
+
+def publish(user_ids, event_type, data):
+    get_broker().publish(user_ids, {'event': event_type, 'data': data})
+
+
+def publish_many(events):
+    broker = get_broker()
+    for user_ids, event_type, data in events:
+        broker.publish(user_ids, {'event': event_type, 'data': data})
+
+
+def publish_on_commit(events, using=None):
+    if events:
+        transaction.on_commit(partial(publish_many, events), using=using)
+
+
+def format_event(event_type, data):
+    return f'event: {event_type}\ndata: {json.dumps(data)}\n\n'
+
+
+async def stream_events(user_id, keepalive=EVENT_KEEPALIVE):
+    subscription = get_broker().subscribe(user_id)
+    try:
+        yield f'retry: {EVENT_RETRY}\n\n'
+        while True:
+            try:
+                event = await subscription.get(keepalive)
+            except TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            if event is None:
+                if subscription.overflowed:
+                    yield format_event(EVENTS_OVERFLOW, {})
+                break
+            yield format_event(event['event'], event['data'])
+    finally:
+        subscription.close()
@@ -0,0 +1,245 @@
+from collections import defaultdict
+from functools import partial
+
+from django.db import connections, router, transaction
+from django.db.models import Count
+from django.dispatch import Signal
+
+from .events import EXCHANGE_STATUS, publish_on_commit
+from .models import CHOICES, Ad, ExchangeCounter, ExchangeProposal
+
+PENDING = 'pending'
+ACCEPTED = 'accepted'
+REJECTED = 'rejected'
+SUPERSEDED = 'superseded'
+
+TRANSITIONS = {
+    PENDING: (ACCEPTED, REJECTED),
+}
+TRANSITION_STATUSES = (ACCEPTED, REJECTED)
+
+UPDATED = 'updated'
+NOT_FOUND = 'not_found'
+NOT_RECEIVER = 'not_receiver'
+CONFLICT = 'conflict'
+
+TRANSITION_SQL = '''
+    UPDATE {proposals} AS proposal SET status = %s
+    FROM {ads} AS receiver_ad, {ads} AS sender_ad
+    WHERE proposal.id = ANY(%s)
+      AND proposal.status = ANY(%s)
+      AND receiver_ad.id = proposal.ad_receiver_id
+      AND receiver_ad.user_id = %s
+      AND sender_ad.id = proposal.ad_sender_id
+    RETURNING proposal.id, NULL, sender_ad.user_id, receiver_ad.user_id
+'''
+
+LOCK_ADS_SQL = '''
+    SELECT ad.id FROM {ads} AS ad
+    JOIN {proposals} AS proposal
+      ON ad.id IN (proposal.ad_sender_id, proposal.ad_receiver_id)
+    WHERE proposal.id = ANY(%s)
+    ORDER BY ad.id
+    FOR UPDATE OF ad
+'''
+
+ACCEPT_SQL = '''
+    WITH accepted AS (
+        UPDATE {proposals} AS proposal SET status = %s
+        FROM {ads} AS receiver_ad, {ads} AS sender_ad
+        WHERE proposal.id = ANY(%s)
+          AND proposal.status = ANY(%s)
+          AND receiver_ad.id = proposal.ad_receiver_id
+          AND receiver_ad.user_id = %s
+          AND sender_ad.id = proposal.ad_sender_id
+        RETURNING proposal.id, proposal.ad_sender_id,
+                  proposal.ad_receiver_id, sender_ad.user_id AS sender_id,
+                  receiver_ad.user_id AS receiver_id
+    ), superseded AS (
+        UPDATE {proposals} AS proposal SET status = %s
+        FROM accepted, {ads} AS sender_ad, {ads} AS receiver_ad
+        WHERE proposal.status = %s
+          AND proposal.id NOT IN (SELECT id FROM accepted)
+          AND (proposal.ad_sender_id IN (accepted.ad_sender_id,
+                                         accepted.ad_receiver_id)
+               OR proposal.ad_receiver_id IN (accepted.ad_sender_id,
+                                              accepted.ad_receiver_id))
+          AND sender_ad.id = proposal.ad_sender_id
+          AND receiver_ad.id = proposal.ad_receiver_id
+        RETURNING proposal.id, accepted.id AS accepted_id,
+                  sender_ad.user_id AS sender_id,
+                  receiver_ad.user_id AS receiver_id
+    )
+    SELECT id, NULL, sender_id, receiver_id FROM accepted
+    UNION ALL
+    SELECT id, accepted_id, sender_id, receiver_id FROM superseded
+'''
+
+exchanges_superseded = Signal()
+exchanges_accepted = Signal()
+
+
+class TransitionError(Exception):
+    pass
+
+
+class InvalidTransition(TransitionError):
+    pass
+
+
+class NotReceiver(TransitionError):
+    pass
+
+
+class TransitionConflict(TransitionError):
+
+    def __init__(self, status):
+        super().__init__(status)
+        self.status = status
+
+
+def source_statuses(status):
+    return [source for source, targets in TRANSITIONS.items()
+            if status in targets]
+
+
+def get_connection():
+    return connections[router.db_for_write(ExchangeProposal)]
+
+
+def format_sql(sql, connection):
+    return sql.format(
+        proposals=connection.ops.quote_name(ExchangeProposal._meta.db_table),
+        ads=connection.ops.quote_name(Ad._meta.db_table))
+
+
+def send_superseded(accepted, ids):
+    exchanges_superseded.send(
+        sender=ExchangeProposal, accepted=accepted, ids=ids)
+
+
+def send_accepted(ids):
+    exchanges_accepted.send(sender=ExchangeProposal, ids=ids)
+
+
+def run_transition(connection, cursor, ids, user, status):
+    sources = source_statuses(status)
+    if status == ACCEPTED:
+        cursor.execute(format_sql(LOCK_ADS_SQL, connection), [ids])
+        cursor.execute(format_sql(ACCEPT_SQL, connection), [
+            status, ids, sources, user.id, SUPERSEDED, PENDING])
+    else:
+        cursor.execute(format_sql(TRANSITION_SQL, connection),
+                       [status, ids, sources, user.id])
+    updated = []
+    superseded = defaultdict(list)
+    events = []
+    for pk, accepted, sender_id, receiver_id in cursor.fetchall():
+        if accepted is None:
+            updated.append(pk)
+            data = {'id': pk, 'status': status}
+        else:
+            superseded[accepted].append(pk)
+            data = {'id': pk, 'status': SUPERSEDED, 'accepted': accepted}
+        events.append(((sender_id, receiver_id), EXCHANGE_STATUS, data))
+    publish_on_commit(events, using=connection.alias)
+    if status == ACCEPTED and updated:
+        transaction.on_commit(partial(send_accepted, sorted(updated)),
+                              using=connection.alias)
+    for accepted, pks in superseded.items():
+        pks.sort()
+        transaction.on_commit(partial(send_superseded, accepted, pks),
+                              using=connection.alias)
+    return updated, superseded
+
+
+def transition_exchange(exchange_id, user, status):
+    if not source_statuses(status):
+        raise InvalidTransition(status)
+    exchange_id = int(exchange_id)
+    connection = get_connection()
+    with transaction.atomic(using=connection.alias), \
+            connection.cursor() as cursor:
+        updated, superseded = run_transition(
+            connection, cursor, [exchange_id], user, status)
+    if updated:
+        return superseded.get(exchange_id, [])
+    current = ExchangeProposal.objects.filter(id=exchange_id).values(
+        'status', 'ad_receiver__user').first()
+    if current is None:
+        raise ExchangeProposal.DoesNotExist
+    if current['ad_receiver__user'] != user.id:
+        raise NotReceiver
+    raise TransitionConflict(current['status'])
+
+
+def transition_exchanges(user, transitions):
+    current = {
+        row['id']: row for row in ExchangeProposal.objects.filter(
+            id__in=[pk for pk, _ in transitions]
+        ).values('id', 'status', 'ad_sender', 'ad_receiver',
+                 'ad_receiver__user')}
+    outcomes = {}
+    groups = defaultdict(list)
+    claimed_ads = set()
+    for pk, status in sorted(transitions,
+                             key=lambda item: item[1] == ACCEPTED):
+        row = current.get(pk)
+        if row is None:
+            outcomes[pk] = (NOT_FOUND, None)
+        elif row['ad_receiver__user'] != user.id:
+            outcomes[pk] = (NOT_RECEIVER, None)
+        elif row['status'] not in source_statuses(status):
+            outcomes[pk] = (CONFLICT, row['status'])
+        elif status == ACCEPTED and claimed_ads & {
+                row['ad_sender'], row['ad_receiver']}:
+            continue
+        else:
+            if status == ACCEPTED:
+                claimed_ads.update((row['ad_sender'], row['ad_receiver']))
+            groups[status].append(pk)
+
+    statuses = {}
+    if groups:
+        connection = get_connection()
+        with transaction.atomic(using=connection.alias), \
+                connection.cursor() as cursor:
+            for status in sorted(groups, key=lambda item: item == ACCEPTED):
+                updated, superseded = run_transition(
+                    connection, cursor, groups[status], user, status)
+                statuses.update((pk, status) for pk in updated)
+                statuses.update((pk, SUPERSEDED)
+                                for pks in superseded.values() for pk in pks)
+
+    missing = [pk for pk, _ in transitions
+               if pk not in outcomes and pk not in statuses]
+    if missing:
+        statuses.update(ExchangeProposal.objects.filter(
+            id__in=missing).values_list('id', 'status'))
+    for pk, status in transitions:
+        if pk not in outcomes:
+            outcomes[pk] = (
+                UPDATED if statuses.get(pk) == status else CONFLICT,
+                statuses.get(pk))
+    return [{'id': pk, 'outcome': outcomes[pk][0], 'status': outcomes[pk][1]}
+            for pk, _ in transitions]
+
+
+def exchange_summary(user):
+    summary = {direction: {status: 0 for status, _ in CHOICES}
+               for direction, _ in ExchangeCounter.DIRECTIONS}
+    for direction, status, count in ExchangeCounter.objects.filter(
+            user=user).values_list('direction', 'status', 'count'):
+        summary[direction][status] = count
+    return summary
+
+
+def count_exchanges():
+    counts = {}
+    for direction, field in ((ExchangeCounter.SENT, 'ad_sender__user'),
+                             (ExchangeCounter.RECEIVED, 'ad_receiver__user')):
+        rows = ExchangeProposal.objects.order_by().values_list(
+            field, 'status').annotate(count=Count('id'))
+        for user, status, count in rows:
+            counts[(user, direction, status)] = count
+    return counts
@@ -0,0 +1,108 @@
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import connections, transaction
+
+from . import references
+from .models import Ad, AdCategory
+
+CATEGORY = 'category'
+CONDITION = 'condition'
+FACETS = {
+    CATEGORY: references.categories,
+    CONDITION: references.conditions,
+}
+FACET_CACHE_TIMEOUT = 300
+FACET_KEY = 'facets:ads:{facet}:{pk}'
+FACET_READY_KEY = 'facets:ads:ready'
+
+FACETS_SQL = '''
+    SELECT GROUPING(link.category_id), link.category_id, ad.condition_id,
+           count(DISTINCT ad.id)
+    FROM {ads} AS ad
+    LEFT JOIN {links} AS link ON link.ad_id = ad.id
+    {where}
+    GROUP BY GROUPING SETS ((link.category_id), (ad.condition_id))
+'''
+
+
+def facet_key(facet, pk):
+    return FACET_KEY.format(facet=facet, pk=pk)
+
+
+def count_facets(queryset=None, using='default'):
+    params = []
+    where = ''
+    if queryset is not None:
+        using = queryset.db
+        compiler = queryset.values('pk').order_by().query.get_compiler(
+            using)
+        try:
+            sql, params = compiler.as_sql()
+        except EmptyResultSet:
+            return {facet: {} for facet in FACETS}
+        where = f'WHERE ad.id IN ({sql})'
+    connection = connections[using]
+    counts = {facet: {} for facet in FACETS}
+    with connection.cursor() as cursor:
+        cursor.execute(FACETS_SQL.format(
+            ads=connection.ops.quote_name(Ad._meta.db_table),
+            links=connection.ops.quote_name(AdCategory._meta.db_table),
+            where=where), params)
+        for grouping, category, condition, count in cursor.fetchall():
+            if grouping == 0 and category is not None:
+                counts[CATEGORY][category] = count
+            elif grouping == 1 and condition is not None:
+                counts[CONDITION][condition] = count
+    return counts
+
+
+def unfiltered_facets(using='default'):
+    keys = {facet_key(facet, pk): (facet, pk)
+            for facet, reference in FACETS.items()
+            for pk in reference.all()}
+    cached = cache.get_many([FACET_READY_KEY, *keys])
+    if FACET_READY_KEY in cached:
+        counts = {facet: {} for facet in FACETS}
+        for key, (facet, pk) in keys.items():
+            counts[facet][pk] = cached.get(key, 0)
+        return counts
+    counts = count_facets(using=using)
+    values = {key: counts[facet].get(pk, 0)
+              for key, (facet, pk) in keys.items()}
+    values[FACET_READY_KEY] = True
+    cache.set_many(values, FACET_CACHE_TIMEOUT)
+    return counts
+
+
+def represent_facets(counts, facets=tuple(FACETS)):
+    data = {}
+    for facet in facets:
+        objects = FACETS[facet].in_bulk(counts[facet])
+        items = [{'id': pk, 'title': objects[pk].title,
+                  'slug': objects[pk].slug, 'count': count}
+                 for pk, count in counts[facet].items()
+                 if count > 0 and pk in objects]
+        items.sort(key=lambda item: (-item['count'], item['slug']))
+        data[facet] = items
+    return data
+
+
+def apply_facet_deltas(deltas):
+    if cache.get(FACET_READY_KEY) is None:
+        return
+    for (facet, pk), delta in deltas.items():
+        if not delta or pk is None:
+            continue
+        key = facet_key(facet, pk)
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            cache.add(key, max(delta, 0), FACET_CACHE_TIMEOUT)
+
+
+def adjust_facets(deltas, using=None):
+    transaction.on_commit(lambda: apply_facet_deltas(deltas), using=using)
+
+
+def invalidate_facets():
+    cache.delete(FACET_READY_KEY)
@@ -0,0 +1,212 @@
+import json
+from functools import partial
+from operator import attrgetter
+from urllib.parse import urljoin
+
+from django.db.models.manager import BaseManager
+from rest_framework import serializers
+from rest_framework.relations import PKOnlyObject
+from rest_framework.utils.serializer_helpers import ReturnDict, ReturnList
+
+from users.serializers import UserDetailSerialzier
+from .serializers import (AdSerializer, BatchManyRelatedField,
+                          BatchPrimaryKeyRelatedField, CategorySerializer,
+                          ConditionSerializer, ExchangeListSerializer)
+
+CONVERTERS = {
+    serializers.ReadOnlyField: None,
+    serializers.IntegerField: int,
+    serializers.CharField: str,
+    serializers.SlugField: str,
+}
+
+
+def render(plan, instance):
+    return {name: getter(instance) for name, getter in plan}
+
+
+def compile_plan(serializer):
+    return [(name, compile_field(field))
+            for name, field in serializer.fields.items()
+            if not field.write_only]
+
+
+def compile_attribute(field):
+    get = attrgetter(field.source)
+    convert = CONVERTERS.get(type(field), field.to_representation)
+
+    def getter(instance):
+        value = get(instance)
+        if value is None or convert is None:
+            return value
+        return convert(value)
+    return getter
+
+
+def compile_nested(field):
+    get = attrgetter(field.source)
+    if isinstance(field, serializers.ListSerializer):
+        plan = compile_plan(field.child)
+        *path, name = field.source_attrs
+        get_owner = attrgetter('.'.join(path)) if path else None
+
+        def getter(instance):
+            owner = get_owner(instance) if get_owner else instance
+            prefetched = getattr(owner, '_prefetched_objects_cache', {})
+            if name in prefetched:
+                items = prefetched[name]
+            else:
+                items = getattr(owner, name)
+                if isinstance(items, BaseManager):
+                    items = items.all()
+            return [render(plan, item) for item in items]
+        return getter
+    plan = compile_plan(field)
+
+    def getter(instance):
+        value = get(instance)
+        return None if value is None else render(plan, value)
+    return getter
+
+
+def compile_reference(field, many):
+    relation = field.child_relation if many else field
+    represent = relation.cache.represent
+    serializer = relation.serializer
+    if many:
+        get = attrgetter(relation.pk_source)
+
+        def getter(instance):
+            values = (represent(pk, serializer) for pk in get(instance))
+            return [value for value in values if value is not None]
+        return getter
+
+    def getter(instance):
+        pk = instance.serializable_value(field.source)
+        return None if pk is None else represent(pk, serializer)
+    return getter
+
+
+def compile_generic(field):
+
+    def getter(instance):
+        attribute = field.get_attribute(instance)
+        if isinstance(attribute, PKOnlyObject):
+            empty = attribute.pk is None
+        else:
+            empty = attribute is None
+        return None if empty else field.to_representation(attribute)
+    return getter
+
+
+def compile_field(field):
+    if isinstance(field, serializers.BaseSerializer):
+        return compile_nested(field)
+    if (isinstance(field, BatchManyRelatedField)
+            and field.child_relation.cache is not None
+            and field.child_relation.serializer is not None
+            and field.child_relation.pk_source is not None):
+        return compile_reference(field, many=True)
+    if (isinstance(field, BatchPrimaryKeyRelatedField)
+            and field.cache is not None and field.serializer is not None):
+        return compile_reference(field, many=False)
+    if isinstance(field, (serializers.RelatedField,
+                          serializers.ManyRelatedField,
+                          serializers.HiddenField)) or field.source == '*':
+        return compile_generic(field)
+    return compile_attribute(field)
+
+
+class CompiledSerializer:
+    serializer_class = None
+
+    def __init__(self, instance=None, many=False, context=None):
+        self.instance = instance
+        self.many = many
+        self.context = context or {}
+
+    def get_plan(self):
+        serializer = self.serializer_class(context=self.context)
+        return [
+            (name, getattr(self, f'compile_{name}', compile_field)(field))
+            for name, field in serializer.fields.items()
+            if not field.write_only]
+
+    def get_renderer(self):
+        return partial(render, self.get_plan())
+
+    @property
+    def data(self):
+        if not hasattr(self, '_data'):
+            renderer = self.get_renderer()
+            if self.many:
+                self._data = ReturnList(
+                    [renderer(instance) for instance in self.instance],
+                    serializer=self)
+            else:
+                self._data = ReturnDict(renderer(self.instance),
+                                        serializer=self)
+        return self._data
+
+
+class CompiledAdSerializer(CompiledSerializer):
+    serializer_class = AdSerializer
+
+    def compile_user(self, field):
+        plan = compile_plan(UserDetailSerialzier(context=self.context))
+        return lambda ad: render(plan, ad.user)
+
+    def compile_condition(self, field):
+        get = compile_field(field)
+        empty = dict(ConditionSerializer(None).data)
+
+        def getter(ad):
+            condition = get(ad)
+            return dict(empty) if condition is None else condition
+        return getter
+
+
+class CompiledExchangeListSerializer(CompiledSerializer):
+    serializer_class = ExchangeListSerializer
+
+
+class AdCardPayloadSerializer(CompiledAdSerializer):
+
+    def compile_category(self, field):
+        plan = compile_plan(CategorySerializer())
+        return lambda ad: [render(plan, link.category)
+                           for link in ad.adcategory_set.all()]
+
+    def compile_condition(self, field):
+        plan = compile_plan(ConditionSerializer())
+        empty = dict(ConditionSerializer(None).data)
+
+        def getter(ad):
+            if ad.condition is None:
+                return dict(empty)
+            return render(plan, ad.condition)
+        return getter
+
+
+class AdCardSerializer(CompiledSerializer):
+
+    def get_renderer(self):
+        variants = self.context.get('image_variants')
+        request = self.context.get('request')
+        base = None if request is None else request.build_absolute_uri('/')
+
+        def absolute(url):
+            return url if base is None or not url else urljoin(base, url)
+
+        def renderer(card):
+            data = json.loads(card.payload)
+            data['image_url'] = absolute(data['image_url'])
+            data['image_variants'] = {
+                variant: absolute(url)
+                for variant, url in data['image_variants'].items()
+                if variants is None or variant in variants}
+            distance = getattr(card, 'distance', None)
+            if distance is not None:
+                data['distance'] = round(distance, 3)
+            return data
+        return renderer
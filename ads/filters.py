@@ -0,0 +1,169 @@
+import re
+from functools import lru_cache
+
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            TrigramWordSimilarity)
+from django.db import connections
+from django.db.models import F, Q
+from django_filters import rest_framework as django_filters
+from rest_framework import filters
+from rest_framework.exceptions import ValidationError
+
+from . import references
+from .geo import distance_expression, search_prefixes
+from .models import Ad, AdCard, AdCategory
+
+CYRILLIC = re.compile('[а-яё]', re.IGNORECASE)
+
+
+@lru_cache(maxsize=None)
+def trigram_available(alias):
+    with connections[alias].cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+class CharInFilter(django_filters.BaseInFilter, django_filters.CharFilter):
+    pass
+
+
+class AdFilterSet(django_filters.FilterSet):
+    category__slug = django_filters.CharFilter(method='filter_category')
+    condition__slug = django_filters.CharFilter(method='filter_condition')
+    category__slug__in = CharInFilter(method='filter_categories')
+    condition__slug__in = CharInFilter(method='filter_conditions')
+
+    class Meta:
+        model = Ad
+        fields = ('category__slug', 'condition__slug',
+                  'category__slug__in', 'condition__slug__in')
+
+    def filter_category(self, queryset, name, value):
+        return queryset.filter(
+            category__in=references.categories.ids_for_slugs([value]))
+
+    def filter_condition(self, queryset, name, value):
+        return queryset.filter(
+            condition__in=references.conditions.ids_for_slugs([value]))
+
+    def filter_categories(self, queryset, name, value):
+        return queryset.filter(id__in=AdCategory.objects.filter(
+            category__in=references.categories.ids_for_slugs(value)
+        ).values('ad'))
+
+    def filter_conditions(self, queryset, name, value):
+        return queryset.filter(
+            condition__in=references.conditions.ids_for_slugs(value))
+
+
+class AdCardFilterSet(AdFilterSet):
+
+    class Meta(AdFilterSet.Meta):
+        model = AdCard
+
+    def filter_category(self, queryset, name, value):
+        return queryset.filter(category_slugs__contains=[value])
+
+    def filter_categories(self, queryset, name, value):
+        return queryset.filter(category_slugs__overlap=value)
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    search_config_param = 'search_lang'
+    search_configs = {'ru': 'russian', 'en': 'english'}
+
+    def get_search_config(self, request, text):
+        lang = request.query_params.get(self.search_config_param)
+        if lang in self.search_configs:
+            return self.search_configs[lang]
+        if CYRILLIC.search(text):
+            return self.search_configs['ru']
+        return self.search_configs['en']
+
+    def filter_queryset(self, request, queryset, view):
+        vector_field = getattr(view, 'search_vector_field', None)
+        terms = self.get_search_terms(request)
+        if not vector_field or not terms:
+            return super().filter_queryset(request, queryset, view)
+
+        text = ' '.join(terms)
+        config = self.get_search_config(request, text)
+        query = SearchQuery(text, config=config)
+        condition = Q(**{vector_field: query})
+        rank = SearchRank(F(vector_field), query)
+        if trigram_available(queryset.db):
+            for field in getattr(view, 'search_trigram_fields', ()):
+                condition |= Q(**{f'{field}__trigram_word_similar': text})
+                rank += TrigramWordSimilarity(text, field)
+
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        return queryset.filter(condition).annotate(
+            search_rank=rank).order_by('-search_rank', *ordering)
+
+
+class GeoDistanceFilter(filters.BaseFilterBackend):
+    near_param = 'near'
+    radius_param = 'radius'
+    default_radius = 50
+    max_radius = 1000
+    invalid_near_message = 'Expected "latitude,longitude".'
+    invalid_radius_message = 'Expected a distance in km up to {max_radius}.'
+
+    def get_origin(self, request):
+        value = request.query_params.get(self.near_param)
+        if not value:
+            user = request.user
+            if (self.radius_param not in request.query_params
+                    or getattr(user, 'latitude', None) is None
+                    or getattr(user, 'longitude', None) is None):
+                return None
+            return user.latitude, user.longitude
+        try:
+            latitude, longitude = (float(part) for part in value.split(','))
+        except ValueError:
+            latitude = longitude = None
+        if (latitude is None or not -90 <= latitude <= 90
+                or not -180 <= longitude <= 180):
+            raise ValidationError({self.near_param: [
+                self.invalid_near_message]})
+        return latitude, longitude
+
+    def get_radius(self, request):
+        value = request.query_params.get(self.radius_param)
+        if not value:
+            return self.default_radius
+        try:
+            radius = float(value)
+        except ValueError:
+            radius = None
+        if radius is None or not 0 < radius <= self.max_radius:
+            raise ValidationError({self.radius_param: [
+                self.invalid_radius_message.format(
+                    max_radius=self.max_radius)]})
+        return radius
+
+    def filter_near(self, queryset, origin, radius, geohash_field=None,
+                    location_fields=('latitude', 'longitude')):
+        latitude_field, longitude_field = location_fields
+        prefixes = search_prefixes(*origin, radius) if geohash_field else ()
+        if prefixes:
+            condition = Q()
+            for prefix in prefixes:
+                condition |= Q(**{f'{geohash_field}__startswith': prefix})
+        else:
+            condition = Q(**{f'{latitude_field}__isnull': False})
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        return queryset.filter(condition).annotate(
+            distance=distance_expression(
+                *origin, latitude_field, longitude_field)
+        ).filter(distance__lte=radius).order_by('distance', *ordering)
+
+    def filter_queryset(self, request, queryset, view):
+        geohash_field = getattr(view, 'geohash_field', None)
+        origin = self.get_origin(request) if geohash_field else None
+        if origin is None:
+            return queryset
+        return self.filter_near(
+            queryset, origin, self.get_radius(request), geohash_field,
+            getattr(view, 'location_fields', ('latitude', 'longitude')))
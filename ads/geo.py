@@ -0,0 +1,83 @@
+import math
+
+from django.db.models import ExpressionWrapper, FloatField, Value
+from django.db.models.functions import (ASin, Cos, Least, Power, Radians,
+                                        Sin, Sqrt)
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9
+GEOHASH_MAX_CELLS = 32
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_low, lat_high = -90.0, 90.0
+    lon_low, lon_high = -180.0, 180.0
+    chars = []
+    value = bits = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            middle = (lon_low + lon_high) / 2
+            if longitude >= middle:
+                value, lon_low = value * 2 + 1, middle
+            else:
+                value, lon_high = value * 2, middle
+        else:
+            middle = (lat_low + lat_high) / 2
+            if latitude >= middle:
+                value, lat_low = value * 2 + 1, middle
+            else:
+                value, lat_high = value * 2, middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            value = bits = 0
+    return ''.join(chars)
+
+
+def geohash_cell(precision):
+    return (180 / 2 ** (5 * precision // 2),
+            360 / 2 ** ((5 * precision + 1) // 2))
+
+
+def search_prefixes(latitude, longitude, radius,
+                    max_cells=GEOHASH_MAX_CELLS):
+    lat_reach = radius / KM_PER_DEGREE
+    if abs(latitude) + lat_reach >= 90:
+        return []
+    lon_reach = lat_reach / math.cos(math.radians(abs(latitude) + lat_reach))
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_size, lon_size = geohash_cell(precision)
+        rows = range(math.floor((latitude - lat_reach + 90) / lat_size),
+                     math.floor((latitude + lat_reach + 90) / lat_size) + 1)
+        columns = range(
+            math.floor((longitude - lon_reach + 180) / lon_size),
+            math.floor((longitude + lon_reach + 180) / lon_size) + 1)
+        if len(rows) * len(columns) <= max_cells:
+            break
+    else:
+        return []
+    column_count = round(360 / lon_size)
+    return sorted({
+        encode_geohash(-90 + (row + 0.5) * lat_size,
+                       -180 + (column % column_count + 0.5) * lon_size,
+                       precision)
+        for row in rows for column in columns})
+
+
+def distance_expression(latitude, longitude, latitude_field='latitude',
+                        longitude_field='longitude'):
+    lat = Radians(latitude_field)
+    lon = Radians(longitude_field)
+    origin_lat = math.radians(latitude)
+    origin_lon = math.radians(longitude)
+    haversine = (
+        Power(Sin((lat - Value(origin_lat)) / 2), 2)
+        + Cos(lat) * Value(math.cos(origin_lat))
+        * Power(Sin((lon - Value(origin_lon)) / 2), 2))
+    return ExpressionWrapper(
+        Value(2 * EARTH_RADIUS_KM) * ASin(Least(Sqrt(haversine), Value(1.0))),
+        output_field=FloatField())
@@ -0,0 +1,190 @@
+import hashlib
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, connections
+from django.db.models import Q
+from django.dispatch import Signal
+from PIL import Image, ImageOps
+
+from .cache import bump_version
+
+logger = logging.getLogger(__name__)
+
+IMAGE_PENDING = 'pending'
+IMAGE_READY = 'ready'
+IMAGE_FAILED = 'failed'
+IMAGE_STATUS_CHOICES = (
+    (IMAGE_PENDING, 'Обрабатывается'),
+    (IMAGE_READY, 'Готово'),
+    (IMAGE_FAILED, 'Ошибка обработки'),
+)
+
+IMAGE_MAX_SIZE = (2048, 2048)
+IMAGE_VARIANTS = {
+    'thumb': (320, 320),
+    'medium': (800, 800),
+    'full': IMAGE_MAX_SIZE,
+}
+VARIANT_DIR = 'ads/variants/'
+
+image_processed = Signal()
+
+IMAGE_SIGNATURES = (
+    b'\xff\xd8\xff',
+    b'\x89PNG\r\n\x1a\n',
+    b'GIF87a',
+    b'GIF89a',
+    b'BM',
+    b'II*\x00',
+    b'MM\x00*',
+)
+
+
+def is_image_signature(header):
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return True
+    return header.startswith(IMAGE_SIGNATURES)
+
+
+def is_image_header(file):
+    position = file.tell()
+    header = file.read(12)
+    file.seek(position)
+    return is_image_signature(header)
+
+
+def process_image(data, max_size=IMAGE_MAX_SIZE, variants=IMAGE_VARIANTS):
+    with Image.open(BytesIO(data)) as image:
+        image.verify()
+    with Image.open(BytesIO(data)) as image:
+        image_format = image.format
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(max_size)
+        if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        processed = BytesIO()
+        image.save(processed, format=image_format)
+
+        has_alpha = 'A' in image.getbands() or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+        rendered = {}
+        for variant, size in variants.items():
+            resized = image.copy()
+            resized.thumbnail(size)
+            webp = BytesIO()
+            resized.save(webp, format='WEBP', quality=80)
+            rendered[variant] = webp.getvalue()
+    return processed.getvalue(), rendered
+
+
+def save_variant(content):
+    digest = hashlib.sha256(content).hexdigest()[:32]
+    name = f'{VARIANT_DIR}{digest}.webp'
+    if default_storage.exists(name):
+        return name, False
+    return default_storage.save(name, ContentFile(content)), True
+
+
+def referenced_variants(names):
+    Ad = apps.get_model('ads', 'Ad')
+    condition = Q()
+    for variant in IMAGE_VARIANTS:
+        condition |= Q(**{f'image_variants__{variant}__in': list(names)})
+    referenced = set()
+    for variants in Ad.objects.filter(condition).values_list(
+            'image_variants', flat=True):
+        referenced.update(variants.values())
+    return referenced
+
+
+def delete_unused_variants(names):
+    names = set(names)
+    unused = names - referenced_variants(names) if names else names
+    for name in unused:
+        default_storage.delete(name)
+    return unused
+
+
+def store_processed_image(ad_id, name, result):
+    Ad = apps.get_model('ads', 'Ad')
+    image_bytes, variants = result
+    image_name = default_storage.save(name, ContentFile(image_bytes))
+    saved = {variant: save_variant(content)
+             for variant, content in variants.items()}
+    updated = Ad.objects.filter(id=ad_id, image_url=name).update(
+        image_url=image_name, image_status=IMAGE_READY,
+        image_variants={variant: variant_name
+                        for variant, (variant_name, _) in saved.items()})
+    if not updated:
+        default_storage.delete(image_name)
+        delete_unused_variants(
+            variant_name for variant_name, created in saved.values()
+            if created)
+        return False
+    default_storage.delete(name)
+    bump_version('ads.ad', ad_id)
+    image_processed.send(sender=Ad, ad_id=ad_id)
+    return True
+
+
+class ImagePipeline:
+
+    def __init__(self):
+        self._processes = None
+        self._threads = None
+
+    @property
+    def workers(self):
+        return getattr(settings, 'IMAGE_PROCESSING_WORKERS', 0)
+
+    def submit(self, ad_id):
+        if not self.workers:
+            return self.run(ad_id)
+        if self._processes is None:
+            self._processes = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'))
+            self._threads = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix='image-pipeline')
+        return self._threads.submit(self.run_in_thread, ad_id)
+
+    def run_in_thread(self, ad_id):
+        close_old_connections()
+        try:
+            return self.run(ad_id)
+        finally:
+            connections.close_all()
+
+    def run(self, ad_id):
+        Ad = apps.get_model('ads', 'Ad')
+        name = Ad.objects.filter(id=ad_id).values_list(
+            'image_url', flat=True).first()
+        if not name:
+            return None
+        try:
+            with default_storage.open(name, 'rb') as file:
+                data = file.read()
+            if self._processes is not None:
+                result = self._processes.submit(process_image, data).result()
+            else:
+                result = process_image(data)
+            store_processed_image(ad_id, name, result)
+        except Exception:
+            logger.exception('Failed to process image of ad %s', ad_id)
+            Ad.objects.filter(id=ad_id, image_url=name).update(
+                image_status=IMAGE_FAILED)
+            bump_version('ads.ad', ad_id)
+            image_processed.send(sender=Ad, ad_id=ad_id)
+            return IMAGE_FAILED
+        return IMAGE_READY
+
+
+pipeline = ImagePipeline()
@@ -0,0 +1,180 @@
+import asyncio
+import importlib
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import (BACKEND_SESSION_KEY, HASH_SESSION_KEY,
+                                 SESSION_KEY, get_user_model)
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.urls import clear_url_caches
+
+from ...cards import refresh_cards
+from ...models import Ad, AdCategory, Category, Condition, ExchangeProposal
+
+User = get_user_model()
+
+BENCH_PREFIX = 'bench-async'
+
+
+class Command(BaseCommand):
+    help = ('Compare read throughput of the ASGI application with async '
+            'read views against the WSGI application with sync views for '
+            'concurrent clients. Both applications are driven in process; '
+            'seeded rows are deleted afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, nargs='+',
+                            default=[1, 10, 50])
+        parser.add_argument('--requests', type=int, default=20,
+                            help='Requests sent by each client.')
+        parser.add_argument('--ads', type=int, default=1000)
+        parser.add_argument('--paths', nargs='+', default=[
+            '/api/v1/ads/?limit=20',
+            '/api/v1/exchanges/received/?limit=20'])
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username__startswith=BENCH_PREFIX).exists():
+            raise CommandError('Benchmark users already exist.')
+        self.host = settings.ALLOWED_HOSTS[0].lstrip('.') or 'localhost'
+        self.async_views = settings.ASYNC_READ_VIEWS
+        self.stdout.write(f'{"path":<40} {"app":>5} {"clients":>8} '
+                          f'{"req/s":>8} {"p50 ms":>8} {"p95 ms":>8}')
+        try:
+            cookie = self.seed(options['ads'])
+            wsgi, asgi = get_wsgi_application(), get_asgi_application()
+            for path in options['paths']:
+                for clients in options['clients']:
+                    for name, run in (('wsgi', self.run_wsgi),
+                                      ('asgi', self.run_asgi)):
+                        self.use_async_views(name == 'asgi')
+                        elapsed, timings = run(
+                            wsgi if name == 'wsgi' else asgi, path, cookie,
+                            clients, options['requests'])
+                        self.report(path, name, clients, elapsed, timings)
+        finally:
+            self.use_async_views(self.async_views)
+            User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+
+    def use_async_views(self, enabled):
+        settings.ASYNC_READ_VIEWS = enabled
+        for module in ('ads.urls', settings.ROOT_URLCONF):
+            importlib.reload(importlib.import_module(module))
+        clear_url_caches()
+
+    def seed(self, size):
+        sender, receiver = User.objects.bulk_create([
+            User(username=f'{BENCH_PREFIX}-sender'),
+            User(username=f'{BENCH_PREFIX}-receiver')])
+        condition, _ = Condition.objects.get_or_create(
+            slug='bench', defaults={'title': 'bench'})
+        category, _ = Category.objects.get_or_create(
+            slug='bench', defaults={'title': 'bench'})
+        ads = Ad.objects.bulk_create(
+            (Ad(user=(sender, receiver)[i % 2], title=f'bench {i}',
+                description='bench', condition=condition)
+             for i in range(size)), batch_size=5000)
+        AdCategory.objects.bulk_create(
+            (AdCategory(ad=ad, category=category) for ad in ads),
+            batch_size=5000)
+        refresh_cards([ad.pk for ad in ads])
+        ExchangeProposal.objects.bulk_create(
+            (ExchangeProposal(ad_sender=s, ad_receiver=r, comment='bench')
+             for s, r in zip(ads[::2], ads[1::2])), batch_size=5000)
+        session = SessionStore()
+        session[SESSION_KEY] = str(receiver.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = receiver.get_session_auth_hash()
+        session.save()
+        return f'{settings.SESSION_COOKIE_NAME}={session.session_key}'
+
+    def run_wsgi(self, application, path, cookie, clients, requests):
+        url = urlsplit(path)
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': url.path,
+            'QUERY_STRING': url.query, 'SERVER_NAME': self.host,
+            'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': self.host, 'HTTP_COOKIE': cookie,
+            'wsgi.url_scheme': 'http', 'wsgi.errors': BytesIO()}
+
+        def start_response(status, headers):
+            if not status.startswith('200'):
+                raise CommandError(f'{path} returned {status}.')
+
+        def client():
+            timings = []
+            try:
+                for _ in range(requests):
+                    start = time.perf_counter()
+                    b''.join(application(
+                        dict(environ, **{'wsgi.input': BytesIO()}),
+                        start_response))
+                    timings.append(time.perf_counter() - start)
+            finally:
+                connections.close_all()
+            return timings
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as executor:
+            results = list(executor.map(
+                lambda _: client(), range(clients)))
+        return time.perf_counter() - start, sum(results, [])
+
+    def run_asgi(self, application, path, cookie, clients, requests):
+        url = urlsplit(path)
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'},
+            'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': url.path, 'raw_path': url.path.encode(),
+            'query_string': url.query.encode(), 'root_path': '',
+            'server': (self.host, 80), 'client': ('127.0.0.1', 0),
+            'headers': [(b'host', self.host.encode()),
+                        (b'cookie', cookie.encode())]}
+
+        async def request():
+            received = asyncio.Event()
+            messages = []
+
+            async def receive():
+                if not received.is_set():
+                    received.set()
+                    return {'type': 'http.request', 'body': b''}
+                await asyncio.Future()
+
+            async def send(message):
+                messages.append(message)
+
+            await application(dict(scope), receive, send)
+            status = messages[0]['status']
+            if status != 200:
+                raise CommandError(f'{path} returned {status}.')
+
+        async def client():
+            timings = []
+            for _ in range(requests):
+                start = time.perf_counter()
+                await request()
+                timings.append(time.perf_counter() - start)
+            return timings
+
+        async def main():
+            return await asyncio.gather(*(client() for _ in range(clients)))
+
+        start = time.perf_counter()
+        results = asyncio.run(main())
+        return time.perf_counter() - start, sum(results, [])
+
+    def report(self, path, name, clients, elapsed, timings):
+        quantiles = statistics.quantiles(timings, n=20)
+        self.stdout.write(
+            f'{path:<40} {name:>5} {clients:>8} '
+            f'{len(timings) / elapsed:>8.1f} '
+            f'{statistics.median(timings) * 1000:>8.1f} '
+            f'{quantiles[18] * 1000:>8.1f}')
@@ -0,0 +1,134 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from ...cycles import find_cycles, format_sql
+from ...images import IMAGE_READY
+from ...models import Category, ExchangeProposal
+
+User = get_user_model()
+
+SEED_USERS_SQL = '''
+    INSERT INTO {users} (password, is_superuser, username, first_name,
+                         last_name, email, is_staff, is_active, date_joined)
+    SELECT '', false, 'bench-cycles-' || i, '', '', '', false, true, now()
+    FROM generate_series(1, %s) AS i
+    RETURNING id
+'''
+
+SEED_ADS_SQL = '''
+    INSERT INTO {ads} (user_id, title, description, image_status,
+                       image_variants, created_at)
+    SELECT user_id, 'bench', 'bench', %s, '{{}}', now()
+    FROM unnest(%s::bigint[]) AS user_id, generate_series(1, %s)
+    RETURNING id
+'''
+
+SEED_LINKS_SQL = '''
+    INSERT INTO {links} (ad_id, category_id)
+    SELECT ad_id, (%s::bigint[])[1 + floor(
+        random() * cardinality(%s::bigint[]))::int]
+    FROM unnest(%s::bigint[]) AS ad_id
+'''
+
+SEED_PROPOSALS_SQL = '''
+    INSERT INTO {proposals} (ad_sender_id, ad_receiver_id, comment, status,
+                             created_at)
+    SELECT sender.id, receiver.id, 'bench', %s, now()
+    FROM (
+        SELECT (%s::bigint[])[1 + floor(
+                   random() * cardinality(%s::bigint[]))::int] AS sender,
+               (%s::bigint[])[1 + floor(
+                   random() * cardinality(%s::bigint[]))::int] AS receiver
+        FROM generate_series(1, %s)
+    ) AS pair
+    JOIN {ads} AS sender ON sender.id = pair.sender
+    JOIN {ads} AS receiver ON receiver.id = pair.receiver
+    WHERE sender.user_id <> receiver.user_id
+    ON CONFLICT DO NOTHING
+'''
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Measure incremental barter cycle detection on synthetic wants '
+            'graphs. Data is seeded inside a transaction and rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--edges', type=int, nargs='+',
+                            default=[100000, 1000000])
+        parser.add_argument('--degree', type=int, default=5)
+        parser.add_argument('--ads-per-user', type=int, default=2)
+        parser.add_argument('--categories', type=int, default=1000)
+        parser.add_argument('--samples', type=int, default=50)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{"edges":>8} {"users":>8} {"queries":>8} '
+                          f'{"cycles":>8} {"median ms":>10} {"p95 ms":>10}')
+        for edges in options['edges']:
+            try:
+                with transaction.atomic():
+                    users = max(edges // options['degree'], 2)
+                    ads = self.seed(edges, users, options)
+                    queries, cycles, timings = self.measure(
+                        ads, options['samples'])
+                    timings.sort()
+                    p95 = timings[min(len(timings) - 1,
+                                      int(len(timings) * 0.95))]
+                    self.stdout.write(
+                        f'{edges:>8} {users:>8} {queries:>8} '
+                        f'{cycles:>8.1f} '
+                        f'{statistics.median(timings):>10.1f} {p95:>10.1f}')
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def seed(self, edges, users, options):
+        categories = [category.pk for category in
+                      Category.objects.bulk_create(
+                          Category(slug=f'bench-cycles-{i}',
+                                   title=f'bench {i}')
+                          for i in range(options['categories']))]
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT setseed(0.5)')
+            cursor.execute(self.format(SEED_USERS_SQL), [users])
+            user_ids = [row[0] for row in cursor.fetchall()]
+            cursor.execute(self.format(SEED_ADS_SQL), [
+                IMAGE_READY, user_ids, options['ads_per_user']])
+            ads = [row[0] for row in cursor.fetchall()]
+            cursor.execute(self.format(SEED_LINKS_SQL),
+                           [categories, categories, ads])
+            cursor.execute(self.format(SEED_PROPOSALS_SQL), [
+                'pending', ads, ads, ads, ads, edges])
+            cursor.execute('ANALYZE')
+        return ads
+
+    def format(self, sql):
+        return format_sql(sql.replace(
+            '{users}', connection.ops.quote_name(User._meta.db_table)),
+            connection)
+
+    def measure(self, ads, samples):
+        rng = random.Random(0)
+        timings = []
+        cycles = 0
+        queries = 0
+        for _ in range(samples):
+            sender, receiver = rng.sample(ads, 2)
+            proposal, created = ExchangeProposal.objects.get_or_create(
+                ad_sender_id=sender, ad_receiver_id=receiver,
+                defaults={'comment': 'bench'})
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                cycles += len(find_cycles(proposal.pk))
+                timings.append((time.perf_counter() - start) * 1000)
+            queries = max(queries, len(context.captured_queries))
+        return queries, cycles / samples, timings
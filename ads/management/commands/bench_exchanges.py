@@ -0,0 +1,96 @@
+import math
+import statistics
+import time
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from ...async_views import render_response
+from ...models import Ad, AdCategory, Category, Condition, ExchangeProposal
+from ...views import ExchangeListViewSet
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Measure /exchanges/received/ latency for growing numbers of '
+            'proposals. Data is seeded inside a transaction and rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+',
+                            default=[10, 1000, 10000])
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--limit', type=int, default=50)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{"proposals":>10} {"mode":>10} {"queries":>8} '
+                          f'{"median ms":>10} {"max ms":>10}')
+        for size in options['sizes']:
+            try:
+                with transaction.atomic():
+                    receiver = self.seed(size)
+                    for mode, params in (
+                            ('full', {}),
+                            ('page', {'limit': options['limit']})):
+                        queries, timings = self.measure(
+                            receiver, params, options['repeat'])
+                        self.stdout.write(
+                            f'{size:>10} {mode:>10} {queries:>8} '
+                            f'{statistics.median(timings):>10.1f} '
+                            f'{max(timings):>10.1f}')
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def seed(self, size):
+        sender, receiver = User.objects.bulk_create([
+            User(username=f'bench-sender-{size}'),
+            User(username=f'bench-receiver-{size}')])
+        condition, _ = Condition.objects.get_or_create(
+            slug='bench', defaults={'title': 'bench'})
+        categories = [
+            Category.objects.get_or_create(
+                slug=f'bench-{i}', defaults={'title': f'bench {i}'})[0]
+            for i in range(3)]
+        receiver_count = math.ceil(math.sqrt(size))
+        sender_count = math.ceil(size / receiver_count)
+        ads = Ad.objects.bulk_create(
+            [Ad(user=receiver, title=f'receiver {i}', description='bench',
+                condition=condition) for i in range(receiver_count)]
+            + [Ad(user=sender, title=f'sender {i}', description='bench',
+                  condition=condition) for i in range(sender_count)])
+        AdCategory.objects.bulk_create(
+            AdCategory(ad=ad, category=categories[i % len(categories)])
+            for i, ad in enumerate(ads))
+        receiver_ads, sender_ads = ads[:receiver_count], ads[receiver_count:]
+        pairs = [(s, r) for s in sender_ads for r in receiver_ads][:size]
+        ExchangeProposal.objects.bulk_create(
+            (ExchangeProposal(ad_sender=s, ad_receiver=r, comment='bench')
+             for s, r in pairs), batch_size=5000)
+        return receiver
+
+    def measure(self, user, params, repeat):
+        host = settings.ALLOWED_HOSTS[0].lstrip('.')
+        view = ExchangeListViewSet.as_view({'get': 'received_exchange'})
+        if iscoroutinefunction(view):
+            view = async_to_sync(view)
+        factory = APIRequestFactory()
+        timings = []
+        for _ in range(repeat):
+            request = factory.get('/api/v1/exchanges/received/', params,
+                                  HTTP_HOST=host)
+            force_authenticate(request, user=user)
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                render_response(view(request))
+                timings.append((time.perf_counter() - start) * 1000)
+        return len(context.captured_queries), timings
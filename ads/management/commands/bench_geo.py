@@ -0,0 +1,175 @@
+import random
+import statistics
+import time
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from ...async_views import render_response
+from ...filters import GeoDistanceFilter
+from ...geo import encode_geohash
+from ...images import IMAGE_READY
+from ...matching import format_sql
+from ...models import AdCard
+from ...views import AdViewSet
+
+User = get_user_model()
+
+CITIES = (
+    (55.7558, 37.6173), (59.9343, 30.3351), (55.7963, 49.1088),
+    (56.8389, 60.6057), (54.9885, 73.3242), (53.1959, 50.1002),
+    (47.2357, 39.7015), (56.3269, 44.0059), (51.6608, 39.2003),
+    (45.0355, 38.9753),
+)
+
+SEED_ADS_SQL = '''
+    INSERT INTO {ads} (user_id, title, description, image_status,
+                       image_variants, latitude, longitude, created_at)
+    SELECT (%s::bigint[])[1 + i %% cardinality(%s::bigint[])],
+           'bench ' || i, 'bench', %s, '{{}}', point.latitude,
+           point.longitude, now() - i * interval '1 second'
+    FROM unnest(%s::float8[], %s::float8[])
+         WITH ORDINALITY AS point (latitude, longitude, i)
+    RETURNING id
+'''
+
+SEED_CARDS_SQL = '''
+    INSERT INTO {cards} (ad_id, title, description, category_slugs,
+                         latitude, longitude, geohash, created_at, payload)
+    SELECT ad.id, ad.title, ad.description,
+           ARRAY[(%s::text[])[1 + ad.id %% cardinality(%s::text[])]],
+           ad.latitude, ad.longitude, card.geohash, ad.created_at,
+           json_build_object(
+               'id', ad.id, 'user', json_build_object('username', 'bench'),
+               'title', ad.title, 'description', ad.description,
+               'image_url', NULL, 'image_status', ad.image_status,
+               'image_variants', '{{}}'::json, 'category', '[]'::json,
+               'condition', json_build_object('title', '', 'slug', ''),
+               'latitude', ad.latitude, 'longitude', ad.longitude,
+               'created_at', ad.created_at)::text
+    FROM unnest(%s::bigint[], %s::text[]) AS card (ad_id, geohash)
+    JOIN {ads} AS ad ON ad.id = card.ad_id
+'''
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Measure radius queries over synthetic ad locations with and '
+            'without the geohash prefix index. Data is seeded inside a '
+            'transaction and rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ads', type=int, default=1000000)
+        parser.add_argument('--users', type=int, default=5000)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--queries', type=int, default=30)
+        parser.add_argument('--radii', type=float, nargs='+',
+                            default=[5, 25, 100])
+        parser.add_argument('--limit', type=int, default=20)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{"ads":>8} {"radius":>7} {"mode":>16} '
+                          f'{"matched":>9} {"median ms":>10} {"p95 ms":>10}')
+        try:
+            with transaction.atomic():
+                origins = self.seed(options)
+                for radius in options['radii']:
+                    for mode in ('scan', 'geohash', 'endpoint',
+                                 'endpoint+filter'):
+                        self.report(options['ads'], radius, mode,
+                                    *self.measure(mode, origins, radius,
+                                                  options['limit']))
+                raise Rollback
+        except Rollback:
+            pass
+
+    def locations(self, count):
+        rng = random.Random(0)
+        points = []
+        for _ in range(count):
+            if rng.random() < 0.8:
+                latitude, longitude = rng.choice(CITIES)
+                points.append((rng.gauss(latitude, 0.3),
+                               rng.gauss(longitude, 0.5)))
+            else:
+                points.append((rng.uniform(42, 62), rng.uniform(20, 90)))
+        return points
+
+    def seed(self, options):
+        users = User.objects.bulk_create(
+            (User(username=f'bench-geo-{i}')
+             for i in range(options['users'])), batch_size=5000)
+        user_ids = [user.pk for user in users]
+        slugs = [f'bench-geo-{i}' for i in range(options['categories'])]
+        self.slug = slugs[0]
+        points = self.locations(options['ads'])
+        latitudes = [latitude for latitude, _ in points]
+        longitudes = [longitude for _, longitude in points]
+        with connection.cursor() as cursor:
+            cursor.execute(self.format(SEED_ADS_SQL), [
+                user_ids, user_ids, IMAGE_READY, latitudes, longitudes])
+            ads = [row[0] for row in cursor.fetchall()]
+            geohashes = [encode_geohash(*point) for point in points]
+            cursor.execute(self.format(SEED_CARDS_SQL),
+                           [slugs, slugs, ads, geohashes])
+            cursor.execute('ANALYZE')
+        return random.Random(1).sample(points, options['queries'])
+
+    def format(self, sql):
+        return format_sql(sql.replace(
+            '{cards}', connection.ops.quote_name(AdCard._meta.db_table)),
+            connection)
+
+    def measure(self, mode, origins, radius, limit):
+        if mode.startswith('endpoint'):
+            return self.measure_endpoint(
+                origins, radius, limit, mode == 'endpoint+filter')
+        geo = GeoDistanceFilter()
+        geohash_field = 'geohash' if mode == 'geohash' else None
+        timings = []
+        matched = 0
+        for origin in origins:
+            queryset = geo.filter_near(AdCard.objects.all(), origin, radius,
+                                       geohash_field)
+            start = time.perf_counter()
+            matched += queryset.count()
+            list(queryset[:limit])
+            timings.append((time.perf_counter() - start) * 1000)
+        return matched / len(origins), timings
+
+    def measure_endpoint(self, origins, radius, limit, filtered):
+        host = settings.ALLOWED_HOSTS[0].lstrip('.')
+        view = AdViewSet.as_view({'get': 'list'})
+        if iscoroutinefunction(view):
+            view = async_to_sync(view)
+        factory = APIRequestFactory()
+        query = {'radius': radius, 'limit': limit}
+        if filtered:
+            query['category__slug'] = self.slug
+        timings = []
+        matched = 0
+        for latitude, longitude in origins:
+            request = factory.get('/api/v1/ads/', dict(
+                query, near=f'{latitude},{longitude}'), HTTP_HOST=host)
+            force_authenticate(request, AnonymousUser())
+            start = time.perf_counter()
+            response = render_response(view(request))
+            timings.append((time.perf_counter() - start) * 1000)
+            matched += response.data['count']
+        return matched / len(origins), timings
+
+    def report(self, ads, radius, mode, matched, timings):
+        timings = sorted(timings)
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(f'{ads:>8} {radius:>7g} {mode:>16} '
+                          f'{matched:>9.0f} '
+                          f'{statistics.median(timings):>10.1f} '
+                          f'{p95:>10.1f}')
@@ -0,0 +1,127 @@
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+
+from ...images import IMAGE_READY
+from ...matching import MATCH_DEPTH, find_matches, format_sql
+from ...models import Ad, Category, Condition
+from ...views import AdViewSet
+
+User = get_user_model()
+
+SEED_ADS_SQL = '''
+    INSERT INTO {ads} (user_id, title, description, image_status,
+                       image_variants, condition_id, created_at)
+    SELECT (%s::bigint[])[1 + i %% cardinality(%s::bigint[])],
+           'bench ' || i, 'bench', %s, '{{}}',
+           (%s::bigint[])[1 + i %% cardinality(%s::bigint[])],
+           now() - i * interval '1 second'
+    FROM generate_series(1, %s) AS i
+    RETURNING id
+'''
+
+SEED_LINKS_SQL = '''
+    INSERT INTO {links} (ad_id, category_id)
+    SELECT ad.id, (%s::bigint[])[1 + (
+        (ad.id * 7919 + n * 104729) %% cardinality(%s::bigint[]))]
+    FROM {ads} AS ad
+    CROSS JOIN generate_series(0, 2) AS n
+    WHERE ad.id >= %s AND n <= ad.id %% 3
+'''
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Measure matchmaking latency on a synthetic catalogue. Data is '
+            'seeded inside a transaction and rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ads', type=int, default=100000)
+        parser.add_argument('--users', type=int, default=5000)
+        parser.add_argument('--categories', type=int, default=200)
+        parser.add_argument('--queries', type=int, default=50)
+        parser.add_argument('--depths', type=int, nargs='+',
+                            default=[100, MATCH_DEPTH, 2000])
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{"ads":>8} {"mode":>14} {"queries":>8} '
+                          f'{"median ms":>10} {"p95 ms":>10}')
+        try:
+            with transaction.atomic():
+                ads = self.seed(options)
+                sample = random.Random(0).sample(
+                    ads, min(options['queries'], len(ads)))
+                for depth in options['depths']:
+                    self.report(options['ads'], f'engine d={depth}',
+                                *self.measure_engine(sample, depth))
+                self.report(options['ads'], 'endpoint',
+                            *self.measure_endpoint(sample))
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, options):
+        users = User.objects.bulk_create(
+            (User(username=f'bench-matches-{i}')
+             for i in range(options['users'])), batch_size=5000)
+        conditions = [
+            Condition.objects.get_or_create(
+                slug=f'bench-{i}', defaults={'title': f'bench {i}'})[0]
+            for i in range(4)]
+        categories = Category.objects.bulk_create(
+            Category(slug=f'bench-matches-{i}', title=f'bench {i}')
+            for i in range(options['categories']))
+        user_ids = [user.pk for user in users]
+        condition_ids = [condition.pk for condition in conditions]
+        category_ids = [category.pk for category in categories]
+        with connection.cursor() as cursor:
+            cursor.execute(format_sql(SEED_ADS_SQL, connection), [
+                user_ids, user_ids, IMAGE_READY, condition_ids,
+                condition_ids, options['ads']])
+            ads = [row[0] for row in cursor.fetchall()]
+            cursor.execute(format_sql(SEED_LINKS_SQL, connection),
+                           [category_ids, category_ids, min(ads)])
+            cursor.execute('ANALYZE')
+        return ads
+
+    def measure_engine(self, sample, depth):
+        ads = Ad.objects.only('id', 'user_id', 'condition_id').in_bulk(
+            sample)
+        timings = []
+        for pk in sample:
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                find_matches(ads[pk], depth=depth)
+                timings.append((time.perf_counter() - start) * 1000)
+        return len(context.captured_queries), timings
+
+    def measure_endpoint(self, sample):
+        host = settings.ALLOWED_HOSTS[0].lstrip('.')
+        view = AdViewSet.as_view({'get': 'matches'})
+        factory = APIRequestFactory()
+        timings = []
+        for pk in sample:
+            request = factory.get(f'/api/v1/ads/{pk}/matches/',
+                                  HTTP_HOST=host)
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                view(request, pk=pk)
+                timings.append((time.perf_counter() - start) * 1000)
+        return len(context.captured_queries), timings
+
+    def report(self, ads, mode, queries, timings):
+        timings = sorted(timings)
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(f'{ads:>8} {mode:>14} {queries:>8} '
+                          f'{statistics.median(timings):>10.1f} '
+                          f'{p95:>10.1f}')
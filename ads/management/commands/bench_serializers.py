@@ -0,0 +1,100 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from ...fast_serializers import (CompiledAdSerializer,
+                                 CompiledExchangeListSerializer)
+from ...models import Ad, AdCategory, Category, Condition, ExchangeProposal
+from ...references import load_references
+from ...serializers import AdSerializer, ExchangeListSerializer
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Measure per-row serialization cost of the DRF and compiled '
+            'read serializers. Data is seeded inside a transaction and '
+            'rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        self.stdout.write(f'{"serializer":>10} {"rows":>8} {"drf us":>10} '
+                          f'{"compiled us":>12} {"speedup":>8}')
+        try:
+            with transaction.atomic():
+                self.seed(rows)
+                load_references()
+                request = APIRequestFactory().get('/api/v1/ads/')
+                context = {'request': request,
+                           'image_variants': ('thumb', 'medium')}
+                ads = list(Ad.objects.with_relations().filter(
+                    title__startswith='bench'))
+                exchanges = list(ExchangeProposal.objects.with_ads().filter(
+                    comment='bench'))
+                for name, instances, serializer, compiled, kwargs in (
+                        ('ad', ads, AdSerializer, CompiledAdSerializer,
+                         {'context': context}),
+                        ('exchange', exchanges, ExchangeListSerializer,
+                         CompiledExchangeListSerializer, {})):
+                    self.compare(name, instances, serializer, compiled,
+                                 kwargs, repeat)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, rows):
+        sender, receiver = User.objects.bulk_create([
+            User(username='bench-serializers-sender'),
+            User(username='bench-serializers-receiver')])
+        condition, _ = Condition.objects.get_or_create(
+            slug='bench', defaults={'title': 'bench'})
+        categories = [
+            Category.objects.get_or_create(
+                slug=f'bench-{i}', defaults={'title': f'bench {i}'})[0]
+            for i in range(3)]
+        ads = Ad.objects.bulk_create(
+            (Ad(user=(sender, receiver)[i % 2], title=f'bench {i}',
+                description='bench', condition=condition,
+                image_url=f'ads/bench-{i}.jpg', image_status='ready',
+                image_variants={'thumb': f'ads/variants/{i}-t.webp',
+                                'medium': f'ads/variants/{i}-m.webp'})
+             for i in range(rows * 2)), batch_size=5000)
+        AdCategory.objects.bulk_create(
+            (AdCategory(ad=ad, category=category)
+             for i, ad in enumerate(ads)
+             for category in categories[:i % 3 + 1]),
+            batch_size=5000)
+        ExchangeProposal.objects.bulk_create(
+            (ExchangeProposal(ad_sender=s, ad_receiver=r, comment='bench')
+             for s, r in zip(ads[::2], ads[1::2])), batch_size=5000)
+
+    def measure(self, serializer, instances, kwargs, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            data = serializer(instances, many=True, **kwargs).data
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings) / len(instances) * 10 ** 6, data
+
+    def compare(self, name, instances, serializer, compiled, kwargs,
+                repeat):
+        drf, expected = self.measure(serializer, instances, kwargs, repeat)
+        fast, data = self.measure(compiled, instances, kwargs, repeat)
+        renderer = JSONRenderer()
+        if renderer.render(data) != renderer.render(expected):
+            raise CommandError(f'Compiled {name} output differs.')
+        self.stdout.write(f'{name:>10} {len(instances):>8} {drf:>10.1f} '
+                          f'{fast:>12.1f} {drf / fast:>7.1f}x')
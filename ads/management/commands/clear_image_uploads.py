@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ...models import ImageUpload
+
+
+class Command(BaseCommand):
+    help = 'Delete image uploads that were never attached to an ad.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24,
+                            help='Minimum age of the uploads to delete.')
+
+    def handle(self, *args, **options):
+        expired = ImageUpload.objects.filter(
+            created_at__lt=timezone.now() - timedelta(hours=options['hours']))
+        count = 0
+        for upload in expired.iterator():
+            upload.file.delete(save=False)
+            upload.delete()
+            count += 1
+        self.stdout.write(f'{count} uploads deleted.')
@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ...images import VARIANT_DIR, delete_unused_variants
+
+
+class Command(BaseCommand):
+    help = ('Delete image variants that no ad refers to any more, e.g. '
+            'after an ad image was replaced or the ad was deleted.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24,
+                            help='Minimum age of the variants to delete.')
+
+    def handle(self, *args, **options):
+        if not default_storage.exists(VARIANT_DIR):
+            self.stdout.write('0 variants deleted.')
+            return
+        expired_before = timezone.now() - timedelta(hours=options['hours'])
+        names = [
+            f'{VARIANT_DIR}{file}'
+            for file in default_storage.listdir(VARIANT_DIR)[1]
+            if default_storage.get_modified_time(
+                f'{VARIANT_DIR}{file}') < expired_before]
+        deleted = delete_unused_variants(names)
+        self.stdout.write(f'{len(deleted)} variants deleted.')
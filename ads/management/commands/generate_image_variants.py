@@ -0,0 +1,27 @@
+from concurrent.futures import Future
+
+from django.core.management.base import BaseCommand
+
+from ...images import IMAGE_FAILED, IMAGE_PENDING, IMAGE_READY, pipeline
+from ...models import Ad
+
+
+class Command(BaseCommand):
+    help = 'Render image variants for ads that do not have them yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Re-render variants of every ad image.')
+
+    def handle(self, *args, **options):
+        ads = Ad.objects.exclude(image_url='').exclude(image_url=None)
+        if not options['all']:
+            ads = ads.filter(image_variants={})
+        ids = list(ads.values_list('id', flat=True))
+        Ad.objects.filter(id__in=ids).update(image_status=IMAGE_PENDING)
+        statuses = [
+            result.result() if isinstance(result, Future) else result
+            for result in [pipeline.submit(ad_id) for ad_id in ids]]
+        self.stdout.write(
+            f'{statuses.count(IMAGE_READY)} images processed, '
+            f'{statuses.count(IMAGE_FAILED)} failed.')
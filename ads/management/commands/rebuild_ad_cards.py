@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from ...cards import refresh_cards, stale_cards
+
+
+class Command(BaseCommand):
+    help = ('Compare the ad cards read model with the ads and re-render '
+            'the cards that drifted.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only report drift, keep the cards.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            stale = stale_cards()
+            if options['check']:
+                if stale:
+                    raise CommandError(f'{len(stale)} cards drifted.')
+                self.stdout.write('Ad cards are consistent.')
+                return
+            refresh_cards(stale)
+        self.stdout.write(f'{len(stale)} cards rebuilt.')
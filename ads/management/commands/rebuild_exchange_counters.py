@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from ...exchanges import count_exchanges
+from ...models import ExchangeCounter, ExchangeProposal
+
+
+class Command(BaseCommand):
+    help = ('Compare per-user exchange counters with the proposals table '
+            'and rebuild them from scratch.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only report drift, keep the counters.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if not options['check']:
+                with connection.cursor() as cursor:
+                    cursor.execute('LOCK TABLE {} IN SHARE MODE'.format(
+                        connection.ops.quote_name(
+                            ExchangeProposal._meta.db_table)))
+            expected = count_exchanges()
+            actual = {
+                (user, direction, status): count
+                for user, direction, status, count in
+                ExchangeCounter.objects.exclude(count=0).values_list(
+                    'user', 'direction', 'status', 'count')}
+            drift = sorted(key for key in expected.keys() | actual.keys()
+                           if expected.get(key, 0) != actual.get(key, 0))
+            for user, direction, status in drift:
+                self.stdout.write(
+                    f'user {user} {direction} {status}: counter '
+                    f'{actual.get((user, direction, status), 0)}, actual '
+                    f'{expected.get((user, direction, status), 0)}')
+            if options['check']:
+                if drift:
+                    raise CommandError(f'{len(drift)} counters drifted.')
+                self.stdout.write('Counters are consistent.')
+                return
+            ExchangeCounter.objects.all().delete()
+            ExchangeCounter.objects.bulk_create(
+                (ExchangeCounter(user_id=user, direction=direction,
+                                 status=status, count=count)
+                 for (user, direction, status), count in expected.items()),
+                batch_size=5000)
+        self.stdout.write(f'{len(expected)} counters rebuilt, '
+                          f'{len(drift)} drifted.')
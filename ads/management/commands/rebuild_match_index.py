@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from ...matching import format_sql
+
+EXPECTED_POSTINGS_SQL = '''
+    SELECT link.category_id, ad.id, ad.user_id, ad.condition_id,
+           1 / sqrt(count(*) OVER (PARTITION BY ad.id))
+    FROM (SELECT DISTINCT ad_id, category_id FROM {links}) AS link
+    JOIN {ads} AS ad ON ad.id = link.ad_id
+'''
+
+ACTUAL_POSTINGS_SQL = '''
+    SELECT category_id, ad_id, user_id, condition_id, weight
+    FROM {postings}
+'''
+
+DRIFT_SQL = f'''
+    SELECT count(*) FROM (
+        ({EXPECTED_POSTINGS_SQL} EXCEPT ALL {ACTUAL_POSTINGS_SQL})
+        UNION ALL
+        ({ACTUAL_POSTINGS_SQL} EXCEPT ALL {EXPECTED_POSTINGS_SQL})
+    ) AS drift
+'''
+
+
+class Command(BaseCommand):
+    help = ('Compare the matchmaking postings with ad categories and '
+            'rebuild them from scratch.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only report drift, keep the postings.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic(), connection.cursor() as cursor:
+            if not options['check']:
+                cursor.execute(format_sql(
+                    'LOCK TABLE {ads}, {links} IN SHARE MODE', connection))
+            cursor.execute(format_sql(DRIFT_SQL, connection))
+            drift = cursor.fetchone()[0]
+            if options['check']:
+                if drift:
+                    raise CommandError(f'{drift} postings drifted.')
+                self.stdout.write('Match index is consistent.')
+                return
+            cursor.execute(format_sql('DELETE FROM {postings}', connection))
+            cursor.execute(format_sql(
+                'INSERT INTO {postings} (category_id, ad_id, user_id, '
+                'condition_id, weight) ' + EXPECTED_POSTINGS_SQL,
+                connection))
+            rebuilt = cursor.rowcount
+        self.stdout.write(f'{rebuilt} postings rebuilt, {drift} drifted.')
@@ -0,0 +1,108 @@
+import heapq
+from collections import defaultdict
+
+from django.db import connections, router
+
+from .exchanges import ACCEPTED, REJECTED
+from .models import (Ad, AdCategory, ExchangeCounter, ExchangeProposal,
+                     MatchPosting)
+
+MATCH_LIMIT = 20
+MATCH_DEPTH = 500
+CATEGORY_WEIGHT = 1.0
+CONDITION_WEIGHT = 0.25
+OWNER_WEIGHT = 0.25
+PAIR_WEIGHT = 0.5
+
+CANDIDATES_SQL = '''
+    SELECT posting.ad_id, posting.user_id, posting.condition_id,
+           sum(query.weight * posting.weight)
+    FROM {postings} AS query
+    CROSS JOIN LATERAL (
+        SELECT candidate.ad_id, candidate.user_id, candidate.condition_id,
+               candidate.weight
+        FROM {postings} AS candidate
+        WHERE candidate.category_id = query.category_id
+          AND candidate.user_id <> %s
+        ORDER BY candidate.ad_id DESC
+        LIMIT %s
+    ) AS posting
+    WHERE query.ad_id = %s
+    GROUP BY posting.ad_id, posting.user_id, posting.condition_id
+'''
+
+PAIR_HISTORY_SQL = '''
+    SELECT other.user_id, proposal.status, count(*)
+    FROM {ads} AS own
+    JOIN {proposals} AS proposal ON proposal.ad_sender_id = own.id
+    JOIN {ads} AS other ON other.id = proposal.ad_receiver_id
+    WHERE own.user_id = %s AND other.user_id = ANY(%s)
+      AND proposal.status = ANY(%s)
+    GROUP BY 1, 2
+    UNION ALL
+    SELECT other.user_id, proposal.status, count(*)
+    FROM {ads} AS own
+    JOIN {proposals} AS proposal ON proposal.ad_receiver_id = own.id
+    JOIN {ads} AS other ON other.id = proposal.ad_sender_id
+    WHERE own.user_id = %s AND other.user_id = ANY(%s)
+      AND proposal.status = ANY(%s)
+    GROUP BY 1, 2
+'''
+
+
+def get_connection():
+    return connections[router.db_for_read(MatchPosting)]
+
+
+def format_sql(sql, connection):
+    return sql.format(
+        postings=connection.ops.quote_name(MatchPosting._meta.db_table),
+        proposals=connection.ops.quote_name(ExchangeProposal._meta.db_table),
+        ads=connection.ops.quote_name(Ad._meta.db_table),
+        links=connection.ops.quote_name(AdCategory._meta.db_table))
+
+
+def owner_rates(users):
+    history = defaultdict(lambda: {ACCEPTED: 0, REJECTED: 0})
+    for user, status, count in ExchangeCounter.objects.filter(
+            user__in=users, direction=ExchangeCounter.RECEIVED,
+            status__in=(ACCEPTED, REJECTED)).values_list(
+                'user', 'status', 'count'):
+        history[user][status] = count
+    return {user: (counts[ACCEPTED] + 1)
+            / (counts[ACCEPTED] + counts[REJECTED] + 2)
+            for user, counts in history.items()}
+
+
+def pair_history(connection, cursor, user, users):
+    statuses = [ACCEPTED, REJECTED]
+    cursor.execute(format_sql(PAIR_HISTORY_SQL, connection),
+                   [user, users, statuses, user, users, statuses])
+    history = defaultdict(lambda: {ACCEPTED: 0, REJECTED: 0})
+    for other, status, count in cursor.fetchall():
+        history[other][status] += count
+    return {other: (counts[ACCEPTED] - counts[REJECTED])
+            / (counts[ACCEPTED] + counts[REJECTED] + 1)
+            for other, counts in history.items()}
+
+
+def find_matches(ad, limit=MATCH_LIMIT, depth=MATCH_DEPTH):
+    connection = get_connection()
+    with connection.cursor() as cursor:
+        cursor.execute(format_sql(CANDIDATES_SQL, connection),
+                       [ad.user_id, depth, ad.pk])
+        candidates = cursor.fetchall()
+        if not candidates:
+            return []
+        users = sorted({user for _, user, _, _ in candidates})
+        pairs = pair_history(connection, cursor, ad.user_id, users)
+    rates = owner_rates(users)
+    scored = []
+    for pk, user, condition, overlap in candidates:
+        score = CATEGORY_WEIGHT * overlap
+        if condition is not None and condition == ad.condition_id:
+            score += CONDITION_WEIGHT
+        score += OWNER_WEIGHT * (rates.get(user, 0.5) - 0.5)
+        score += PAIR_WEIGHT * pairs.get(user, 0)
+        scored.append((round(score, 6), pk))
+    return [(pk, score) for score, pk in heapq.nlargest(limit, scored)]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0006_ad_created_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ad',
+            name='image_status',
+            field=models.CharField(choices=[('pending', 'Обрабатывается'), ('ready', 'Готово'), ('failed', 'Ошибка обработки')], default='ready', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='ad',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0008_imageupload'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='exchangeproposal',
+            name='status',
+            field=models.CharField(choices=[('accepted', 'Принята'), ('rejected', 'Отклонена'), ('pending', 'Ожидает'), ('superseded', 'Неактуальна')], default='pending', max_length=32),
+        ),
+    ]
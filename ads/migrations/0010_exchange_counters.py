@@ -0,0 +1,118 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+COUNTER_TRIGGERS = '''
+CREATE FUNCTION ads_exchange_counter_deltas(
+    old_proposals ads_exchangeproposal[],
+    new_proposals ads_exchangeproposal[]
+) RETURNS TABLE (user_id bigint, direction varchar, status varchar,
+                 count bigint)
+LANGUAGE sql STABLE AS $$
+    SELECT ad.user_id, side.direction::varchar, changed.status,
+           sum(changed.delta)::bigint
+    FROM (
+        SELECT proposal.ad_sender_id, proposal.ad_receiver_id,
+               proposal.status, -1 AS delta
+        FROM unnest(old_proposals) AS proposal
+        UNION ALL
+        SELECT proposal.ad_sender_id, proposal.ad_receiver_id,
+               proposal.status, 1 AS delta
+        FROM unnest(new_proposals) AS proposal
+    ) AS changed
+    CROSS JOIN LATERAL (VALUES
+        (changed.ad_sender_id, 'sent'),
+        (changed.ad_receiver_id, 'received')
+    ) AS side (ad_id, direction)
+    JOIN ads_ad AS ad ON ad.id = side.ad_id
+    GROUP BY 1, 2, 3
+    HAVING sum(changed.delta) <> 0
+$$;
+
+CREATE FUNCTION ads_exchange_counters() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    old_proposals ads_exchangeproposal[] := '{}';
+    new_proposals ads_exchangeproposal[] := '{}';
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        SELECT coalesce(array_agg(old_rows), '{}')
+        INTO old_proposals FROM old_rows;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        SELECT coalesce(array_agg(new_rows), '{}')
+        INTO new_proposals FROM new_rows;
+    END IF;
+
+    IF TG_OP = 'DELETE' THEN
+        UPDATE ads_exchangecounter AS counter
+        SET count = counter.count + delta.count
+        FROM ads_exchange_counter_deltas(old_proposals, new_proposals)
+            AS delta
+        WHERE counter.user_id = delta.user_id
+          AND counter.direction = delta.direction
+          AND counter.status = delta.status;
+    ELSE
+        INSERT INTO ads_exchangecounter (user_id, direction, status, count)
+        SELECT * FROM ads_exchange_counter_deltas(old_proposals,
+                                                  new_proposals)
+        ON CONFLICT (user_id, direction, status)
+        DO UPDATE SET count = ads_exchangecounter.count + EXCLUDED.count;
+    END IF;
+    RETURN NULL;
+END
+$$;
+
+CREATE TRIGGER ads_exchange_counters_insert
+    AFTER INSERT ON ads_exchangeproposal
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION ads_exchange_counters();
+CREATE TRIGGER ads_exchange_counters_update
+    AFTER UPDATE ON ads_exchangeproposal
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION ads_exchange_counters();
+CREATE TRIGGER ads_exchange_counters_delete
+    AFTER DELETE ON ads_exchangeproposal
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION ads_exchange_counters();
+
+INSERT INTO ads_exchangecounter (user_id, direction, status, count)
+SELECT * FROM ads_exchange_counter_deltas(
+    '{}', ARRAY(SELECT proposal FROM ads_exchangeproposal AS proposal));
+'''
+
+DROP_COUNTER_TRIGGERS = '''
+DROP TRIGGER ads_exchange_counters_insert ON ads_exchangeproposal;
+DROP TRIGGER ads_exchange_counters_update ON ads_exchangeproposal;
+DROP TRIGGER ads_exchange_counters_delete ON ads_exchangeproposal;
+DROP FUNCTION ads_exchange_counters();
+DROP FUNCTION ads_exchange_counter_deltas(ads_exchangeproposal[],
+                                          ads_exchangeproposal[]);
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0009_exchange_superseded_status'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExchangeCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('direction', models.CharField(choices=[('sent', 'Отправленные'), ('received', 'Полученные')], max_length=16)),
+                ('status', models.CharField(choices=[('accepted', 'Принята'), ('rejected', 'Отклонена'), ('pending', 'Ожидает'), ('superseded', 'Неактуальна')], max_length=32)),
+                ('count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='exchange_counters', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'direction', 'status'), name='exchange_counter_unique')],
+            },
+        ),
+        migrations.RunSQL(COUNTER_TRIGGERS, DROP_COUNTER_TRIGGERS),
+    ]
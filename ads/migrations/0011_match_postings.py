@@ -0,0 +1,109 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+MATCH_TRIGGERS = '''
+CREATE FUNCTION ads_refresh_match_postings(ad_ids bigint[]) RETURNS void
+LANGUAGE sql AS $$
+    DELETE FROM ads_matchposting WHERE ad_id = ANY(ad_ids);
+    INSERT INTO ads_matchposting (category_id, ad_id, user_id,
+                                  condition_id, weight)
+    SELECT link.category_id, ad.id, ad.user_id, ad.condition_id,
+           1 / sqrt(count(*) OVER (PARTITION BY ad.id))
+    FROM (
+        SELECT DISTINCT ad_id, category_id FROM ads_adcategory
+        WHERE ad_id = ANY(ad_ids)
+    ) AS link
+    JOIN ads_ad AS ad ON ad.id = link.ad_id;
+$$;
+
+CREATE FUNCTION ads_adcategory_match_postings() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM ads_refresh_match_postings(
+            ARRAY(SELECT DISTINCT ad_id FROM new_rows));
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM ads_refresh_match_postings(
+            ARRAY(SELECT DISTINCT ad_id FROM old_rows));
+    ELSE
+        PERFORM ads_refresh_match_postings(
+            ARRAY(SELECT ad_id FROM old_rows
+                  UNION SELECT ad_id FROM new_rows));
+    END IF;
+    RETURN NULL;
+END
+$$;
+
+CREATE FUNCTION ads_ad_match_postings() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE ads_matchposting AS posting
+    SET user_id = new_rows.user_id, condition_id = new_rows.condition_id
+    FROM new_rows
+    JOIN old_rows ON old_rows.id = new_rows.id
+    WHERE posting.ad_id = new_rows.id
+      AND (new_rows.user_id, new_rows.condition_id)
+          IS DISTINCT FROM (old_rows.user_id, old_rows.condition_id);
+    RETURN NULL;
+END
+$$;
+
+CREATE TRIGGER ads_adcategory_match_postings_insert
+    AFTER INSERT ON ads_adcategory
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION ads_adcategory_match_postings();
+CREATE TRIGGER ads_adcategory_match_postings_update
+    AFTER UPDATE ON ads_adcategory
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION ads_adcategory_match_postings();
+CREATE TRIGGER ads_adcategory_match_postings_delete
+    AFTER DELETE ON ads_adcategory
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION ads_adcategory_match_postings();
+CREATE TRIGGER ads_ad_match_postings_update
+    AFTER UPDATE ON ads_ad
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION ads_ad_match_postings();
+
+SELECT ads_refresh_match_postings(ARRAY(SELECT id FROM ads_ad));
+'''
+
+DROP_MATCH_TRIGGERS = '''
+DROP TRIGGER ads_adcategory_match_postings_insert ON ads_adcategory;
+DROP TRIGGER ads_adcategory_match_postings_update ON ads_adcategory;
+DROP TRIGGER ads_adcategory_match_postings_delete ON ads_adcategory;
+DROP TRIGGER ads_ad_match_postings_update ON ads_ad;
+DROP FUNCTION ads_adcategory_match_postings();
+DROP FUNCTION ads_ad_match_postings();
+DROP FUNCTION ads_refresh_match_postings(bigint[]);
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0010_exchange_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatchPosting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weight', models.FloatField()),
+                ('ad', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='ads.ad')),
+                ('category', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='ads.category')),
+                ('condition', models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='ads.condition')),
+                ('user', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['category', '-ad'], include=('user', 'condition', 'weight'), name='match_posting_category_idx'), models.Index(fields=['ad'], name='match_posting_ad_idx')],
+            },
+        ),
+        migrations.RunSQL(MATCH_TRIGGERS, DROP_MATCH_TRIGGERS),
+    ]
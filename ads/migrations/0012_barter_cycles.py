@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:37
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0011_match_postings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BarterCycle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True)),
+                ('users', django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), size=None)),
+                ('ads', django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), size=None)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [django.contrib.postgres.indexes.GinIndex(fields=['users'], name='barter_cycle_users_idx'), django.contrib.postgres.indexes.GinIndex(fields=['ads'], name='barter_cycle_ads_idx')],
+            },
+        ),
+    ]
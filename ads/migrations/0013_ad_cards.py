@@ -0,0 +1,48 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:02
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.deletion
+from django.db import migrations, models
+
+TRIGRAM_INDEX = '''
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+        CREATE INDEX IF NOT EXISTS ad_card_title_trgm_idx
+            ON ads_adcard USING gin (title gin_trgm_ops);
+    END IF;
+END
+$$;
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0012_barter_cycles'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdCard',
+            fields=[
+                ('ad', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card', serialize=False, to='ads.ad')),
+                ('title', models.CharField(max_length=64)),
+                ('description', models.CharField(max_length=512)),
+                ('category_slugs', django.contrib.postgres.fields.ArrayField(base_field=models.SlugField(), default=list, size=None)),
+                ('created_at', models.DateTimeField()),
+                ('payload', models.TextField()),
+                ('search_vector', models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.SearchVector('title', config='russian', weight='A'), '||', django.contrib.postgres.search.SearchVector('description', config='russian', weight='B'), django.contrib.postgres.search.SearchConfig('russian')), '||', django.contrib.postgres.search.SearchVector('title', config='english', weight='A'), django.contrib.postgres.search.SearchConfig('russian')), '||', django.contrib.postgres.search.SearchVector('description', config='english', weight='B'), django.contrib.postgres.search.SearchConfig('russian')), output_field=django.contrib.postgres.search.SearchVectorField())),
+                ('condition', models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='ads.condition')),
+            ],
+            options={
+                'ordering': ('-created_at',),
+                'indexes': [models.Index(fields=['-created_at', '-ad'], name='ad_card_created_idx'), models.Index(fields=['condition', '-created_at'], name='ad_card_condition_idx'), django.contrib.postgres.indexes.GinIndex(fields=['category_slugs'], name='ad_card_category_slugs_idx'), django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='ad_card_search_vector_idx')],
+            },
+        ),
+        migrations.RunSQL(
+            TRIGRAM_INDEX,
+            reverse_sql='DROP INDEX IF EXISTS ad_card_title_trgm_idx;'),
+    ]
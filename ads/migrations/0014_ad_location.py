@@ -0,0 +1,44 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:13
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0013_ad_cards'),
+        ('users', '0002_user_location'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ad',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(-90), django.core.validators.MaxValueValidator(90)]),
+        ),
+        migrations.AddField(
+            model_name='ad',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(-180), django.core.validators.MaxValueValidator(180)]),
+        ),
+        migrations.AddField(
+            model_name='adcard',
+            name='geohash',
+            field=models.CharField(max_length=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='adcard',
+            name='latitude',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='adcard',
+            name='longitude',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddIndex(
+            model_name='adcard',
+            index=models.Index(fields=['geohash'], name='ad_card_geohash_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
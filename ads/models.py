@@ -1,12 +1,23 @@
+import uuid
 from django.db import models
+from django.db.models import DEFERRED
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.core.validators import MaxValueValidator, MinValueValidator
+from .images import IMAGE_READY, IMAGE_STATUS_CHOICES
 
 User = get_user_model()
 
+LATITUDE_VALIDATORS = (MinValueValidator(-90), MaxValueValidator(90))
+LONGITUDE_VALIDATORS = (MinValueValidator(-180), MaxValueValidator(180))
+
 CHOICES = (
     ('accepted', 'Принята'),
     ('rejected', 'Отклонена'),
-    ('pending', 'Ожидает')
+    ('pending', 'Ожидает'),
+    ('superseded', 'Неактуальна'),
 )
 
 
@@ -30,9 +41,22 @@ class Condition(models.Model):
         return self.title
 
 
+class AdQuerySet(models.QuerySet):
+
+    def with_relations(self):
+        return self.select_related('user').prefetch_related(
+            models.Prefetch(
+                'adcategory_set',
+                queryset=AdCategory.objects.only(
+                    'ad_id', 'category_id').order_by('id'))
+        ).only('id', 'title', 'description', 'image_url', 'image_status',
+               'image_variants', 'condition', 'latitude', 'longitude',
+               'created_at', 'user__username')
+
+
 class Ad(models.Model):
     user = models.ForeignKey(
-        User, on_delete=models.CASCADE)
+        User, on_delete=models.CASCADE, db_index=False)
     title = models.CharField(
         max_length=64, blank=False)
     description = models.CharField(
@@ -40,15 +64,51 @@ class Ad(models.Model):
     image_url = models.ImageField(
         upload_to='ads/images/', null=True,
         blank=True)
+    image_status = models.CharField(
+        max_length=16, choices=IMAGE_STATUS_CHOICES, default=IMAGE_READY)
+    image_variants = models.JSONField(
+        default=dict, blank=True)
     category = models.ManyToManyField(
         Category, through='AdCategory')
     condition = models.ForeignKey(
         Condition, on_delete=models.SET_NULL, null=True)
+    latitude = models.FloatField(
+        null=True, blank=True, validators=LATITUDE_VALIDATORS)
+    longitude = models.FloatField(
+        null=True, blank=True, validators=LONGITUDE_VALIDATORS)
     created_at = models.DateTimeField(
         auto_now_add=True)
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector('title', weight='A', config='russian')
+            + SearchVector('description', weight='B', config='russian')
+            + SearchVector('title', weight='A', config='english')
+            + SearchVector('description', weight='B', config='english')),
+        output_field=SearchVectorField(),
+        db_persist=True)
+
+    objects = AdQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_condition_id = instance.__dict__.get(
+            'condition_id', DEFERRED)
+        return instance
+
+    @property
+    def category_ids(self):
+        return [link.category_id for link in self.adcategory_set.all()]
 
     class Meta:
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['user', '-created_at'],
+                         name='ad_user_created_idx'),
+            models.Index(fields=['-created_at', '-id'],
+                         name='ad_created_id_idx'),
+            GinIndex(fields=['search_vector'], name='ad_search_vector_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -59,11 +119,35 @@ class AdCategory(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
 
 
+class ImageUpload(models.Model):
+    id = models.UUIDField(
+        primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE)
+    file = models.FileField(
+        upload_to='ads/uploads/')
+    created_at = models.DateTimeField(
+        auto_now_add=True)
+
+
+class ExchangeProposalQuerySet(models.QuerySet):
+
+    def with_ads(self):
+        categories = Category.objects.only('id', 'title', 'slug')
+        return self.select_related(
+            'ad_sender', 'ad_receiver'
+        ).prefetch_related(
+            models.Prefetch('ad_sender__category', queryset=categories),
+            models.Prefetch('ad_receiver__category', queryset=categories))
+
+
 class ExchangeProposal(models.Model):
     ad_sender = models.ForeignKey(
-        Ad, on_delete=models.CASCADE, related_name='ad_sender')
+        Ad, on_delete=models.CASCADE, related_name='ad_sender',
+        db_index=False)
     ad_receiver = models.ForeignKey(
-        Ad, on_delete=models.CASCADE, related_name='ad_receiver')
+        Ad, on_delete=models.CASCADE, related_name='ad_receiver',
+        db_index=False)
     comment = models.CharField(
         max_length=512)
     status = models.CharField(
@@ -71,9 +155,129 @@ class ExchangeProposal(models.Model):
     created_at = models.DateTimeField(
         auto_now_add=True)
 
+    objects = ExchangeProposalQuerySet.as_manager()
+
     class Meta:
         constraints = [
             models.UniqueConstraint(
                 fields=['ad_sender', 'ad_receiver'],
                 name='Exchange constraint')
         ]
+        indexes = [
+            models.Index(fields=['ad_receiver', 'status', 'created_at'],
+                         name='exchange_receiver_status_idx'),
+            models.Index(fields=['ad_sender', 'status', 'created_at'],
+                         name='exchange_sender_status_idx'),
+        ]
+
+
+class ExchangeCounter(models.Model):
+    SENT = 'sent'
+    RECEIVED = 'received'
+    DIRECTIONS = (
+        (SENT, 'Отправленные'),
+        (RECEIVED, 'Полученные'),
+    )
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='exchange_counters',
+        db_index=False)
+    direction = models.CharField(
+        max_length=16, choices=DIRECTIONS)
+    status = models.CharField(
+        max_length=32, choices=CHOICES)
+    count = models.IntegerField(
+        default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'direction', 'status'],
+                name='exchange_counter_unique')
+        ]
+
+
+class MatchPosting(models.Model):
+    category = models.ForeignKey(
+        Category, on_delete=models.DO_NOTHING, db_constraint=False,
+        db_index=False, related_name='+')
+    ad = models.ForeignKey(
+        Ad, on_delete=models.DO_NOTHING, db_constraint=False,
+        db_index=False, related_name='+')
+    user = models.ForeignKey(
+        User, on_delete=models.DO_NOTHING, db_constraint=False,
+        db_index=False, related_name='+')
+    condition = models.ForeignKey(
+        Condition, on_delete=models.DO_NOTHING, db_constraint=False,
+        db_index=False, null=True, related_name='+')
+    weight = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['category', '-ad'],
+                         include=['user', 'condition', 'weight'],
+                         name='match_posting_category_idx'),
+            models.Index(fields=['ad'], name='match_posting_ad_idx'),
+        ]
+
+
+class BarterCycle(models.Model):
+    key = models.CharField(
+        max_length=255, unique=True)
+    users = ArrayField(
+        models.BigIntegerField())
+    ads = ArrayField(
+        models.BigIntegerField())
+    created_at = models.DateTimeField(
+        auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['users'], name='barter_cycle_users_idx'),
+            GinIndex(fields=['ads'], name='barter_cycle_ads_idx'),
+        ]
+
+
+class AdCard(models.Model):
+    ad = models.OneToOneField(
+        Ad, on_delete=models.CASCADE, primary_key=True, related_name='card')
+    title = models.CharField(
+        max_length=64)
+    description = models.CharField(
+        max_length=512)
+    condition = models.ForeignKey(
+        Condition, on_delete=models.DO_NOTHING, db_constraint=False,
+        db_index=False, null=True, related_name='+')
+    category_slugs = ArrayField(
+        models.SlugField(), default=list)
+    latitude = models.FloatField(
+        null=True)
+    longitude = models.FloatField(
+        null=True)
+    geohash = models.CharField(
+        max_length=12, null=True)
+    created_at = models.DateTimeField()
+    payload = models.TextField()
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector('title', weight='A', config='russian')
+            + SearchVector('description', weight='B', config='russian')
+            + SearchVector('title', weight='A', config='english')
+            + SearchVector('description', weight='B', config='english')),
+        output_field=SearchVectorField(),
+        db_persist=True)
+
+    class Meta:
+        ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['-created_at', '-ad'],
+                         name='ad_card_created_idx'),
+            models.Index(fields=['condition', '-created_at'],
+                         name='ad_card_condition_idx'),
+            GinIndex(fields=['category_slugs'],
+                     name='ad_card_category_slugs_idx'),
+            GinIndex(fields=['search_vector'],
+                     name='ad_card_search_vector_idx'),
+            models.Index(fields=['geohash'], name='ad_card_geohash_idx',
+                         opclasses=['varchar_pattern_ops']),
+        ]
@@ -0,0 +1,277 @@
+import base64
+import hashlib
+import json
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from django.db.models import Q
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+COUNT_VERSION_KEY = 'counts:{label}:version'
+
+
+def estimate_count(model, using='default'):
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            [model._meta.db_table])
+        row = cursor.fetchone()
+    return row[0] if row else -1
+
+
+def get_count_version(model):
+    key = COUNT_VERSION_KEY.format(label=model._meta.label_lower)
+    cache.add(key, 1, timeout=None)
+    return cache.get(key, 1)
+
+
+def invalidate_counts(model):
+    key = COUNT_VERSION_KEY.format(label=model._meta.label_lower)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, timeout=None)
+
+
+def count_cache_key(queryset):
+    signature = hashlib.md5(str(queryset.query).encode()).hexdigest()
+    return 'counts:{label}:{version}:{signature}'.format(
+        label=queryset.model._meta.label_lower,
+        version=get_count_version(queryset.model),
+        signature=signature)
+
+
+def cached_count(queryset, timeout, estimate_threshold=None):
+    try:
+        key = count_cache_key(queryset)
+    except EmptyResultSet:
+        return 0
+    count = cache.get(key)
+    if count is None:
+        if estimate_threshold is not None:
+            count = estimate_count(queryset.model, queryset.db)
+        if count is None or count < estimate_threshold:
+            count = queryset.count()
+        cache.set(key, count, timeout)
+    return count
+
+
+async def acached_count(queryset, timeout, estimate_threshold=None):
+    try:
+        key = await sync_to_async(count_cache_key)(queryset)
+    except EmptyResultSet:
+        return 0
+    count = await cache.aget(key)
+    if count is None:
+        if estimate_threshold is not None:
+            count = await sync_to_async(estimate_count)(
+                queryset.model, queryset.db)
+        if count is None or count < estimate_threshold:
+            count = await queryset.acount()
+        await cache.aset(key, count, timeout)
+    return count
+
+
+class KeysetPagination(pagination.BasePagination):
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    page_size = 20
+    max_page_size = 1000
+    invalid_cursor_message = 'Invalid cursor'
+    invalid_ordering_message = ('Cursor pagination is not available for '
+                                'results ordered by {fields}.')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.get_page(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return self.get_page([
+            obj async for obj in self.page_queryset(queryset, request)])
+
+    def page_queryset(self, queryset, request):
+        self.request = request
+        self.base_url = remove_query_param(
+            request.build_absolute_uri(), 'offset')
+        self.check_ordering(queryset)
+        self.limit = limit = self.get_page_size(request)
+        self.cursor = cursor = self.decode_cursor(request)
+        reverse = cursor is not None and cursor[2]
+
+        if reverse:
+            queryset = queryset.order_by('created_at', 'pk')
+        else:
+            queryset = queryset.order_by('-created_at', '-pk')
+        if cursor is not None:
+            created_at, pk = cursor[0], cursor[1]
+            if reverse:
+                queryset = queryset.filter(
+                    Q(created_at__gte=created_at),
+                    Q(created_at__gt=created_at) | Q(pk__gt=pk))
+            else:
+                queryset = queryset.filter(
+                    Q(created_at__lte=created_at),
+                    Q(created_at__lt=created_at) | Q(pk__lt=pk))
+        return queryset[:limit + 1]
+
+    def check_ordering(self, queryset):
+        fields = [field.lstrip('-') for field in queryset.query.order_by
+                  if isinstance(field, str)]
+        annotated = [field for field in fields
+                     if field in queryset.query.annotations]
+        if annotated:
+            raise ValidationError({'pagination': [
+                self.invalid_ordering_message.format(
+                    fields=', '.join(annotated))]})
+
+    def get_page(self, results):
+        limit, cursor = self.limit, self.cursor
+        reverse = cursor is not None and cursor[2]
+        has_more = len(results) > limit
+        results = results[:limit]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = cursor is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+
+        if results:
+            self.next_position = (results[-1].created_at, results[-1].pk)
+            self.previous_position = (results[0].created_at, results[0].pk)
+        else:
+            self.next_position = self.previous_position = (
+                cursor and cursor[:2])
+        return results
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            created_at, pk, reverse = json.loads(
+                base64.urlsafe_b64decode(encoded.encode('ascii')))
+            return datetime.fromisoformat(created_at), int(pk), bool(reverse)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position, reverse):
+        created_at, pk = position
+        encoded = base64.urlsafe_b64encode(json.dumps(
+            [created_at.isoformat(), pk, int(reverse)]).encode('ascii'))
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, encoded.decode('ascii'))
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.next_position, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(self.previous_position, reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True,
+                         'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True,
+                             'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class AsyncLimitOffsetPagination(pagination.LimitOffsetPagination):
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.count = await self.aget_count(queryset)
+        self.offset = self.get_offset(request)
+        if self.count > self.limit and self.template is not None:
+            self.display_page_controls = True
+
+        if self.count == 0 or self.offset > self.count:
+            return []
+        return [obj async for obj in
+                queryset[self.offset:self.offset + self.limit]]
+
+    async def aget_count(self, queryset):
+        return await queryset.acount()
+
+
+class AdPagination(AsyncLimitOffsetPagination):
+    mode_query_param = 'pagination'
+    keyset_pagination_class = KeysetPagination
+    count_query_param = 'count'
+    estimate_threshold = 10000
+    count_cache_timeout = 300
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        keyset = self.keyset_pagination_class()
+        if self.use_keyset(request, keyset):
+            self.keyset = keyset
+            return keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        keyset = self.keyset_pagination_class()
+        if self.use_keyset(request, keyset):
+            self.keyset = keyset
+            return await keyset.apaginate_queryset(queryset, request, view)
+        return await super().apaginate_queryset(queryset, request, view)
+
+    def use_keyset(self, request, keyset):
+        return (request.query_params.get(self.mode_query_param) == 'cursor'
+                or keyset.cursor_query_param in request.query_params)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_count(self, queryset):
+        if self.request.query_params.get(self.count_query_param) == 'exact':
+            return super().get_count(queryset)
+        if not queryset.query.where:
+            return cached_count(queryset, self.count_cache_timeout,
+                                self.estimate_threshold)
+        return cached_count(queryset, self.count_cache_timeout)
+
+    async def aget_count(self, queryset):
+        if self.request.query_params.get(self.count_query_param) == 'exact':
+            return await super().aget_count(queryset)
+        if not queryset.query.where:
+            return await acached_count(queryset, self.count_cache_timeout,
+                                       self.estimate_threshold)
+        return await acached_count(queryset, self.count_cache_timeout)
@@ -1,8 +1,22 @@
 import pytest
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
 from rest_framework.test import APIClient
 from .factories import UserFactory, AdminFactory, AdFactory
 from ..models import Condition, Category
+from ..references import invalidate_references
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    invalidate_references()
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path / "media")
+    return settings.MEDIA_ROOT
 
 
 @pytest.fixture
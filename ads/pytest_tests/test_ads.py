@@ -1,6 +1,11 @@
 import pytest
-from ..models import Category, Condition, ExchangeProposal
+from ..cards import refresh_cards
+from ..models import Ad, AdCard, Category, Condition, ExchangeProposal
+from ..pagination import AdPagination
+from ..references import load_references
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.utils import timezone
 from rest_framework.test import APIClient
 User = get_user_model()
 
@@ -180,6 +185,120 @@ def test_ad_delete_by_another_user(authenticated_client, user_factory,
     assert response.status_code == 403
 
 
+@pytest.mark.django_db
+def test_advertisment_creation_reports_missing_categories(
+        authenticated_client, condition, category):
+    data = {
+        "title": "test_ad",
+        "description": "test_description",
+        "image_url": None,
+        "category": [category.id, 0, category.id + 1000, 0],
+        "condition": condition.id
+    }
+    response = authenticated_client.post("/api/v1/ads/", data, format="json")
+    assert response.status_code == 400
+    assert response.data["category"] == [
+        f'Invalid pks "0", "{category.id + 1000}" - objects do not exist.']
+
+
+@pytest.mark.django_db
+def test_reference_cache_invalidated_on_admin_write(api_client, user_factory,
+                                                    condition, category):
+    user = user_factory()
+    api_client.force_authenticate(user=user)
+    data = {
+        "title": "test_ad",
+        "description": "test_description",
+        "image_url": None,
+        "category": [category.id],
+        "condition": condition.id
+    }
+    assert api_client.post(
+        "/api/v1/ads/", data, format="json").status_code == 201
+    api_client.force_authenticate(user=user_factory(is_staff=True))
+    new_category = api_client.post(
+        "/api/v1/categories/", {"title": "books", "slug": "books"},
+        format="json").data
+    api_client.delete(f"/api/v1/conditions/{condition.id}/")
+    api_client.force_authenticate(user=user)
+    response = api_client.post(
+        "/api/v1/ads/", {**data, "category": [new_category["id"]]},
+        format="json")
+    assert response.status_code == 400
+    assert response.data["condition"][0].code == "does_not_exist"
+    assert "category" not in response.data
+
+
+@pytest.mark.django_db
+def test_ads_bulk_create(authenticated_client, condition, category):
+    url = "/api/v1/ads/bulk/"
+    data = [{
+        "title": f"bulk {i}",
+        "description": "bulk description",
+        "image_url": None,
+        "category": [category.id],
+        "condition": condition.id,
+    } for i in range(3)]
+    response = authenticated_client.post(url, data, format="json")
+    assert response.status_code == 201
+    assert [ad["title"] for ad in response.data] == [
+        "bulk 0", "bulk 1", "bulk 2"]
+    assert response.data[0]["category"][0]["slug"] == category.slug
+    assert Ad.objects.filter(category=category).count() == 3
+    list_response = authenticated_client.get("/api/v1/ads/?limit=10")
+    assert list_response.data["count"] == 3
+
+
+@pytest.mark.django_db
+def test_ads_bulk_create_reports_item_errors(authenticated_client,
+                                             condition, category):
+    url = "/api/v1/ads/bulk/"
+    valid = {
+        "title": "bulk",
+        "description": "bulk description",
+        "image_url": None,
+        "category": [category.id],
+        "condition": condition.id,
+    }
+    data = [valid, {**valid, "category": [category.id, 0]},
+            valid, {**valid, "condition": "new"}]
+    response = authenticated_client.post(url, data, format="json")
+    assert response.status_code == 400
+    assert response.data[0] == {} and response.data[2] == {}
+    assert response.data[1]["category"][0].code == "does_not_exist"
+    assert response.data[3]["condition"][0].code == "incorrect_type"
+    assert not Ad.objects.exists()
+
+
+@pytest.mark.django_db
+def test_ads_bulk_partial_update(authenticated_client, user_factory,
+                                 ad_fixture, condition, category):
+    author = authenticated_client.handler._force_user
+    first, second = ad_fixture.create_batch(2, user=author)
+    foreign = ad_fixture(user=user_factory())
+    url = "/api/v1/ads/bulk/"
+    data = [{"id": first.id, "title": "Bulk title"},
+            {"id": second.id, "condition": condition.id,
+             "category": [category.id]}]
+    response = authenticated_client.patch(url, data, format="json")
+    assert response.status_code == 200
+    assert response.data[0]["title"] == "Bulk title"
+    assert response.data[1]["condition"]["id"] == condition.id
+    assert list(second.category.all()) == [category]
+    assert authenticated_client.get(
+        f"/api/v1/ads/{first.id}/").data["title"] == "Bulk title"
+
+    data = [{"id": first.id, "title": "Hack"},
+            {"id": foreign.id, "title": "Hack"},
+            {"id": 0, "title": "Hack"}]
+    response = authenticated_client.patch(url, data, format="json")
+    assert response.status_code == 400
+    assert response.data[0] == {}
+    assert response.data[1]["id"] == ["You are not the author of this ad!"]
+    assert "does not exist" in response.data[2]["id"][0]
+    assert not Ad.objects.filter(title="Hack").exists()
+
+
 @pytest.mark.django_db
 def test_filter_ads_by_category(api_client, ad_fixture, category):
     category1 = category
@@ -229,6 +348,38 @@ def test_search_ads_by_title_description(api_client, ad_fixture):
     assert len(response5.data) == 0
 
 
+@pytest.mark.django_db
+def test_search_ads_ranking(api_client, ad_fixture):
+    ad_fixture(title="Old lamp", description="Works with a bicycle dynamo")
+    ad_fixture(title="Bicycle", description="Road bicycle, barely used")
+    response = api_client.get("/api/v1/ads/?search=bicycles")
+    assert response.status_code == 200
+    assert [ad["title"] for ad in response.data] == ["Bicycle", "Old lamp"]
+
+
+@pytest.mark.django_db
+def test_search_ads_russian_morphology(api_client, ad_fixture):
+    ad_fixture(title="Телефон", description="Почти новый телефон")
+    ad_fixture(title="Велосипед", description="Горный велосипед")
+    response = api_client.get("/api/v1/ads/?search=телефоны")
+    response2 = api_client.get("/api/v1/ads/?search=новые&search_lang=ru")
+    response3 = api_client.get("/api/v1/ads/?search=новые&search_lang=en")
+    assert response.status_code == 200
+    assert [ad["title"] for ad in response.data] == ["Телефон"]
+    assert len(response2.data) == 1
+    assert len(response3.data) == 0
+
+
+@pytest.mark.django_db
+def test_search_ads_with_filters(api_client, ad_fixture, category):
+    ad_fixture(title="Chair", description="Wooden chair", category=[category])
+    ad_fixture(title="Chair", description="Plastic chair")
+    response = api_client.get(
+        f"/api/v1/ads/?search=chair&category__slug={category.slug}")
+    assert response.status_code == 200
+    assert len(response.data) == 1
+
+
 @pytest.mark.django_db
 def test_ads_pagination(api_client, ad_fixture):
     ad_fixture.create_batch(15)
@@ -244,6 +395,96 @@ def test_ads_pagination(api_client, ad_fixture):
     assert "api/v1/ads/?limit=10" in response2.data["previous"]
 
 
+@pytest.mark.django_db
+def test_ads_cursor_pagination(api_client, ad_fixture,
+                               django_assert_num_queries):
+    ad_fixture.create_batch(10)
+    Ad.objects.filter(id__in=Ad.objects.values("id")[:4]).update(
+        created_at=timezone.now())
+    refresh_cards(Ad.objects.values_list("id", flat=True))
+    expected = list(Ad.objects.order_by(
+        "-created_at", "-id").values_list("id", flat=True))
+    load_references()
+    url = "/api/v1/ads/?pagination=cursor&limit=3"
+    pages = []
+    while url:
+        with django_assert_num_queries(1):
+            response = api_client.get(url)
+        assert response.status_code == 200
+        assert "count" not in response.data
+        pages.append(response.data)
+        url = response.data["next"]
+    assert [ad["id"] for page in pages for ad in page["results"]] == expected
+    assert pages[0]["previous"] is None
+    assert len(pages) == 4
+    previous = api_client.get(pages[2]["previous"])
+    assert previous.data["results"] == pages[1]["results"]
+    first = api_client.get(previous.data["previous"])
+    assert first.data["results"] == pages[0]["results"]
+    assert first.data["previous"] is None
+
+
+@pytest.mark.django_db
+def test_ads_cursor_pagination_with_filters(api_client, ad_fixture,
+                                            category):
+    ad_fixture.create_batch(3, category=[category])
+    ad_fixture.create_batch(2)
+    response = api_client.get(
+        f"/api/v1/ads/?pagination=cursor&limit=2"
+        f"&category__slug={category.slug}")
+    next_response = api_client.get(response.data["next"])
+    assert len(response.data["results"]) == 2
+    assert len(next_response.data["results"]) == 1
+    assert next_response.data["next"] is None
+    assert api_client.get("/api/v1/ads/?cursor=bad").status_code == 404
+
+
+@pytest.mark.django_db
+def test_ads_cursor_pagination_rejects_ranked_results(api_client,
+                                                      ad_fixture):
+    ad_fixture(title="bicycle", latitude=55.75, longitude=37.61)
+    for query in ("search=bicycle", "near=55.75,37.61"):
+        response = api_client.get(
+            f"/api/v1/ads/?pagination=cursor&{query}")
+        assert response.status_code == 400
+        assert "pagination" in response.data
+        assert api_client.get(
+            f"/api/v1/ads/?limit=1&{query}").data["count"] == 1
+
+
+@pytest.mark.django_db
+def test_ads_estimated_count(api_client, ad_fixture, monkeypatch):
+    monkeypatch.setattr(AdPagination, "estimate_threshold", 0)
+    ad_fixture.create_batch(3)
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE ads_adcard")
+    ad_fixture.create_batch(2)
+    response = api_client.get("/api/v1/ads/?limit=1")
+    exact_response = api_client.get("/api/v1/ads/?limit=1&count=exact")
+    assert response.data["count"] == 3
+    assert exact_response.data["count"] == 5
+
+
+@pytest.mark.django_db
+def test_ads_cached_filtered_count(api_client, ad_fixture, condition,
+                                   django_assert_num_queries):
+    ad_fixture.create_batch(2, condition=condition)
+    load_references()
+    url = f"/api/v1/ads/?limit=1&condition__slug={condition.slug}"
+    with django_assert_num_queries(2):
+        assert api_client.get(url).data["count"] == 2
+    with django_assert_num_queries(1):
+        assert api_client.get(url).data["count"] == 2
+    Ad.objects.update(condition=None)
+    AdCard.objects.update(condition=None)
+    assert api_client.get(url).data["count"] == 2
+    assert api_client.get(url + "&count=exact").data["count"] == 0
+    ad_fixture(condition=condition)
+    assert api_client.get(url).data["count"] == 1
+    Ad.objects.get(condition=condition).delete()
+    assert api_client.get(url).data["count"] == 0
+
+
 @pytest.mark.django_db
 def test_exchange_propose_create_and_list(authenticated_client, ad_fixture):
     user1 = User.objects.create_user(username='First', password='123')
@@ -0,0 +1,97 @@
+import json
+
+import pytest
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.contrib.auth.models import AnonymousUser
+from django.test import AsyncRequestFactory, RequestFactory
+from django.urls import resolve
+
+from .factories import AdFactory, UserFactory
+from ..models import ExchangeProposal
+from ..views import AdViewSet, ExchangeListViewSet, ExchangeProposalViewSet
+
+READ_VIEWS = {
+    "ads": (AdViewSet, {"get": "list"}),
+    "ad": (AdViewSet, {"get": "retrieve"}),
+    "received": (ExchangeListViewSet, {"get": "received_exchange"}),
+    "sended": (ExchangeListViewSet, {"get": "sended_exchange"}),
+    "cycles": (ExchangeListViewSet, {"get": "cycles"}),
+    "exchange": (ExchangeProposalViewSet, {"get": "pending_exchanges",
+                                           "put": "pending_exchanges"}),
+}
+
+
+def build_views(settings, asynchronous):
+    settings.ASYNC_READ_VIEWS = asynchronous
+    return {name: viewset.as_view(actions)
+            for name, (viewset, actions) in READ_VIEWS.items()}
+
+
+def call_view(view, user, url, **kwargs):
+    user = user or AnonymousUser()
+
+    async def auser():
+        return user
+
+    if iscoroutinefunction(view):
+        request = AsyncRequestFactory().get(url)
+        request.user, request.auser = user, auser
+        return async_to_sync(view)(request, **kwargs)
+    request = RequestFactory().get(url)
+    request.user, request.auser = user, auser
+    return view(request, **kwargs).render()
+
+
+@pytest.mark.django_db
+def test_async_read_views_match_sync_responses(settings, category,
+                                               condition):
+    assert not iscoroutinefunction(resolve("/api/v1/ads/").func)
+    sync_views = build_views(settings, False)
+    async_views = build_views(settings, True)
+    assert not any(map(iscoroutinefunction, sync_views.values()))
+    assert all(map(iscoroutinefunction, async_views.values()))
+
+    sender, receiver = UserFactory.create_batch(2)
+    sender_ad = AdFactory(user=sender, condition=condition)
+    receiver_ad = AdFactory(user=receiver, condition=None)
+    sender_ad.category.add(category)
+    exchange = ExchangeProposal.objects.create(
+        ad_sender=sender_ad, ad_receiver=receiver_ad, comment="c")
+    requests = [
+        ("ads", "/api/v1/ads/", {}),
+        ("ads", "/api/v1/ads/?limit=1", {}),
+        ("ads", "/api/v1/ads/?limit=1&facets=category", {}),
+        ("ads", "/api/v1/ads/?pagination=cursor&limit=1", {}),
+        ("ads", f"/api/v1/ads/?category__slug={category.slug}", {}),
+        ("ad", f"/api/v1/ads/{sender_ad.id}/", {"pk": str(sender_ad.id)}),
+        ("received", "/api/v1/exchanges/received/", {}),
+        ("received", "/api/v1/exchanges/received/?limit=1", {}),
+        ("sended", "/api/v1/exchanges/sended/", {}),
+        ("cycles", "/api/v1/exchanges/cycles/?limit=1", {}),
+        ("exchange", f"/api/v1/exchanges/{exchange.id}/",
+         {"exchange": str(exchange.id)}),
+    ]
+    for name, url, kwargs in requests:
+        expected = call_view(sync_views[name], receiver, url, **kwargs)
+        response = call_view(async_views[name], receiver, url, **kwargs)
+        assert response.status_code == expected.status_code == 200, url
+        assert json.loads(response.content) == json.loads(
+            expected.content), url
+    assert len(json.loads(call_view(
+        async_views["ads"], None, "/api/v1/ads/?limit=1"
+    ).content)["results"]) == 1
+
+
+@pytest.mark.django_db
+def test_async_read_views_errors(settings):
+    views = build_views(settings, True)
+    user = UserFactory()
+    assert call_view(views["received"], None,
+                     "/api/v1/exchanges/received/").status_code == 403
+    for pk in ("0", "abc"):
+        assert call_view(views["ad"], user, f"/api/v1/ads/{pk}/",
+                         pk=pk).status_code == 404
+    assert call_view(views["exchange"], user, "/api/v1/exchanges/1/",
+                     exchange="1").status_code == 404
+    assert call_view(views["ads"], None,
+                     "/api/v1/ads/?cursor=broken").status_code == 404
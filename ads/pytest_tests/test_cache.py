@@ -0,0 +1,81 @@
+import pytest
+from django.core.cache import cache
+from rest_framework.test import APIClient
+from .factories import CategoryFactory, ConditionFactory
+from ..cache import version_key
+from ..models import AdCategory
+
+
+@pytest.mark.django_db
+def test_ad_retrieve_served_from_cache(api_client, ad_fixture,
+                                       django_assert_num_queries):
+    ad = ad_fixture()
+    url = f"/api/v1/ads/{ad.id}/"
+    response = api_client.get(url)
+    with django_assert_num_queries(0):
+        cached_response = api_client.get(url)
+    assert cached_response.status_code == 200
+    assert cached_response.data == response.data
+    assert cached_response["ETag"] == response["ETag"]
+    with django_assert_num_queries(0):
+        not_modified = api_client.get(
+            url, HTTP_IF_NONE_MATCH=response["ETag"])
+    assert not_modified.status_code == 304
+    assert api_client.get(
+        url, HTTP_IF_NONE_MATCH='"stale"').status_code == 200
+
+    for pk in (ad.id + 1, "abc"):
+        assert api_client.get(f"/api/v1/ads/{pk}/").status_code == 404
+        assert cache.get(version_key("ads.ad", pk)) is None
+
+
+@pytest.mark.django_db
+def test_ad_cache_invalidation(api_client, ad_fixture, admin_client):
+    ad = ad_fixture()
+    category = ad.category.get()
+    url = f"/api/v1/ads/{ad.id}/"
+    etag = api_client.get(url)["ETag"]
+
+    category.title = "renamed"
+    category.save()
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response.data["category"][0]["title"] == "renamed"
+
+    ad.condition.title = "worn"
+    ad.condition.save()
+    assert api_client.get(url).data["condition"]["title"] == "worn"
+
+    ad.user.username = "new-name"
+    ad.user.save()
+    assert api_client.get(url).data["user"]["username"] == "new-name"
+
+    new_category = CategoryFactory()
+    AdCategory.objects.create(ad=ad, category=new_category)
+    assert len(api_client.get(url).data["category"]) == 2
+    ad.category.remove(new_category)
+    assert len(api_client.get(url).data["category"]) == 1
+    new_category.ad_set.add(ad)
+    assert len(api_client.get(url).data["category"]) == 2
+
+    ad.condition = ConditionFactory(title="other")
+    ad.save()
+    assert api_client.get(url).data["condition"]["title"] == "other"
+
+    ad.delete()
+    assert api_client.get(url).status_code == 404
+
+
+@pytest.mark.django_db
+def test_ad_cache_ignores_login_updates(ad_fixture,
+                                        django_assert_num_queries):
+    ad = ad_fixture()
+    client = APIClient()
+    url = f"/api/v1/ads/{ad.id}/"
+    client.get(url)
+    client.post("/api/v1/users/login/",
+                {"username": ad.user.username, "password": "testpass123"},
+                format="json")
+    client.logout()
+    with django_assert_num_queries(0):
+        assert client.get(url).status_code == 200
@@ -0,0 +1,82 @@
+import pytest
+from django.core.management import CommandError, call_command
+
+from .factories import AdFactory, CategoryFactory, ConditionFactory
+from ..models import AdCard
+from ..references import load_references
+
+
+def list_ads(client, query=""):
+    return client.get(f"/api/v1/ads/?limit=100{query}").data["results"]
+
+
+@pytest.mark.django_db
+def test_ad_cards_maintained(authenticated_client, api_client):
+    first, second = CategoryFactory.create_batch(2)
+    condition = ConditionFactory()
+    AdFactory.create_batch(2)
+    load_references()
+    data = {"title": "ad", "description": "description", "image_url": None,
+            "condition": condition.id, "category": [first.id, second.id]}
+    ad = authenticated_client.post("/api/v1/ads/", data, format="json").data
+    card = AdCard.objects.get(ad=ad["id"])
+    assert card.category_slugs == [first.slug, second.slug]
+    assert card.condition_id == condition.id
+
+    ads = list_ads(api_client)
+    assert ads == [api_client.get(f"/api/v1/ads/{item['id']}/").data
+                   for item in ads]
+    assert list_ads(api_client, f"&category__slug={second.slug}") == [ad]
+    assert api_client.get(
+        "/api/v1/ads/?limit=1&condition__slug=missing").data["count"] == 0
+
+    data.update(title="updated", category=[second.id])
+    authenticated_client.put(f"/api/v1/ads/{ad['id']}/", data, format="json")
+    first.slug = "renamed"
+    first.save()
+    second.title = "retitled"
+    second.save()
+    assert not list_ads(api_client, "&category__slug=renamed")
+    item = list_ads(api_client, f"&category__slug__in={second.slug},x")[0]
+    assert item["title"] == "updated"
+    assert item["category"] == [
+        {"id": second.id, "title": "retitled", "slug": second.slug}]
+
+    condition.delete()
+    second.delete()
+    item = list_ads(api_client, "&search=updated")[0]
+    assert item["category"] == []
+    assert item["condition"] == {"title": "", "slug": ""}
+    card = AdCard.objects.get(ad=ad["id"])
+    assert (card.category_slugs, card.condition_id) == ([], None)
+
+    user = card.ad.user
+    user.username = "renamed"
+    user.save()
+    assert list_ads(api_client)[0]["user"] == {"username": "renamed"}
+    authenticated_client.delete(f"/api/v1/ads/{ad['id']}/")
+    assert not AdCard.objects.filter(ad=ad["id"]).exists()
+    assert len(list_ads(api_client)) == 2
+
+
+@pytest.mark.django_db
+def test_rebuild_ad_cards():
+    ads = AdFactory.create_batch(3)
+    call_command("rebuild_ad_cards", "--check")
+
+    AdCard.objects.filter(ad=ads[0]).update(title="stale")
+    AdCard.objects.filter(ad=ads[1]).delete()
+    with pytest.raises(CommandError, match="2 cards drifted"):
+        call_command("rebuild_ad_cards", "--check")
+    call_command("rebuild_ad_cards")
+    call_command("rebuild_ad_cards", "--check")
+    assert AdCard.objects.get(ad=ads[0]).title == ads[0].title
+
+
+@pytest.mark.django_db
+def test_migrate_builds_missing_cards():
+    ads = AdFactory.create_batch(2)
+    AdCard.objects.all().delete()
+    call_command("migrate", verbosity=0)
+    assert set(AdCard.objects.values_list("ad", flat=True)) == {
+        ad.id for ad in ads}
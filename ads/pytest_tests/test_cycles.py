@@ -0,0 +1,71 @@
+import pytest
+from rest_framework.test import APIClient
+
+from .factories import AdFactory, CategoryFactory, UserFactory
+from ..cycles import find_cycles
+from ..exchanges import transition_exchange
+from ..models import BarterCycle, ExchangeProposal
+
+
+def propose(ad_sender, ad_receiver):
+    return ExchangeProposal.objects.create(
+        ad_sender=ad_sender, ad_receiver=ad_receiver, comment="comment")
+
+
+@pytest.mark.django_db
+def test_barter_cycles(settings, django_capture_on_commit_callbacks,
+                       django_assert_num_queries):
+    settings.CYCLE_DETECTION_WORKERS = 0
+    first, second, third, outsider = UserFactory.create_batch(4)
+    ads = [AdFactory(user=user) for user in (first, second, third)]
+    with django_capture_on_commit_callbacks(execute=True):
+        propose(ads[1], ads[0])
+        propose(ads[0], ads[1])
+        propose(ads[1], ads[2])
+    assert not BarterCycle.objects.exists()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        proposal = propose(ads[2], ads[0])
+    cycle = BarterCycle.objects.get()
+    assert cycle.users == [first.id, second.id, third.id]
+    assert cycle.ads == [ads[1].id, ads[2].id, ads[0].id]
+
+    # proposal, users wanting the origin's ads, one query per depth
+    with django_assert_num_queries(5):
+        assert find_cycles(proposal.id) == [
+            ((third.id, first.id, second.id),
+             (ads[0].id, ads[1].id, ads[2].id))]
+
+    client = APIClient()
+    client.force_authenticate(user=second)
+    response = client.get("/api/v1/exchanges/cycles/")
+    assert response.status_code == 200
+    assert [item["ads"] for item in response.data] == [cycle.ads]
+    response = client.get("/api/v1/exchanges/cycles/?limit=1")
+    assert response.data["count"] == 1
+    client.force_authenticate(user=outsider)
+    assert client.get("/api/v1/exchanges/cycles/").data == []
+
+    with django_capture_on_commit_callbacks(execute=True):
+        transition_exchange(proposal.id, first, "accepted")
+    assert not BarterCycle.objects.exists()
+
+
+@pytest.mark.django_db
+def test_barter_cycles_from_interest(settings,
+                                     django_capture_on_commit_callbacks):
+    settings.CYCLE_DETECTION_WORKERS = 0
+    users = UserFactory.create_batch(5)
+    ads = [AdFactory(user=user) for user in users[:4]]
+    wanted = CategoryFactory()
+    offered = AdFactory(user=users[0], category=[wanted])
+    with django_capture_on_commit_callbacks(execute=True):
+        for sender, receiver in zip(ads, ads[1:]):
+            propose(sender, receiver)
+        propose(ads[3], AdFactory(user=users[4], category=[wanted]))
+    cycle = BarterCycle.objects.get()
+    assert cycle.users == [user.id for user in users[:4]]
+    assert cycle.ads == [ads[1].id, ads[2].id, ads[3].id, offered.id]
+
+    offered.delete()
+    assert not BarterCycle.objects.exists()
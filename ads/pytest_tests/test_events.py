@@ -0,0 +1,113 @@
+import asyncio
+import json
+
+import pytest
+from asgiref.sync import async_to_sync, sync_to_async
+from django.test import AsyncClient, override_settings
+from rest_framework.test import APIClient
+
+from .factories import AdFactory, UserFactory
+from ..events import (EXCHANGE_CREATED, EXCHANGE_STATUS, get_broker,
+                      publish, reset_broker, stream_events)
+from ..models import ExchangeProposal
+
+EVENTS_URL = "/api/v1/exchanges/events/"
+
+
+@pytest.fixture(autouse=True)
+def broker():
+    reset_broker()
+    yield
+    reset_broker()
+
+
+def parse_event(chunk):
+    lines = dict(line.split(": ", 1)
+                 for line in chunk.decode().strip().split("\n"))
+    return lines["event"], json.loads(lines["data"])
+
+
+@pytest.mark.django_db(transaction=True)
+def test_exchange_events_stream():
+    sender, receiver = UserFactory.create_batch(2)
+    sender_ad, receiver_ad = AdFactory(user=sender), AdFactory(user=receiver)
+
+    def propose():
+        client = APIClient()
+        client.force_authenticate(user=sender)
+        return client.post(
+            f"/api/v1/propose/{receiver.id}/",
+            {"ad_sender": sender_ad.id, "ad_receiver": receiver_ad.id,
+             "comment": "c"}, format="json")
+
+    def accept(exchange_id):
+        client = APIClient()
+        client.force_authenticate(user=receiver)
+        return client.put(f"/api/v1/exchanges/{exchange_id}/",
+                          {"status": "accepted"}, format="json")
+
+    async def listen(user):
+        client = AsyncClient()
+        await client.aforce_login(user)
+        response = await client.get(EVENTS_URL)
+        assert response["Content-Type"] == "text/event-stream"
+        stream = aiter(response.streaming_content)
+        assert await anext(stream) == b"retry: 3000\n\n"
+        return stream
+
+    async def scenario():
+        streams = [await listen(sender), await listen(receiver)]
+        assert (await sync_to_async(propose)()).status_code == 201
+        exchange = await ExchangeProposal.objects.aget()
+        created = (EXCHANGE_CREATED, {
+            "id": exchange.id, "status": "pending",
+            "ad_sender": sender_ad.id, "ad_receiver": receiver_ad.id})
+        for stream in streams:
+            chunk = await asyncio.wait_for(anext(stream), 5)
+            assert parse_event(chunk) == created
+
+        assert (await sync_to_async(accept)(exchange.id)).status_code == 201
+        for stream in streams:
+            chunk = await asyncio.wait_for(anext(stream), 5)
+            assert parse_event(chunk) == (
+                EXCHANGE_STATUS, {"id": exchange.id, "status": "accepted"})
+
+    async_to_sync(scenario)()
+
+
+@pytest.mark.django_db
+def test_exchange_events_require_authentication():
+    response = async_to_sync(AsyncClient().get)(EVENTS_URL)
+    assert response.status_code == 403
+
+
+@pytest.mark.django_db
+def test_exchange_events_not_served_under_wsgi():
+    client = APIClient()
+    client.force_login(UserFactory())
+    response = client.get(EVENTS_URL)
+    assert response.status_code == 501
+    assert not response.streaming
+
+
+@override_settings(EXCHANGE_EVENTS_BUFFER_SIZE=2)
+def test_exchange_events_disconnect_slow_consumer():
+    async def scenario():
+        stream = stream_events(1)
+        await anext(stream)
+        other = stream_events(2)
+        await anext(other)
+        for i in range(3):
+            await asyncio.to_thread(publish, [1], EXCHANGE_STATUS, {"id": i})
+        publish([2], EXCHANGE_STATUS, {"id": 0})
+        await asyncio.sleep(0)
+        assert await anext(stream) == 'event: overflow\ndata: {}\n\n'
+        with pytest.raises(StopAsyncIteration):
+            await anext(stream)
+        assert set(get_broker().subscriptions) == {2}
+        assert await anext(other) == (
+            'event: exchange.status\ndata: {"id": 0}\n\n')
+        await other.aclose()
+        assert not get_broker().subscriptions
+
+    async_to_sync(scenario)()
@@ -0,0 +1,286 @@
+import threading
+from collections import Counter
+
+import pytest
+from django.core.management import CommandError, call_command
+from django.db import connections
+from rest_framework.test import APIClient
+
+from .factories import AdFactory, UserFactory
+from ..exchanges import count_exchanges, exchanges_superseded
+from ..models import ExchangeCounter, ExchangeProposal
+
+
+def create_exchange():
+    sender, receiver = UserFactory.create_batch(2)
+    return ExchangeProposal.objects.create(
+        ad_sender=AdFactory(user=sender), ad_receiver=AdFactory(user=receiver),
+        comment="comment")
+
+
+def client_for(user):
+    client = APIClient()
+    client.force_authenticate(user=user)
+    return client
+
+
+@pytest.mark.django_db
+def test_exchange_transition(django_assert_num_queries):
+    exchange = create_exchange()
+    receiver = client_for(exchange.ad_receiver.user)
+    url = f"/api/v1/exchanges/{exchange.id}/"
+    # savepoint, ad locks, conditional update, release,
+    # proposal with ads, categories of both ads
+    with django_assert_num_queries(7):
+        response = receiver.put(url, {"status": "accepted"}, format="json")
+    assert response.status_code == 201
+    assert response.data["status"] == "accepted"
+
+    response = receiver.put(url, {"status": "rejected"}, format="json")
+    assert response.status_code == 409
+    assert response.data == {"error": "Exchange is already accepted!"}
+    exchange.refresh_from_db()
+    assert exchange.status == "accepted"
+
+
+@pytest.mark.django_db
+def test_exchange_transition_errors():
+    exchange = create_exchange()
+    url = f"/api/v1/exchanges/{exchange.id}/"
+    sender = client_for(exchange.ad_sender.user)
+    receiver = client_for(exchange.ad_receiver.user)
+    response = sender.put(url, {"status": "accepted"}, format="json")
+    assert response.status_code == 400
+    assert response.data == {"error": "You may not change status!"}
+    for data in ({"status": "pending"}, {"status": "unknown"},
+                 [{"status": "accepted"}], "accepted"):
+        response = receiver.put(url, data, format="json")
+        assert response.status_code == 400
+    response = receiver.put(f"/api/v1/exchanges/{exchange.id + 1}/",
+                            {"status": "accepted"}, format="json")
+    assert response.status_code == 404
+    exchange.refresh_from_db()
+    assert exchange.status == "pending"
+
+
+@pytest.mark.django_db
+def test_exchange_accept_supersedes_competing_proposals(
+        django_capture_on_commit_callbacks):
+    exchange = create_exchange()
+    sender_ad, receiver_ad = exchange.ad_sender, exchange.ad_receiver
+    other_ad, unrelated_ad = AdFactory.create_batch(2)
+    competing = [
+        ExchangeProposal.objects.create(
+            ad_sender=other_ad, ad_receiver=receiver_ad, comment="c"),
+        ExchangeProposal.objects.create(
+            ad_sender=sender_ad, ad_receiver=other_ad, comment="c"),
+        ExchangeProposal.objects.create(
+            ad_sender=receiver_ad, ad_receiver=unrelated_ad, comment="c"),
+    ]
+    rejected = ExchangeProposal.objects.create(
+        ad_sender=unrelated_ad, ad_receiver=sender_ad, comment="c",
+        status="rejected")
+    untouched = ExchangeProposal.objects.create(
+        ad_sender=other_ad, ad_receiver=unrelated_ad, comment="c")
+    events = []
+
+    def receiver(sender, accepted, ids, **kwargs):
+        events.append((accepted, ids))
+
+    exchanges_superseded.connect(receiver)
+    try:
+        with django_capture_on_commit_callbacks(execute=True):
+            response = client_for(receiver_ad.user).put(
+                f"/api/v1/exchanges/{exchange.id}/", {"status": "accepted"},
+                format="json")
+    finally:
+        exchanges_superseded.disconnect(receiver)
+    assert response.status_code == 201
+    assert events == [
+        (exchange.id, sorted(proposal.id for proposal in competing))]
+    statuses = dict(ExchangeProposal.objects.values_list("id", "status"))
+    assert statuses[exchange.id] == "accepted"
+    assert all(statuses[proposal.id] == "superseded"
+               for proposal in competing)
+    assert statuses[rejected.id] == "rejected"
+    assert statuses[untouched.id] == "pending"
+    response = client_for(other_ad.user).put(
+        f"/api/v1/exchanges/{competing[1].id}/", {"status": "accepted"},
+        format="json")
+    assert response.status_code == 409
+
+
+@pytest.mark.django_db
+def test_exchange_batch_transition(django_assert_num_queries):
+    receiver = UserFactory()
+    receiver_ads = AdFactory.create_batch(3, user=receiver)
+    first, competing, rejected, closed = [
+        ExchangeProposal.objects.create(
+            ad_sender=AdFactory(), ad_receiver=ad, comment="c")
+        for ad in (receiver_ads[0], receiver_ads[0], receiver_ads[1],
+                   receiver_ads[2])]
+    ExchangeProposal.objects.filter(id=closed.id).update(status="rejected")
+    foreign = create_exchange()
+    data = [
+        {"id": first.id, "status": "accepted"},
+        {"id": competing.id, "status": "accepted"},
+        {"id": rejected.id, "status": "rejected"},
+        {"id": closed.id, "status": "accepted"},
+        {"id": foreign.id, "status": "rejected"},
+        {"id": foreign.id + 1000, "status": "rejected"},
+    ]
+    client = client_for(receiver)
+    # ownership, savepoint, rejects, ad locks, accepts, release
+    with django_assert_num_queries(6):
+        response = client.post("/api/v1/exchanges/batch/", data,
+                               format="json")
+    assert response.status_code == 200
+    assert response.data == [
+        {"id": first.id, "outcome": "updated", "status": "accepted"},
+        {"id": competing.id, "outcome": "conflict", "status": "superseded"},
+        {"id": rejected.id, "outcome": "updated", "status": "rejected"},
+        {"id": closed.id, "outcome": "conflict", "status": "rejected"},
+        {"id": foreign.id, "outcome": "not_receiver", "status": None},
+        {"id": foreign.id + 1000, "outcome": "not_found", "status": None},
+    ]
+    statuses = dict(ExchangeProposal.objects.values_list("id", "status"))
+    assert statuses == {first.id: "accepted", competing.id: "superseded",
+                        rejected.id: "rejected", closed.id: "rejected",
+                        foreign.id: "pending"}
+
+
+@pytest.mark.django_db
+def test_exchange_batch_transition_validation():
+    exchange = create_exchange()
+    client = client_for(exchange.ad_receiver.user)
+    url = "/api/v1/exchanges/batch/"
+    for data in ([], [{"id": exchange.id, "status": "pending"}],
+                 [{"id": exchange.id, "status": "accepted"},
+                  {"id": exchange.id, "status": "rejected"}]):
+        response = client.post(url, data, format="json")
+        assert response.status_code == 400
+    exchange.refresh_from_db()
+    assert exchange.status == "pending"
+
+
+def summary(pending=0, accepted=0, rejected=0, superseded=0):
+    return {"accepted": accepted, "rejected": rejected, "pending": pending,
+            "superseded": superseded}
+
+
+@pytest.mark.django_db
+def test_exchange_summary(django_assert_num_queries):
+    sender, receiver = UserFactory.create_batch(2)
+    sender_ads = AdFactory.create_batch(3, user=sender)
+    receiver_ad = AdFactory(user=receiver)
+    exchanges = ExchangeProposal.objects.bulk_create(
+        ExchangeProposal(ad_sender=ad, ad_receiver=receiver_ad, comment="c")
+        for ad in sender_ads)
+    reverse = ExchangeProposal.objects.create(
+        ad_sender=receiver_ad, ad_receiver=sender_ads[0], comment="c")
+    client = client_for(receiver)
+    with django_assert_num_queries(1):
+        response = client.get("/api/v1/exchanges/summary/")
+    assert response.data == {"sent": summary(pending=1),
+                             "received": summary(pending=3)}
+
+    client.post("/api/v1/exchanges/batch/",
+                [{"id": exchanges[0].id, "status": "accepted"},
+                 {"id": exchanges[1].id, "status": "rejected"}],
+                format="json")
+    reverse.delete()
+    assert client.get("/api/v1/exchanges/summary/").data == {
+        "sent": summary(),
+        "received": summary(accepted=1, rejected=1, superseded=1)}
+    assert client_for(sender).get("/api/v1/exchanges/summary/").data == {
+        "sent": summary(accepted=1, rejected=1, superseded=1),
+        "received": summary()}
+    sender_ads[2].delete()
+    assert client.get("/api/v1/exchanges/summary/").data[
+        "received"] == summary(accepted=1, rejected=1)
+
+
+@pytest.mark.django_db
+def test_rebuild_exchange_counters():
+    exchange = create_exchange()
+    create_exchange()
+    call_command("rebuild_exchange_counters", "--check")
+    ExchangeCounter.objects.filter(
+        user=exchange.ad_receiver.user).update(count=5)
+    ExchangeCounter.objects.filter(user=exchange.ad_sender.user).delete()
+    with pytest.raises(CommandError, match="2 counters drifted"):
+        call_command("rebuild_exchange_counters", "--check")
+    call_command("rebuild_exchange_counters")
+    call_command("rebuild_exchange_counters", "--check")
+    assert {
+        (counter.user_id, counter.direction, counter.status): counter.count
+        for counter in ExchangeCounter.objects.all()} == count_exchanges()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_exchange_concurrent_transitions():
+    exchange = create_exchange()
+    receiver = exchange.ad_receiver.user
+    url = f"/api/v1/exchanges/{exchange.id}/"
+    threads_count = 8
+    barrier = threading.Barrier(threads_count)
+    results = []
+
+    def transition(status):
+        client = client_for(receiver)
+        try:
+            barrier.wait()
+            response = client.put(url, {"status": status}, format="json")
+            results.append((response.status_code,
+                            response.data.get("status", status)))
+        finally:
+            connections.close_all()
+
+    threads = [
+        threading.Thread(target=transition,
+                         args=("accepted" if i % 2 else "rejected",))
+        for i in range(threads_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    codes = Counter(code for code, _ in results)
+    assert codes == {201: 1, 409: threads_count - 1}
+    winner = next(status for code, status in results if code == 201)
+    exchange.refresh_from_db()
+    assert exchange.status == winner
+
+
+@pytest.mark.django_db(transaction=True)
+def test_exchange_concurrent_competing_accepts():
+    exchange = create_exchange()
+    receiver_ad = exchange.ad_receiver
+    exchanges = [exchange] + [
+        ExchangeProposal.objects.create(
+            ad_sender=AdFactory(), ad_receiver=receiver_ad, comment="c")
+        for _ in range(5)]
+    barrier = threading.Barrier(len(exchanges))
+    results = []
+
+    def accept(exchange_id):
+        client = client_for(receiver_ad.user)
+        try:
+            barrier.wait()
+            response = client.put(f"/api/v1/exchanges/{exchange_id}/",
+                                  {"status": "accepted"}, format="json")
+            results.append(response.status_code)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=accept, args=(exchange.id,))
+               for exchange in exchanges]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert Counter(results) == {201: 1, 409: len(exchanges) - 1}
+    assert Counter(ExchangeProposal.objects.values_list(
+        "status", flat=True)) == {"accepted": 1,
+                                  "superseded": len(exchanges) - 1}
@@ -0,0 +1,84 @@
+import pytest
+
+from .factories import AdFactory, CategoryFactory, ConditionFactory
+from ..models import Ad
+from ..references import load_references
+
+
+def counts(facets):
+    return {item["slug"]: item["count"] for item in facets}
+
+
+@pytest.mark.django_db
+def test_filtered_facets(api_client, django_assert_num_queries):
+    first, second, other = CategoryFactory.create_batch(3)
+    new, used = ConditionFactory.create_batch(2)
+    both = AdFactory(category=[first, second], condition=new)
+    AdFactory(category=[first], condition=used)
+    AdFactory(category=[second], condition=None)
+    AdFactory(category=[other], condition=new)
+    load_references()
+    url = (f"/api/v1/ads/?category__slug__in={first.slug},{second.slug}"
+           f"&facets=category,condition")
+
+    # cards, facet counts
+    with django_assert_num_queries(2):
+        response = api_client.get(url)
+    assert response.status_code == 200
+    assert len(response.data["results"]) == 3
+    assert counts(response.data["facets"]["category"]) == {
+        first.slug: 2, second.slug: 2}
+    assert counts(response.data["facets"]["condition"]) == {
+        new.slug: 1, used.slug: 1}
+    assert response.data["facets"]["condition"][0].keys() == {
+        "id", "title", "slug", "count"}
+
+    response = api_client.get(
+        f"/api/v1/ads/?limit=1&condition__slug__in={new.slug},missing"
+        f"&facets=condition")
+    assert response.data["count"] == 2
+    assert response.data["facets"] == {
+        "condition": [{"id": new.id, "title": new.title, "slug": new.slug,
+                       "count": 2}]}
+    assert both.id in [ad["id"] for ad in api_client.get(
+        f"/api/v1/ads/?category__slug__in={second.slug}").data]
+
+    response = api_client.get("/api/v1/ads/?category__slug__in=missing"
+                              "&facets=true")
+    assert response.data == {"results": [],
+                             "facets": {"category": [], "condition": []}}
+
+
+@pytest.mark.django_db
+def test_unfiltered_facets(api_client, django_assert_num_queries,
+                           django_capture_on_commit_callbacks):
+    first, second = CategoryFactory.create_batch(2)
+    new, used = ConditionFactory.create_batch(2)
+    ad = AdFactory(category=[first], condition=new)
+    load_references()
+    url = "/api/v1/ads/?limit=10&facets=true"
+
+    response = api_client.get(url)
+    assert counts(response.data["facets"]["category"]) == {first.slug: 1}
+    assert counts(response.data["facets"]["condition"]) == {new.slug: 1}
+
+    with django_capture_on_commit_callbacks(execute=True):
+        AdFactory(category=[first, second], condition=used)
+        ad.category.remove(first)
+        ad.category.add(second)
+        ad = Ad.objects.get(pk=ad.pk)
+        ad.condition = used
+        ad.save()
+    # size estimate, count, cards page
+    with django_assert_num_queries(3):
+        response = api_client.get(url)
+    assert counts(response.data["facets"]["category"]) == {
+        first.slug: 1, second.slug: 2}
+    assert counts(response.data["facets"]["condition"]) == {used.slug: 2}
+
+    with django_capture_on_commit_callbacks(execute=True):
+        ad.delete()
+    response = api_client.get(url)
+    assert counts(response.data["facets"]["category"]) == {
+        first.slug: 1, second.slug: 1}
+    assert counts(response.data["facets"]["condition"]) == {used.slug: 1}
@@ -0,0 +1,68 @@
+import pytest
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from .factories import AdFactory, CategoryFactory, UserFactory
+from ..fast_serializers import (CompiledAdSerializer,
+                                CompiledExchangeListSerializer)
+from ..models import Ad, ExchangeProposal
+from ..references import load_references
+from ..serializers import AdSerializer, ExchangeListSerializer
+
+
+def render(data):
+    return JSONRenderer().render(data)
+
+
+def contexts():
+    request = APIRequestFactory().get("/api/v1/ads/", HTTP_HOST="testserver")
+    return [{}, {"request": request},
+            {"request": request, "image_variants": ("thumb", "medium")}]
+
+
+def create_ads():
+    categories = CategoryFactory.create_batch(3)
+    user = UserFactory()
+    ads = [
+        AdFactory(user=user, category=categories),
+        AdFactory(user=user, condition=None, category=categories[:1]),
+        AdFactory(category=categories[1:]),
+    ]
+    Ad.objects.filter(id=ads[0].id).update(
+        image_status="ready",
+        image_variants={"thumb": "ads/variants/a.webp",
+                        "medium": "ads/variants/b.webp",
+                        "full": "ads/variants/c.webp"})
+    Ad.objects.filter(id=ads[1].id).update(image_url="")
+    return ads
+
+
+@pytest.mark.django_db
+def test_compiled_ad_serializer_parity():
+    create_ads()
+    load_references()
+    ads = list(Ad.objects.with_relations().order_by("id"))
+    for context in contexts():
+        assert render(CompiledAdSerializer(
+            ads, many=True, context=context).data) == render(
+            AdSerializer(ads, many=True, context=context).data)
+        for ad in ads:
+            assert render(CompiledAdSerializer(
+                ad, context=context).data) == render(
+                AdSerializer(ad, context=context).data)
+
+
+@pytest.mark.django_db
+def test_compiled_exchange_serializer_parity():
+    ads = create_ads()
+    ExchangeProposal.objects.create(
+        ad_sender=ads[0], ad_receiver=ads[2], comment="first")
+    ExchangeProposal.objects.create(
+        ad_sender=ads[1], ad_receiver=ads[2], comment="", status="rejected")
+    exchanges = list(ExchangeProposal.objects.with_ads().order_by("id"))
+    for context in contexts():
+        assert render(CompiledExchangeListSerializer(
+            exchanges, many=True, context=context).data) == render(
+            ExchangeListSerializer(exchanges, many=True, context=context).data)
+    assert render(CompiledExchangeListSerializer(exchanges[0]).data) == (
+        render(ExchangeListSerializer(exchanges[0]).data))
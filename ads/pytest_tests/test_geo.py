@@ -0,0 +1,79 @@
+import math
+import random
+
+import pytest
+
+from .factories import AdFactory, CategoryFactory, UserFactory
+from ..geo import (KM_PER_DEGREE, encode_geohash, geohash_cell,
+                   search_prefixes)
+from ..models import AdCard
+from ..references import load_references
+
+
+def test_search_prefixes_cover_radius():
+    assert encode_geohash(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    assert geohash_cell(5) == (180 / 2 ** 12, 360 / 2 ** 13)
+    rng = random.Random(0)
+    for _ in range(200):
+        latitude = rng.uniform(-80, 80)
+        longitude = rng.uniform(-180, 180)
+        radius = rng.choice([1, 5, 25, 100, 500])
+        prefixes = tuple(search_prefixes(latitude, longitude, radius))
+        bearing = rng.uniform(0, 2 * math.pi)
+        lat = latitude + math.cos(bearing) * radius / KM_PER_DEGREE
+        lon = longitude + (math.sin(bearing) * radius / KM_PER_DEGREE
+                           / math.cos(math.radians(lat)))
+        lon = (lon + 180) % 360 - 180
+        assert encode_geohash(lat, lon).startswith(prefixes)
+    assert search_prefixes(89.9, 0, 50) == []
+
+
+@pytest.mark.django_db
+def test_ads_near(api_client, django_assert_num_queries):
+    category = CategoryFactory()
+    owner = UserFactory(latitude=55.65, longitude=37.5)
+    center = AdFactory(latitude=55.7522, longitude=37.6156,
+                       category=[category])
+    nearby = AdFactory(latitude=55.8422, longitude=37.6156)
+    remote = AdFactory(latitude=59.9386, longitude=30.3141,
+                       category=[category])
+    fallback = AdFactory(user=owner, category=[category])
+    AdFactory(user=UserFactory())
+    load_references()
+    url = "/api/v1/ads/?near=55.7522,37.6156&radius=20&limit=10"
+
+    # count, cards page
+    with django_assert_num_queries(2):
+        response = api_client.get(url)
+    assert response.data["count"] == 3
+    results = response.data["results"]
+    assert [ad["id"] for ad in results] == [center.id, nearby.id,
+                                            fallback.id]
+    assert [ad["distance"] for ad in results[:2]] == [0.0, 10.008]
+    assert results[2]["latitude"] is None
+    assert [ad["id"] for ad in api_client.get(
+        url + f"&offset=1&category__slug={category.slug}"
+    ).data["results"]] == [fallback.id]
+    assert api_client.get(
+        "/api/v1/ads/?near=55.7522,37.6156&radius=1000&limit=10"
+    ).data["count"] == 4
+
+    api_client.force_authenticate(user=owner)
+    response = api_client.put("/api/v1/users/location/",
+                              {"latitude": 59.9, "longitude": 30.3})
+    assert response.status_code == 200
+    assert AdCard.objects.get(ad=fallback).geohash.startswith("udt")
+    assert {ad["id"] for ad in api_client.get(
+        "/api/v1/ads/?radius=10").data} == {fallback.id, remote.id}
+    assert "distance" not in api_client.get("/api/v1/ads/").data[0]
+
+    for query in ("near=91,0", "near=abc", "near=1,2&radius=0",
+                  "near=1,2&radius=5000"):
+        assert api_client.get(f"/api/v1/ads/?{query}").status_code == 400
+    response = api_client.post("/api/v1/ads/", {
+        "title": "ad", "description": "description", "image_url": None,
+        "condition": center.condition_id, "category": [category.id],
+        "latitude": 55.75}, format="json")
+    assert response.status_code == 400
+    assert response.data["non_field_errors"] == [
+        "Latitude and longitude must be set together."]
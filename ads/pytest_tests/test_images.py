@@ -0,0 +1,264 @@
+import base64
+import time
+from io import BytesIO
+
+import pytest
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
+from rest_framework.test import APIClient
+
+from .factories import AdFactory
+from ..images import VARIANT_DIR, process_image, store_processed_image
+from ..models import Ad, ExchangeProposal, ImageUpload
+
+
+def image_data_uri(size=(3000, 1000), image_format="JPEG", exif=True):
+    image = Image.new("RGB", size, color="blue")
+    buffer = BytesIO()
+    kwargs = {}
+    if exif:
+        image_exif = Image.Exif()
+        image_exif[0x010F] = "Phone maker"
+        image_exif[0x0112] = 6
+        kwargs["exif"] = image_exif
+    image.save(buffer, format=image_format, **kwargs)
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f"data:image/{image_format.lower()};base64,{encoded}"
+
+
+def ad_payload(category, condition, image):
+    return {
+        "title": "Camera",
+        "description": "Old camera",
+        "image_url": image,
+        "category": [category.id],
+        "condition": condition.id,
+    }
+
+
+@pytest.mark.django_db
+def test_image_processed_after_upload(authenticated_client, category,
+                                      condition, settings,
+                                      django_capture_on_commit_callbacks):
+    settings.IMAGE_PROCESSING_WORKERS = 0
+    with django_capture_on_commit_callbacks(execute=True):
+        response = authenticated_client.post(
+            "/api/v1/ads/", ad_payload(category, condition, image_data_uri()),
+            format="json")
+    assert response.status_code == 201
+    assert response.data["image_status"] == "pending"
+    ad = Ad.objects.get(id=response.data["id"])
+    assert ad.image_status == "ready"
+    with default_storage.open(ad.image_url.name) as file:
+        image = Image.open(file)
+        assert image.size == (683, 2048)
+        assert not image.getexif()
+    assert set(ad.image_variants) == {"thumb", "medium", "full"}
+    for variant, size in (("thumb", 320), ("medium", 800), ("full", 2048)):
+        with default_storage.open(ad.image_variants[variant]) as file:
+            image = Image.open(file)
+            assert image.format == "WEBP"
+            assert max(image.size) == size
+
+
+@pytest.mark.django_db
+def test_image_variants_per_endpoint(authenticated_client, category,
+                                     condition, user_factory, settings,
+                                     django_capture_on_commit_callbacks):
+    settings.IMAGE_PROCESSING_WORKERS = 0
+    with django_capture_on_commit_callbacks(execute=True):
+        response = authenticated_client.post(
+            "/api/v1/ads/", ad_payload(category, condition, image_data_uri()),
+            format="json")
+    ad = Ad.objects.get(id=response.data["id"])
+    list_response = authenticated_client.get("/api/v1/ads/")
+    detail_response = authenticated_client.get(f"/api/v1/ads/{ad.id}/")
+    assert set(list_response.data[0]["image_variants"]) == {"thumb", "medium"}
+    assert set(detail_response.data["image_variants"]) == {
+        "thumb", "medium", "full"}
+    thumb_url = detail_response.data["image_variants"]["thumb"]
+    assert thumb_url.startswith("http://testserver/media/ads/variants/")
+
+    receiver_ad = AdFactory()
+    ExchangeProposal.objects.create(
+        ad_sender=ad, ad_receiver=receiver_ad, comment="comment")
+    exchanges = authenticated_client.get("/api/v1/exchanges/sended/")
+    assert exchanges.data[0]["sender_ad_image_variants"] == {
+        "thumb": f"/media/{ad.image_variants['thumb']}"}
+    assert exchanges.data[0]["receiver_ad_image_variants"] == {}
+    assert thumb_url.endswith(
+        default_storage.url(ad.image_variants["thumb"]))
+    assert default_storage.exists(ad.image_variants["thumb"])
+
+
+@pytest.mark.django_db
+def test_image_processing_failure(authenticated_client, category, condition,
+                                  settings,
+                                  django_capture_on_commit_callbacks):
+    settings.IMAGE_PROCESSING_WORKERS = 0
+    truncated = base64.b64encode(b"\x89PNG\r\n\x1a\n" + b"0" * 64).decode()
+    with django_capture_on_commit_callbacks(execute=True):
+        response = authenticated_client.post(
+            "/api/v1/ads/", ad_payload(
+                category, condition, f"data:image/png;base64,{truncated}"),
+            format="json")
+    assert response.status_code == 201
+    assert Ad.objects.get(id=response.data["id"]).image_status == "failed"
+
+
+@pytest.mark.django_db
+def test_processed_image_replaces_original_last():
+    ad = AdFactory()
+    original = ad.image_url.name
+    directory = original.rsplit("/", 1)[0]
+    with default_storage.open(original) as file:
+        result = process_image(file.read())
+    Ad.objects.filter(id=ad.id).update(image_url="ads/images/other.jpg")
+    files = default_storage.listdir(directory)[1]
+    assert not store_processed_image(ad.id, original, result)
+    assert default_storage.listdir(directory)[1] == files
+    assert default_storage.listdir(VARIANT_DIR)[1] == []
+    assert Ad.objects.get(id=ad.id).image_url.name == "ads/images/other.jpg"
+
+    Ad.objects.filter(id=ad.id).update(image_url=original)
+    assert store_processed_image(ad.id, original, result)
+    ad.refresh_from_db()
+    assert ad.image_url.name != original
+    assert ad.image_status == "ready"
+    assert default_storage.exists(ad.image_url.name)
+    assert not default_storage.exists(original)
+    assert all(map(default_storage.exists, ad.image_variants.values()))
+
+
+@pytest.mark.django_db
+def test_clear_image_variants():
+    ad, other = AdFactory.create_batch(2)
+    with default_storage.open(ad.image_url.name) as file:
+        result = process_image(file.read())
+    for item in (ad, other):
+        store_processed_image(item.id, item.image_url.name, result)
+    ad.refresh_from_db()
+    variants = set(ad.image_variants.values())
+    Ad.objects.filter(id=other.id).update(image_variants={})
+    call_command("clear_image_variants")
+    assert all(map(default_storage.exists, variants))
+
+    call_command("clear_image_variants", "--hours", "0")
+    assert all(map(default_storage.exists, variants))
+    ad.delete()
+    call_command("clear_image_variants", "--hours", "0")
+    assert not any(map(default_storage.exists, variants))
+
+
+@pytest.mark.django_db
+def test_non_image_upload_rejected(authenticated_client, category,
+                                   condition):
+    payload = base64.b64encode(b"#!/bin/sh\necho hello").decode()
+    response = authenticated_client.post(
+        "/api/v1/ads/", ad_payload(
+            category, condition, f"data:image/png;base64,{payload}"),
+        format="json")
+    invalid_response = authenticated_client.post(
+        "/api/v1/ads/", ad_payload(
+            category, condition, "data:image/png;base64,???"),
+        format="json")
+    assert response.status_code == 400
+    assert invalid_response.status_code == 400
+    assert "image_url" in response.data
+
+
+@pytest.mark.django_db(transaction=True)
+def test_image_processed_in_worker_pool(authenticated_client, category,
+                                        condition, settings):
+    settings.IMAGE_PROCESSING_WORKERS = 1
+    response = authenticated_client.post(
+        "/api/v1/ads/",
+        ad_payload(category, condition, image_data_uri(exif=False)),
+        format="json")
+    assert response.status_code == 201
+    deadline = time.monotonic() + 60
+    ad = Ad.objects.get(id=response.data["id"])
+    while ad.image_status == "pending" and time.monotonic() < deadline:
+        time.sleep(0.1)
+        ad.refresh_from_db()
+    assert ad.image_status == "ready"
+    assert ad.image_variants["thumb"].endswith(".webp")
+
+
+def image_file(size=(1200, 800), name="photo.jpg"):
+    image = Image.new("RGB", size, color="green")
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG")
+    return SimpleUploadedFile(name, buffer.getvalue(),
+                              content_type="image/jpeg")
+
+
+@pytest.mark.django_db
+def test_streaming_upload_attached_to_ad(authenticated_client, category,
+                                         condition, settings,
+                                         django_capture_on_commit_callbacks):
+    settings.IMAGE_PROCESSING_WORKERS = 0
+    response = authenticated_client.post(
+        "/api/v1/uploads/", {"file": image_file()}, format="multipart")
+    assert response.status_code == 201
+    assert response.data["handle"] == f"upload:{response.data['id']}"
+    with django_capture_on_commit_callbacks(execute=True):
+        ad_response = authenticated_client.post(
+            "/api/v1/ads/",
+            ad_payload(category, condition, response.data["handle"]),
+            format="json")
+    assert ad_response.status_code == 201
+    ad = Ad.objects.get(id=ad_response.data["id"])
+    assert ad.image_url.name.startswith("ads/uploads/")
+    assert ad.image_status == "ready"
+    assert not ImageUpload.objects.exists()
+    reused_response = authenticated_client.post(
+        "/api/v1/ads/",
+        ad_payload(category, condition, response.data["handle"]),
+        format="json")
+    assert reused_response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_raw_streaming_upload(authenticated_client):
+    response = authenticated_client.generic(
+        "POST", "/api/v1/uploads/", image_file().read(),
+        content_type="image/jpeg",
+        HTTP_CONTENT_DISPOSITION="attachment; filename=photo.jpg")
+    assert response.status_code == 201
+
+
+@pytest.mark.django_db
+def test_upload_size_limits(authenticated_client, settings):
+    file = image_file()
+    settings.IMAGE_UPLOAD_MAX_SIZE = file.size // 2
+    response = authenticated_client.post(
+        "/api/v1/uploads/", {"file": file}, format="multipart")
+    assert response.status_code == 413
+    file.seek(0)
+    settings.IMAGE_UPLOAD_MAX_SIZE = file.size - 100
+    response = authenticated_client.post(
+        "/api/v1/uploads/", {"file": file}, format="multipart")
+    assert response.status_code == 413
+    assert not ImageUpload.objects.exists()
+
+
+@pytest.mark.django_db
+def test_upload_rejects_non_images_and_foreign_handles(
+        authenticated_client, user_factory, category, condition):
+    text = SimpleUploadedFile("notes.jpg", b"plain text, not an image")
+    response = authenticated_client.post(
+        "/api/v1/uploads/", {"file": text}, format="multipart")
+    assert response.status_code == 400
+    upload = ImageUpload.objects.create(
+        user=user_factory(), file=image_file())
+    response = authenticated_client.post(
+        "/api/v1/ads/",
+        ad_payload(category, condition, f"upload:{upload.id}"),
+        format="json")
+    assert response.status_code == 400
+    assert APIClient().post(
+        "/api/v1/uploads/", {"file": image_file()},
+        format="multipart").status_code == 403
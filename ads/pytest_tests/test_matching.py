@@ -0,0 +1,85 @@
+import pytest
+from django.core.management import CommandError, call_command
+
+from .factories import (AdFactory, CategoryFactory, ConditionFactory,
+                        UserFactory)
+from ..models import Ad, ExchangeProposal, MatchPosting
+from ..references import load_references
+
+
+@pytest.mark.django_db
+def test_ad_matches(api_client, django_assert_num_queries):
+    first, second, other = CategoryFactory.create_batch(3)
+    condition = ConditionFactory()
+    user = UserFactory()
+    ad = AdFactory(user=user, category=[first, second], condition=condition)
+    AdFactory(user=user, category=[first, second], condition=condition)
+    best = AdFactory(category=[first, second], condition=condition)
+    partial = AdFactory(category=[first], condition=condition)
+    no_condition = AdFactory(category=[first, second], condition=None)
+    AdFactory(category=[other], condition=condition)
+    load_references()
+    url = f"/api/v1/ads/{ad.id}/matches/"
+
+    # ad, candidates, pair history, owner counters, ads, categories
+    with django_assert_num_queries(6):
+        response = api_client.get(url)
+    assert response.status_code == 200
+    assert [match["ad"]["id"] for match in response.data] == [
+        best.id, no_condition.id, partial.id]
+    assert [match["score"] for match in response.data] == [
+        1.25, 1.0, round(2 ** -0.5 + 0.25, 6)]
+    assert response.data[0]["ad"]["category"][0]["id"] == first.id
+
+    for own_ad in AdFactory.create_batch(2, user=user, category=[other]):
+        ExchangeProposal.objects.create(
+            ad_sender=own_ad,
+            ad_receiver=AdFactory(user=partial.user, category=[other]),
+            comment="c", status="accepted")
+    response = api_client.get(f"{url}?limit=1")
+    assert [match["ad"]["id"] for match in response.data] == [partial.id]
+
+    assert api_client.get("/api/v1/ads/0/matches/").status_code == 404
+    assert api_client.get("/api/v1/ads/abc/matches/").status_code == 404
+
+
+def expected_postings():
+    postings = set()
+    for ad in Ad.objects.prefetch_related("adcategory_set"):
+        categories = set(ad.category_ids)
+        for category in categories:
+            postings.add((category, ad.id, ad.user_id, ad.condition_id,
+                          round(len(categories) ** -0.5, 9)))
+    return postings
+
+
+def actual_postings():
+    return {(category, ad, user, condition, round(weight, 9))
+            for category, ad, user, condition, weight in
+            MatchPosting.objects.values_list(
+                "category", "ad", "user", "condition", "weight")}
+
+
+@pytest.mark.django_db
+def test_match_index_maintained():
+    categories = CategoryFactory.create_batch(3)
+    ads = [AdFactory(category=categories[:2]), AdFactory()]
+    assert actual_postings() == expected_postings()
+
+    ads[0].category.set(categories[1:])
+    ads[1].category.add(*categories)
+    Ad.objects.filter(id=ads[0].id).update(condition=None,
+                                           user=ads[1].user)
+    ads[1].condition.delete()
+    categories[2].delete()
+    assert actual_postings() == expected_postings()
+    ads[1].delete()
+    assert actual_postings() == expected_postings()
+    call_command("rebuild_match_index", "--check")
+
+    MatchPosting.objects.filter(ad=ads[0]).update(weight=0)
+    with pytest.raises(CommandError, match="2 postings drifted"):
+        call_command("rebuild_match_index", "--check")
+    call_command("rebuild_match_index")
+    call_command("rebuild_match_index", "--check")
+    assert actual_postings() == expected_postings()
@@ -0,0 +1,197 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import connection
+from .factories import UserFactory
+from ..cards import refresh_cards
+from ..models import Ad, AdCategory, Category, Condition, ExchangeProposal
+from ..references import load_references
+
+User = get_user_model()
+
+
+def create_ads(count, categories_per_ad=2):
+    users = UserFactory.create_batch(5)
+    condition, _ = Condition.objects.get_or_create(
+        title="New", defaults={"slug": "new"})
+    categories = [
+        Category.objects.get_or_create(
+            title=f"category {i}", defaults={"slug": f"category-{i}"})[0]
+        for i in range(categories_per_ad + 1)]
+    ads = Ad.objects.bulk_create(
+        Ad(user=users[i % len(users)], title=f"ad {i}",
+           description="description", condition=condition)
+        for i in range(count))
+    AdCategory.objects.bulk_create(
+        AdCategory(ad=ad, category=categories[(i + j) % len(categories)])
+        for i, ad in enumerate(ads) for j in range(categories_per_ad))
+    refresh_cards([ad.pk for ad in ads])
+    load_references()
+    return ads
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("page_size", [10, 100, 1000])
+def test_ads_list_query_count(api_client, django_assert_num_queries,
+                              page_size):
+    create_ads(page_size)
+    # size estimate, count, cards page
+    with django_assert_num_queries(3):
+        response = api_client.get(f"/api/v1/ads/?limit={page_size}")
+    assert response.status_code == 200
+    assert len(response.data["results"]) == page_size
+    assert len(response.data["results"][0]["category"]) == 2
+    assert response.data["results"][0]["condition"]["slug"] == "new"
+    assert response.data["results"][0]["user"]["username"]
+    with django_assert_num_queries(1):
+        api_client.get(f"/api/v1/ads/?limit={page_size}")
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("page_size", [10, 100, 1000])
+def test_ads_unpaginated_list_query_count(api_client,
+                                          django_assert_num_queries,
+                                          page_size):
+    create_ads(page_size)
+    with django_assert_num_queries(1):
+        response = api_client.get("/api/v1/ads/")
+    assert response.status_code == 200
+    assert len(response.data) == page_size
+
+
+@pytest.mark.django_db
+def test_ad_retrieve_query_count(api_client, django_assert_num_queries):
+    ad = create_ads(1, categories_per_ad=5)[0]
+    with django_assert_num_queries(2):
+        response = api_client.get(f"/api/v1/ads/{ad.id}/")
+    assert response.status_code == 200
+    assert len(response.data["category"]) == 5
+
+
+@pytest.mark.django_db
+def test_ad_create_validation_query_count(authenticated_client,
+                                          django_assert_num_queries):
+    condition, _ = Condition.objects.get_or_create(
+        title="New", defaults={"slug": "new"})
+    categories = Category.objects.bulk_create(
+        Category(title=f"category {i}", slug=f"category-{i}")
+        for i in range(10))
+    data = {"title": "ad", "description": "description", "image_url": None,
+            "condition": condition.id,
+            "category": [category.id for category in categories]}
+    response = authenticated_client.post("/api/v1/ads/", data, format="json")
+    assert response.status_code == 201
+    # category and condition validation is served by the reference caches:
+    # ad, category set (select, select, insert), category ids,
+    # card (ad, categories, upsert)
+    with django_assert_num_queries(8):
+        response = authenticated_client.post(
+            "/api/v1/ads/", data, format="json")
+    assert response.status_code == 201
+    assert len(response.data["category"]) == 10
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("count", [10, 100])
+def test_ads_bulk_create_query_count(authenticated_client,
+                                     django_assert_num_queries, count):
+    condition, _ = Condition.objects.get_or_create(
+        title="New", defaults={"slug": "new"})
+    categories = [
+        Category.objects.create(title=f"category {i}", slug=f"category-{i}")
+        for i in range(3)]
+    data = [{"title": f"ad {i}", "description": "description",
+             "image_url": None, "condition": condition.id,
+             "category": [categories[i % 3].id, categories[(i + 1) % 3].id]}
+            for i in range(count)]
+    # categories and conditions are loaded into the reference cache once
+    # savepoint, ads, ad categories, cards (ads, categories, upsert),
+    # release, page, categories prefetch
+    with django_assert_num_queries(11):
+        response = authenticated_client.post(
+            "/api/v1/ads/bulk/", data, format="json")
+    assert response.status_code == 201
+    assert AdCategory.objects.count() == count * 2
+    data = [{"id": ad["id"], "title": f"updated {i % 2}",
+             "condition": condition.id}
+            for i, ad in enumerate(response.data)]
+    # ads, savepoint, update, cards (ads, categories, upsert), release,
+    # page, categories prefetch
+    with django_assert_num_queries(9):
+        response = authenticated_client.patch(
+            "/api/v1/ads/bulk/", data, format="json")
+    assert response.status_code == 200
+    assert Ad.objects.filter(title="updated 1").count() == count // 2
+
+
+def create_proposals(sender, receiver, count):
+    receiver_ad = create_ads(1)[0]
+    receiver_ad.user = receiver
+    receiver_ad.save()
+    sender_ads = create_ads(count)
+    Ad.objects.filter(id__in=[ad.id for ad in sender_ads]).update(
+        user=sender)
+    return ExchangeProposal.objects.bulk_create(
+        ExchangeProposal(ad_sender=ad, ad_receiver=receiver_ad,
+                         comment="comment")
+        for ad in sender_ads)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("count", [10, 100])
+def test_received_exchanges_query_count(api_client,
+                                        django_assert_num_queries, count):
+    receiver = UserFactory()
+    api_client.force_authenticate(user=receiver)
+    create_proposals(UserFactory(), receiver, count)
+    # page, sender and receiver categories prefetch
+    with django_assert_num_queries(3):
+        response = api_client.get("/api/v1/exchanges/received/")
+    assert response.status_code == 200
+    assert len(response.data) == count
+    assert len(response.data[0]["sender_ad_category"]) == 2
+    with django_assert_num_queries(4):
+        response = api_client.get("/api/v1/exchanges/received/?limit=5")
+    assert response.data["count"] == count
+    assert len(response.data["results"]) == 5
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("count", [10, 100])
+def test_sended_exchanges_query_count(api_client,
+                                      django_assert_num_queries, count):
+    sender, receiver = UserFactory.create_batch(2)
+    api_client.force_authenticate(user=sender)
+    create_proposals(sender, receiver, count)
+    with django_assert_num_queries(3):
+        response = api_client.get("/api/v1/exchanges/sended/")
+    assert response.status_code == 200
+    assert len(response.data) == count
+    assert response.data[0]["receiver_ad_user"] == receiver.id
+
+
+@pytest.mark.django_db
+def test_exchange_listings_use_composite_indexes():
+    users = User.objects.bulk_create(
+        User(username=f"user {i}") for i in range(50))
+    ads = Ad.objects.bulk_create(
+        Ad(user=users[i % len(users)], title=f"ad {i}",
+           description="description") for i in range(500))
+    ExchangeProposal.objects.bulk_create(
+        ExchangeProposal(ad_sender=ads[i], ad_receiver=ads[(i * 7 + j) % 500],
+                         comment="comment",
+                         status="pending" if j % 3 else "accepted")
+        for i in range(500) for j in range(1, 11))
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE ads_ad")
+        cursor.execute("ANALYZE ads_exchangeproposal")
+        cursor.execute("SET LOCAL enable_seqscan = off")
+    received_plan = ExchangeProposal.objects.filter(
+        ad_receiver__user=users[0], status="pending"
+    ).order_by("-created_at").explain()
+    sended_plan = ExchangeProposal.objects.filter(
+        ad_sender__user=users[0], status="pending"
+    ).order_by("-created_at").explain()
+    assert "ad_user_created_idx" in received_plan
+    assert "exchange_receiver_status_idx" in received_plan
+    assert "ad_user_created_idx" in sended_plan
+    assert "exchange_sender_status_idx" in sended_plan
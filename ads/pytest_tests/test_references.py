@@ -0,0 +1,43 @@
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from ..models import Ad, Category
+from ..pagination import cached_count
+from ..references import ReferenceCache, load_references
+
+
+@pytest.mark.django_db
+def test_reference_cache_follows_shared_version(category):
+    categories = ReferenceCache(Category, check_interval=0)
+    assert categories.ids_for_slugs([category.slug]) == [category.id]
+    Category.objects.filter(id=category.id).update(slug="renamed")
+    assert categories.ids_for_slugs(["renamed"]) == []
+    cache.set(categories.version_key, "written by another process")
+    assert categories.ids_for_slugs(["renamed"]) == [category.id]
+
+
+@pytest.mark.django_db
+def test_slug_filters_resolve_ids_from_references(api_client, ad_fixture,
+                                                  category, condition):
+    ad = ad_fixture(category=[category], condition=condition)
+    ad_fixture(category=[category])
+    load_references()
+    url = (f"/api/v1/ads/?category__slug={category.slug}"
+           f"&condition__slug={condition.slug}")
+    with CaptureQueriesContext(connection) as context:
+        response = api_client.get(url)
+    assert [item["id"] for item in response.data] == [ad.id]
+    assert response.data[0]["category"] == [
+        {"id": category.id, "title": category.title, "slug": category.slug}]
+    assert response.data[0]["condition"]["slug"] == condition.slug
+    sql = " ".join(query["sql"] for query in context.captured_queries)
+    assert '"ads_category"' not in sql
+    assert '"ads_condition"' not in sql
+    assert api_client.get(
+        "/api/v1/ads/?condition__slug=unknown").data == []
+    for query in ("condition__slug=unknown", "condition__slug__in=unknown"):
+        response = api_client.get(f"/api/v1/ads/?limit=10&{query}")
+        assert response.status_code == 200
+        assert (response.data["count"], response.data["results"]) == (0, [])
+    assert cached_count(Ad.objects.filter(condition__in=[]), 60) == 0
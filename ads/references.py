@@ -0,0 +1,137 @@
+import asyncio
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Category, Condition
+
+REFERENCE_VERSION_KEY = 'references:{label}:version'
+REFERENCE_CHECK_INTERVAL = 1
+
+ReferenceState = namedtuple(
+    'ReferenceState', ('version', 'objects', 'slugs', 'representations'))
+
+
+def in_event_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class ReferenceCache:
+
+    def __init__(self, model, check_interval=REFERENCE_CHECK_INTERVAL):
+        self.model = model
+        self.version_key = REFERENCE_VERSION_KEY.format(
+            label=model._meta.label_lower)
+        self.check_interval = check_interval
+        self.state = None
+        self.checked_at = 0
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def get_version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            cache.add(self.version_key, uuid.uuid4().hex, timeout=None)
+            version = cache.get(self.version_key)
+        return version
+
+    def is_fresh(self):
+        return (self.state is not None
+                and time.monotonic() - self.checked_at < self.check_interval)
+
+    def load(self):
+        state = self.state
+        now = time.monotonic()
+        if state is not None and (now - self.checked_at < self.check_interval
+                                  or in_event_loop()):
+            return state
+        generation = self.generation
+        version = self.get_version()
+        if state is None or state.version != version:
+            objects = self.model.objects.in_bulk()
+            state = ReferenceState(
+                version, objects,
+                {obj.slug: pk for pk, obj in objects.items()}, {})
+        with self.lock:
+            if generation == self.generation:
+                self.state = state
+                self.checked_at = now
+        return state
+
+    async def aload(self, pks=()):
+        state = self.state
+        if state is not None and any(pk not in state.objects for pk in pks):
+            self.invalidate()
+        if not self.is_fresh():
+            return await sync_to_async(self.load)()
+        return self.state
+
+    def all(self):
+        return self.load().objects
+
+    def in_bulk(self, pks):
+        objects = self.all()
+        return {pk: objects[pk] for pk in pks if pk in objects}
+
+    def ids_for_slugs(self, slugs):
+        state = self.load()
+        return [state.slugs[slug] for slug in slugs if slug in state.slugs]
+
+    def represent(self, pk, serializer_class):
+        state = self.load()
+        if pk not in state.objects and not in_event_loop():
+            self.invalidate()
+            state = self.load()
+            if pk not in state.objects:
+                return None
+        representations = state.representations.setdefault(
+            serializer_class, {})
+        if pk not in representations:
+            representations[pk] = dict(
+                serializer_class(state.objects[pk]).data)
+        return dict(representations[pk])
+
+    def invalidate(self):
+        with self.lock:
+            self.generation += 1
+            self.state = None
+
+    def bump_version(self):
+        cache.set(self.version_key, uuid.uuid4().hex, timeout=None)
+        self.invalidate()
+
+    def bump_version_on_commit(self):
+        self.bump_version()
+        transaction.on_commit(self.bump_version)
+
+
+categories = ReferenceCache(Category)
+conditions = ReferenceCache(Condition)
+reference_caches = {Category: categories, Condition: conditions}
+
+
+def invalidate_references():
+    for reference_cache in reference_caches.values():
+        reference_cache.invalidate()
+
+
+def load_references():
+    for reference_cache in reference_caches.values():
+        reference_cache.load()
+
+
+async def aload_references():
+    for reference_cache in reference_caches.values():
+        await reference_cache.aload()
@@ -1,13 +1,31 @@
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS, PKOnlyObject
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.dispatch import Signal
 from django.shortcuts import get_object_or_404
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError as DjangoValidationError
 import base64
-from .models import Category, Condition, Ad, ExchangeProposal
+import binascii
+from collections import defaultdict
+from functools import partial
+from .cache import bump_versions
+from .exchanges import TRANSITION_STATUSES
+from .facets import invalidate_facets
+from .images import IMAGE_PENDING, is_image_header, pipeline
+from .models import (Category, Condition, Ad, AdCategory, BarterCycle,
+                     ExchangeProposal, ImageUpload)
+from .pagination import invalidate_counts
+from . import references
+from .uploads import UPLOAD_HANDLE_PREFIX
 from users.serializers import UserDetailSerialzier
 
 User = get_user_model()
 
+ads_saved = Signal()
+
 
 class CategorySerializer(serializers.ModelSerializer):
 
@@ -24,34 +42,276 @@ class ConditionSerializer(serializers.ModelSerializer):
 
 
 class Base64ImageField(serializers.ImageField):
+    default_error_messages = {
+        'invalid_upload': 'Unknown upload handle.',
+    }
+
+    def get_upload(self, handle):
+        request = self.context.get('request')
+        try:
+            return ImageUpload.objects.get(id=handle, user=request.user)
+        except (ImageUpload.DoesNotExist, DjangoValidationError):
+            self.fail('invalid_upload')
+
     def to_internal_value(self, data):
+        if isinstance(data, str) and data.startswith(UPLOAD_HANDLE_PREFIX):
+            return self.get_upload(data[len(UPLOAD_HANDLE_PREFIX):]).file
+
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
+            try:
+                format, imgstr = data.split(';base64,')
+                ext = format.split('/')[-1]
+                data = ContentFile(base64.b64decode(imgstr),
+                                   name='temp.' + ext)
+            except (ValueError, binascii.Error):
+                self.fail('invalid_image')
+
+        # Full decoding is left to the image pipeline, only the header
+        # is checked while the request is being served.
+        file = serializers.FileField.to_internal_value(self, data)
+        if not is_image_header(file):
+            self.fail('invalid_image')
+        return file
+
+
+def to_pk(value):
+    if isinstance(value, bool):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class BatchPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    default_error_messages = {
+        'does_not_exist_many':
+            'Invalid pks {pk_values} - objects do not exist.',
+    }
+
+    def __init__(self, **kwargs):
+        self.cache = kwargs.pop('cache', None)
+        self.serializer = kwargs.pop('serializer', None)
+        self.pk_source = kwargs.pop('pk_source', None)
+        super().__init__(**kwargs)
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        list_kwargs.update((key, value) for key, value in kwargs.items()
+                           if key in MANY_RELATION_KWARGS)
+        return BatchManyRelatedField(**list_kwargs)
+
+    def get_objects(self, pks):
+        if self.cache is not None:
+            return self.cache.in_bulk(pks)
+        return self.get_queryset().in_bulk(pks)
+
+    def to_pk(self, data):
+        pk = to_pk(data)
+        if pk is None:
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        return pk
+
+    def to_internal_value(self, data):
+        pk = self.to_pk(data)
+        objects = self.get_objects([pk])
+        if pk not in objects:
+            self.fail('does_not_exist', pk_value=data)
+        return objects[pk]
+
+    def to_representation(self, value):
+        if self.cache is not None and self.serializer is not None:
+            return self.cache.represent(value.pk, self.serializer)
+        return super().to_representation(value)
+
+
+class BatchManyRelatedField(serializers.ManyRelatedField):
+
+    def get_attribute(self, instance):
+        pk_source = self.child_relation.pk_source
+        if pk_source is None:
+            return super().get_attribute(instance)
+        return [PKOnlyObject(pk) for pk in getattr(instance, pk_source)]
+
+    def to_representation(self, iterable):
+        return [value for value in super().to_representation(iterable)
+                if value is not None]
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        pks = [self.child_relation.to_pk(item) for item in data]
+        objects = self.child_relation.get_objects(set(pks))
+        missing = [pk for pk in dict.fromkeys(pks) if pk not in objects]
+        if missing:
+            message = self.child_relation.error_messages[
+                'does_not_exist_many'].format(
+                    pk_values=', '.join(f'"{pk}"' for pk in missing))
+            raise serializers.ValidationError(message, code='does_not_exist')
+        return [objects[pk] for pk in pks]
 
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
 
+class ImageVariantsField(serializers.Field):
+
+    def __init__(self, variants=None, **kwargs):
+        self.variants = variants
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        variants = self.context.get('image_variants', self.variants)
+        request = self.context.get('request')
+        urls = {}
+        for variant, name in value.items():
+            if variants is not None and variant not in variants:
+                continue
+            url = default_storage.url(name)
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            urls[variant] = url
+        return urls
+
+
+class AdListSerializer(serializers.ListSerializer):
+    default_error_messages = {
+        'not_found': 'Ad {pk_value} does not exist.',
+        'not_owner': 'You are not the author of this ad!',
+        'duplicate': 'Ad {pk_value} is listed more than once.',
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            self.instances = {ad.pk: ad for ad in self.instance or ()}
+            self.targets = []
+            self.target_ids = set()
         return super().to_internal_value(data)
 
+    def get_target(self, data):
+        pk = to_pk(data.get('id')) if isinstance(data, dict) else None
+        ad = self.instances.get(pk)
+        if ad is None:
+            error = self.error_messages['not_found'].format(pk_value=pk)
+        elif ad.user_id != self.context['request'].user.id:
+            error = self.error_messages['not_owner']
+        elif pk in self.target_ids:
+            error = self.error_messages['duplicate'].format(pk_value=pk)
+        else:
+            return ad
+        raise serializers.ValidationError({'id': [error]})
+
+    def run_child_validation(self, data):
+        if self.instance is None:
+            return super().run_child_validation(data)
+        ad = self.get_target(data)
+        self.child.instance = ad
+        self.child.initial_data = data
+        validated = super().run_child_validation(data)
+        self.targets.append(ad)
+        self.target_ids.add(ad.pk)
+        return validated
+
+    def schedule_image_processing(self, ads):
+        pending = [ad for ad in ads if ad.image_status == IMAGE_PENDING]
+        uploads = [ad.image_url.name for ad in pending
+                   if ad.image_url.name.startswith(
+                       ImageUpload.file.field.upload_to)]
+        if uploads:
+            ImageUpload.objects.filter(file__in=uploads).delete()
+        for ad in pending:
+            transaction.on_commit(partial(pipeline.submit, ad.id))
+
+    def create(self, validated_data):
+        categories = [attrs.pop('category') for attrs in validated_data]
+        for attrs in validated_data:
+            self.child.set_image_status(attrs)
+        with transaction.atomic():
+            ads = Ad.objects.bulk_create(
+                Ad(**attrs) for attrs in validated_data)
+            AdCategory.objects.bulk_create(
+                AdCategory(ad=ad, category=category)
+                for ad, ad_categories in zip(ads, categories)
+                for category in ad_categories)
+            self.schedule_image_processing(ads)
+            ads_saved.send(sender=Ad, ids=[ad.pk for ad in ads])
+        invalidate_counts(Ad)
+        invalidate_facets()
+        return ads
+
+    def update(self, instances, validated_data):
+        image_field = Ad._meta.get_field('image_url')
+        groups = defaultdict(list)
+        categories = {}
+        for ad, attrs in zip(self.targets, validated_data):
+            attrs.pop('user', None)
+            if 'category' in attrs:
+                categories[ad] = attrs.pop('category')
+            self.child.set_image_status(attrs)
+            for attr, value in attrs.items():
+                setattr(ad, attr, value)
+            if 'image_url' in attrs:
+                image_field.pre_save(ad, add=False)
+            if attrs:
+                groups[tuple(sorted(attrs))].append(ad)
+        with transaction.atomic():
+            for fields, ads in groups.items():
+                Ad.objects.bulk_update(ads, fields)
+            if categories:
+                AdCategory.objects.filter(ad__in=categories).delete()
+                AdCategory.objects.bulk_create(
+                    AdCategory(ad=ad, category=category)
+                    for ad, ad_categories in categories.items()
+                    for category in ad_categories)
+            self.schedule_image_processing(
+                ad for ad, attrs in zip(self.targets, validated_data)
+                if 'image_status' in attrs)
+            ads_saved.send(sender=Ad, ids=[ad.pk for ad in self.targets])
+        bump_versions('ads.ad', [ad.pk for ad in self.targets])
+        invalidate_counts(Ad)
+        invalidate_facets()
+        return self.targets
+
 
 class AdSerializer(serializers.ModelSerializer):
-    category = serializers.PrimaryKeyRelatedField(
-        queryset=Category.objects.all(), many=True)
-    condition = serializers.PrimaryKeyRelatedField(
-        queryset=Condition.objects.all())
+    category = BatchPrimaryKeyRelatedField(
+        queryset=Category.objects.all(), many=True,
+        cache=references.categories, serializer=CategorySerializer,
+        pk_source='category_ids')
+    condition = BatchPrimaryKeyRelatedField(
+        queryset=Condition.objects.all(),
+        cache=references.conditions, serializer=ConditionSerializer)
     image_url = Base64ImageField(required=True, allow_null=True)
+    image_variants = ImageVariantsField()
     user = serializers.PrimaryKeyRelatedField(read_only=True)
 
     class Meta:
         model = Ad
         fields = ('id', 'user', 'title', 'description',
-                  'image_url', 'category', 'condition', 'created_at')
-        read_only_fields = ('created_at',)
+                  'image_url', 'image_status', 'image_variants',
+                  'category', 'condition', 'latitude', 'longitude',
+                  'created_at')
+        read_only_fields = ('image_status', 'created_at',)
+        list_serializer_class = AdListSerializer
+
+    def set_image_status(self, validated_data):
+        if validated_data.get('image_url'):
+            validated_data['image_status'] = IMAGE_PENDING
+            validated_data['image_variants'] = {}
+
+    def schedule_image_processing(self, ad):
+        if ad.image_status == IMAGE_PENDING:
+            if ad.image_url.name.startswith(ImageUpload.file.field.upload_to):
+                ImageUpload.objects.filter(file=ad.image_url.name).delete()
+            transaction.on_commit(lambda: pipeline.submit(ad.id))
 
     def create(self, validated_data):
         category = validated_data.pop('category')
+        self.set_image_status(validated_data)
         new_ad = Ad.objects.create(**validated_data)
         new_ad.category.set(category)
+        self.schedule_image_processing(new_ad)
         return new_ad
 
     def update(self, instance, validated_data):
@@ -61,15 +321,17 @@ class AdSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError('Condition field is required')
         category_data = validated_data.pop('category')
         validated_data.pop('user', None)
+        self.set_image_status(validated_data)
         instance.category.set(category_data)
-        return super().update(instance, validated_data)
+        instance = super().update(instance, validated_data)
+        if 'image_status' in validated_data:
+            self.schedule_image_processing(instance)
+        return instance
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        representation['category'] = CategorySerializer(
-            instance.category, many=True).data
-        representation['condition'] = ConditionSerializer(
-            instance.condition).data
+        if representation['condition'] is None:
+            representation['condition'] = ConditionSerializer(None).data
         representation['user'] = UserDetailSerialzier(instance.user).data
         return representation
 
@@ -88,44 +350,89 @@ class AdSerializer(serializers.ModelSerializer):
                 "Condition field cannot be empty.")
         return value
 
+    def validate(self, attrs):
+        latitude = attrs.get(
+            'latitude', getattr(self.instance, 'latitude', None))
+        longitude = attrs.get(
+            'longitude', getattr(self.instance, 'longitude', None))
+        if (latitude is None) != (longitude is None):
+            raise serializers.ValidationError(
+                'Latitude and longitude must be set together.')
+        return attrs
+
+
+class ImageUploadSerializer(serializers.ModelSerializer):
+    handle = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ImageUpload
+        fields = ('id', 'handle', 'file', 'created_at')
+        read_only_fields = ('created_at',)
+
+    def get_handle(self, obj):
+        return f'{UPLOAD_HANDLE_PREFIX}{obj.id}'
+
 
 class ExchangeListSerializer(serializers.ModelSerializer):
     sender_ad_id = serializers.ReadOnlyField(source='ad_sender.id')
     sender_ad_title = serializers.ReadOnlyField(source='ad_sender.title')
-    sender_ad_user = serializers.ReadOnlyField(source='ad_sender.user.id')
+    sender_ad_user = serializers.ReadOnlyField(source='ad_sender.user_id')
     sender_ad_description = serializers.ReadOnlyField(
         source='ad_sender.description')
     sender_ad_condition = serializers.ReadOnlyField(
-        source='ad_sender.condition.id')
+        source='ad_sender.condition_id')
     sender_ad_category = CategorySerializer(
         source='ad_sender.category', many=True, read_only=True)
     sender_ad_image_url = Base64ImageField(
         source='ad_sender.image_url', read_only=True)
+    sender_ad_image_variants = ImageVariantsField(
+        source='ad_sender.image_variants', variants=('thumb',))
     receiver_ad_id = serializers.ReadOnlyField(source='ad_receiver.id')
     receiver_ad_title = serializers.ReadOnlyField(source='ad_receiver.title')
-    receiver_ad_user = serializers.ReadOnlyField(source='ad_receiver.user.id')
+    receiver_ad_user = serializers.ReadOnlyField(source='ad_receiver.user_id')
     receiver_ad_description = serializers.ReadOnlyField(
         source='ad_receiver.description')
     receiver_ad_condition = serializers.ReadOnlyField(
-        source='ad_receiver.condition.id')
+        source='ad_receiver.condition_id')
     receiver_ad_category = CategorySerializer(
         source='ad_receiver.category', many=True, read_only=True)
     receiver_ad_image_url = Base64ImageField(
         source='ad_receiver.image_url', read_only=True)
+    receiver_ad_image_variants = ImageVariantsField(
+        source='ad_receiver.image_variants', variants=('thumb',))
 
     class Meta:
         model = ExchangeProposal
         fields = ('sender_ad_id', 'sender_ad_title', 'sender_ad_user',
                   'sender_ad_description', 'sender_ad_condition',
                   'sender_ad_category', 'sender_ad_image_url',
+                  'sender_ad_image_variants',
                   'receiver_ad_id', 'receiver_ad_title',
                   'receiver_ad_user', 'receiver_ad_description',
                   'receiver_ad_condition', 'receiver_ad_category',
-                  'receiver_ad_image_url',
+                  'receiver_ad_image_url', 'receiver_ad_image_variants',
                   'comment', 'status', 'created_at')
         read_only_fields = ('comment', 'created_at',)
 
 
+class ExchangeTransitionListSerializer(serializers.ListSerializer):
+
+    def validate(self, attrs):
+        ids = [item['id'] for item in attrs]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError(
+                'Each exchange may be listed only once.')
+        return attrs
+
+
+class ExchangeTransitionSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=TRANSITION_STATUSES)
+
+    class Meta:
+        list_serializer_class = ExchangeTransitionListSerializer
+
+
 class ExchangeProposalSerializer(serializers.ModelSerializer):
     ad_sender = serializers.PrimaryKeyRelatedField(queryset=Ad.objects.none())
     ad_receiver = serializers.PrimaryKeyRelatedField(
@@ -164,3 +471,10 @@ class ExchangeProposalSerializer(serializers.ModelSerializer):
         if data['ad_sender'].user == data['ad_receiver'].user:
             raise serializers.ValidationError('You cant propose yourself!')
         return data
+
+
+class BarterCycleSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = BarterCycle
+        fields = ('id', 'users', 'ads', 'created_at')
@@ -0,0 +1,246 @@
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import DEFERRED
+from django.db.models.signals import (m2m_changed, post_delete,
+                                      post_migrate, post_save, pre_delete)
+from django.dispatch import receiver
+
+from .cache import USER_LABEL, bump_version, bump_versions
+from .cards import mark_cards, refresh_cards
+from .cycles import detector
+from .events import EXCHANGE_CREATED, publish_on_commit
+from .exchanges import exchanges_accepted
+from .facets import (CATEGORY, CONDITION, adjust_facets,
+                     invalidate_facets)
+from .images import image_processed
+from .models import (Ad, AdCard, AdCategory, BarterCycle, Category,
+                     Condition, ExchangeProposal)
+from .pagination import invalidate_counts
+from .references import reference_caches
+from .serializers import ads_saved
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Ad)
+@receiver(post_delete, sender=Ad)
+@receiver(post_save, sender=AdCategory)
+@receiver(post_delete, sender=AdCategory)
+def invalidate_ad_counts(sender, **kwargs):
+    invalidate_counts(Ad)
+    invalidate_counts(AdCard)
+
+
+@receiver(m2m_changed, sender=Ad.category.through)
+def invalidate_ad_category_counts(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_counts(Ad)
+
+
+@receiver(post_save, sender=Ad)
+@receiver(post_delete, sender=Ad)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Condition)
+@receiver(post_delete, sender=Condition)
+def invalidate_cached_ads(sender, instance, **kwargs):
+    bump_version(sender._meta.label_lower, instance.pk)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Condition)
+@receiver(post_delete, sender=Condition)
+def invalidate_reference_cache(sender, **kwargs):
+    reference_caches[sender].bump_version_on_commit()
+
+
+@receiver(post_save, sender=AdCategory)
+@receiver(post_delete, sender=AdCategory)
+def invalidate_cached_ad_categories(sender, instance, **kwargs):
+    bump_version('ads.ad', instance.ad_id)
+
+
+@receiver(m2m_changed, sender=Ad.category.through)
+def invalidate_cached_ad_category_set(sender, instance, action, reverse,
+                                      pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        bump_version('ads.ad', instance.pk)
+    elif pk_set:
+        bump_versions('ads.ad', pk_set)
+    else:
+        bump_versions('ads.ad', instance.ad_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user_ads(sender, instance, update_fields=None,
+                               **kwargs):
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    bump_version(USER_LABEL, instance.pk)
+
+
+@receiver(post_save, sender=ExchangeProposal)
+def publish_created_exchange(sender, instance, created, **kwargs):
+    if not created:
+        return
+    publish_on_commit([(
+        (instance.ad_sender.user_id, instance.ad_receiver.user_id),
+        EXCHANGE_CREATED,
+        {'id': instance.pk, 'status': instance.status,
+         'ad_sender': instance.ad_sender_id,
+         'ad_receiver': instance.ad_receiver_id})],
+        using=kwargs.get('using'))
+
+
+@receiver(post_save, sender=ExchangeProposal)
+def detect_barter_cycles(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(partial(detector.submit, instance.pk),
+                              using=kwargs.get('using'))
+
+
+@receiver(post_delete, sender=Ad)
+def discard_deleted_ad_cycles(sender, instance, **kwargs):
+    BarterCycle.objects.filter(ads__contains=[instance.pk]).delete()
+
+
+@receiver(exchanges_accepted)
+def discard_traded_ad_cycles(sender, ids, **kwargs):
+    ads = set()
+    for ad_sender, ad_receiver in ExchangeProposal.objects.filter(
+            id__in=ids).values_list('ad_sender', 'ad_receiver'):
+        ads.update((ad_sender, ad_receiver))
+    BarterCycle.objects.filter(ads__overlap=list(ads)).delete()
+
+
+@receiver(post_save, sender=Ad)
+def count_saved_ad_facets(sender, instance, created, update_fields=None,
+                          **kwargs):
+    if update_fields and 'condition' not in update_fields:
+        return
+    previous = None if created else getattr(
+        instance, '_loaded_condition_id', DEFERRED)
+    instance._loaded_condition_id = instance.condition_id
+    if previous is DEFERRED:
+        invalidate_facets()
+    elif previous != instance.condition_id:
+        adjust_facets({(CONDITION, previous): -1,
+                       (CONDITION, instance.condition_id): 1},
+                      using=kwargs.get('using'))
+
+
+@receiver(post_delete, sender=Ad)
+def count_deleted_ad_facets(sender, instance, **kwargs):
+    adjust_facets({(CONDITION, instance.condition_id): -1},
+                  using=kwargs.get('using'))
+
+
+@receiver(post_save, sender=AdCategory)
+@receiver(post_delete, sender=AdCategory)
+def count_ad_category_facets(sender, instance, created=False, **kwargs):
+    if kwargs.get('signal') is post_save and not created:
+        return
+    delta = 1 if created else -1
+    adjust_facets({(CATEGORY, instance.category_id): delta},
+                  using=kwargs.get('using'))
+
+
+@receiver(m2m_changed, sender=Ad.category.through)
+def count_added_ad_category_facets(sender, instance, action, reverse,
+                                   pk_set, **kwargs):
+    if action != 'post_add' or not pk_set:
+        return
+    if reverse:
+        deltas = {(CATEGORY, instance.pk): len(pk_set)}
+    else:
+        deltas = {(CATEGORY, pk): 1 for pk in pk_set}
+    adjust_facets(deltas, using=kwargs.get('using'))
+
+
+@receiver(post_save, sender=Ad)
+def refresh_saved_ad_card(sender, instance, **kwargs):
+    mark_cards([instance.pk])
+
+
+@receiver(m2m_changed, sender=Ad.category.through)
+def refresh_ad_category_cards(sender, instance, action, reverse, pk_set,
+                              **kwargs):
+    if reverse and action == 'pre_clear':
+        instance._cleared_ad_ids = list(
+            instance.ad_set.values_list('pk', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        mark_cards([instance.pk])
+    elif action == 'post_clear':
+        mark_cards(instance.__dict__.pop('_cleared_ad_ids', ()))
+    else:
+        mark_cards(pk_set)
+
+
+@receiver(ads_saved)
+def refresh_bulk_saved_ad_cards(sender, ids, **kwargs):
+    mark_cards(ids)
+
+
+@receiver(image_processed)
+def refresh_processed_ad_card(sender, ad_id, **kwargs):
+    refresh_cards([ad_id])
+
+
+@receiver(pre_delete, sender=Category)
+def collect_category_cards(sender, instance, **kwargs):
+    instance._card_ad_ids = list(AdCategory.objects.filter(
+        category=instance).values_list('ad', flat=True))
+
+
+@receiver(pre_delete, sender=Condition)
+def collect_condition_cards(sender, instance, **kwargs):
+    instance._card_ad_ids = list(Ad.objects.filter(
+        condition=instance).values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Condition)
+def refresh_reference_cards(sender, instance, created, **kwargs):
+    if created:
+        return
+    if sender is Category:
+        ads = AdCategory.objects.filter(category=instance).values_list(
+            'ad', flat=True)
+    else:
+        ads = Ad.objects.filter(condition=instance).values_list(
+            'pk', flat=True)
+    mark_cards(ads)
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Condition)
+def refresh_deleted_reference_cards(sender, instance, **kwargs):
+    mark_cards(instance.__dict__.pop('_card_ad_ids', ()))
+
+
+@receiver(post_save, sender=User)
+def refresh_user_cards(sender, instance, created, update_fields=None,
+                       **kwargs):
+    if created or update_fields and set(update_fields) <= {'last_login'}:
+        return
+    mark_cards(Ad.objects.filter(user=instance).values_list('pk', flat=True))
+
+
+@receiver(post_migrate)
+def build_missing_cards(sender, using, **kwargs):
+    if sender.label != Ad._meta.app_label:
+        return
+    executor = MigrationExecutor(connections[using])
+    if executor.migration_plan(executor.loader.graph.leaf_nodes()):
+        return
+    refresh_cards(Ad.objects.using(using).filter(
+        card__isnull=True).values_list('pk', flat=True))
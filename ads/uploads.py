@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from rest_framework import exceptions, status
+
+from .images import is_image_signature
+
+UPLOAD_HANDLE_PREFIX = 'upload:'
+MULTIPART_OVERHEAD = 4096
+
+
+class UploadTooLarge(exceptions.APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Uploaded file is too large.'
+    default_code = 'too_large'
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+
+    def __init__(self, request=None, max_size=None):
+        super().__init__(request)
+        self.max_size = max_size or settings.IMAGE_UPLOAD_MAX_SIZE
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        if content_length and (
+                content_length > self.max_size + MULTIPART_OVERHEAD):
+            raise UploadTooLarge()
+        return super().handle_raw_input(
+            input_data, META, content_length, boundary, encoding)
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.max_size:
+            raise UploadTooLarge()
+        if start == 0 and not is_image_signature(raw_data[:12]):
+            raise exceptions.ValidationError(
+                {'file': ['Upload a valid image.']})
+        return super().receive_data_chunk(raw_data, start)
@@ -1,7 +1,8 @@
 from django.urls import path, include, re_path
 from rest_framework.routers import DefaultRouter
 from .views import (AdViewSet, CategoryViewSet, ConditionViewSet,
-                    ExchangeListViewSet, ExchangeProposalViewSet)
+                    ExchangeListViewSet, ExchangeProposalViewSet,
+                    ImageUploadViewSet, exchange_events)
 
 app_name = 'ads'
 
@@ -10,10 +11,12 @@ router.register('ads', AdViewSet)
 router.register('categories', CategoryViewSet)
 router.register('conditions', ConditionViewSet)
 router.register('exchanges', ExchangeListViewSet, basename='exchanges')
+router.register('uploads', ImageUploadViewSet)
 
 urlpatterns = [
     re_path(r'^propose/(?P<user_id>\d+)/$',
             ExchangeProposalViewSet.as_view({'post': 'propose_exchange'})),
+    path('exchanges/events/', exchange_events),
     re_path(r'^exchanges/(?P<exchange>\d+)/$',
             ExchangeProposalViewSet.as_view({
                 'get': 'pending_exchanges',
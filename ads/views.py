@@ -1,15 +1,42 @@
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.contrib.auth import get_user_model
+from django.utils.http import parse_etags
+from django.views.decorators.http import require_GET
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import viewsets, response, permissions, filters, pagination
+from rest_framework import (viewsets, response, permissions,
+                            mixins, parsers)
 from rest_framework.decorators import action
 from rest_framework.status import (HTTP_403_FORBIDDEN, HTTP_200_OK,
-                                   HTTP_201_CREATED, HTTP_400_BAD_REQUEST)
-from .models import (Ad, ExchangeProposal,
-                     Category, Condition)
-from .serializers import (AdSerializer,
+                                   HTTP_201_CREATED, HTTP_400_BAD_REQUEST,
+                                   HTTP_304_NOT_MODIFIED, HTTP_409_CONFLICT,
+                                   HTTP_501_NOT_IMPLEMENTED)
+from . import references
+from .async_views import AsyncReadMixin
+from .cache import cache_ad, get_cached_ad, get_version
+from .cards import batched_cards
+from .exchanges import (InvalidTransition, NotReceiver, TransitionConflict,
+                        exchange_summary, transition_exchange,
+                        transition_exchanges)
+from .events import stream_events
+from .fast_serializers import (AdCardSerializer, CompiledAdSerializer,
+                               CompiledExchangeListSerializer)
+from .facets import (FACETS, count_facets, represent_facets,
+                     unfiltered_facets)
+from .filters import (AdCardFilterSet, AdFilterSet, FullTextSearchFilter,
+                      GeoDistanceFilter, trigram_available)
+from .matching import MATCH_LIMIT, find_matches
+from .pagination import AdPagination, AsyncLimitOffsetPagination
+from .models import (Ad, AdCard, BarterCycle, ExchangeProposal,
+                     Category, Condition, ImageUpload)
+from .serializers import (AdSerializer, BarterCycleSerializer,
                           ExchangeProposalSerializer, CategorySerializer,
-                          ConditionSerializer, ExchangeListSerializer)
+                          ConditionSerializer, ExchangeListSerializer,
+                          ExchangeTransitionSerializer,
+                          ImageUploadSerializer, to_pk)
+from .uploads import ImageUploadHandler
 
 User = get_user_model()
 
@@ -19,17 +46,197 @@ def user_check(request, object):
         return False
 
 
-class AdViewSet(viewsets.ModelViewSet):
-    queryset = Ad.objects.all()
+class AdViewSet(AsyncReadMixin, viewsets.ModelViewSet):
+    queryset = Ad.objects.with_relations()
     serializer_class = AdSerializer
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
-    pagination_class = pagination.LimitOffsetPagination
-    filter_backends = (DjangoFilterBackend, filters.SearchFilter)
-    filterset_fields = ('category__slug', 'condition__slug')
+    pagination_class = AdPagination
+    filter_backends = (DjangoFilterBackend, FullTextSearchFilter,
+                       GeoDistanceFilter)
     search_fields = ('title', 'description')
+    search_vector_field = 'search_vector'
+    search_trigram_fields = ('title',)
+    read_serializer_class = CompiledAdSerializer
+    card_serializer_class = AdCardSerializer
+    list_image_variants = ('thumb', 'medium')
+    bulk_max_size = 1000
+    matches_max_limit = 100
+    facets_query_param = 'facets'
+
+    def get_queryset(self):
+        if self.action == 'list':
+            return AdCard.objects.all()
+        return super().get_queryset()
+
+    @property
+    def filterset_class(self):
+        if self.action == 'list':
+            return AdCardFilterSet
+        return AdFilterSet
+
+    @property
+    def geohash_field(self):
+        return 'geohash' if self.action == 'list' else None
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action in ('list', 'matches'):
+            context['image_variants'] = self.list_image_variants
+        return context
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        with batched_cards():
+            serializer.save(user=self.request.user)
+
+    def perform_update(self, serializer):
+        with batched_cards():
+            serializer.save()
+
+    def get_read_serializer(self, *args, **kwargs):
+        kwargs.setdefault('context', self.get_serializer_context())
+        return self.read_serializer_class(*args, **kwargs)
+
+    def get_card_serializer(self, *args, **kwargs):
+        kwargs.setdefault('context', self.get_serializer_context())
+        return self.card_serializer_class(*args, **kwargs)
+
+    def bulk_response(self, ads, status):
+        queryset = self.get_queryset().filter(pk__in=[ad.pk for ad in ads])
+        fetched = {ad.pk: ad for ad in queryset}
+        serializer = self.get_read_serializer(
+            [fetched[ad.pk] for ad in ads], many=True)
+        return response.Response(serializer.data, status=status)
+
+    @action(detail=False, methods=['post', 'patch'], url_path='bulk')
+    def bulk(self, request):
+        if request.method == 'POST':
+            serializer = self.get_serializer(
+                data=request.data, many=True, max_length=self.bulk_max_size)
+            serializer.is_valid(raise_exception=True)
+            ads = serializer.save(user=request.user)
+            return self.bulk_response(ads, HTTP_201_CREATED)
+        ids = set()
+        if isinstance(request.data, list):
+            ids = {to_pk(item.get('id')) for item in request.data
+                   if isinstance(item, dict)} - {None}
+        serializer = self.get_serializer(
+            list(Ad.objects.filter(id__in=ids)), data=request.data,
+            many=True, partial=True, max_length=self.bulk_max_size)
+        serializer.is_valid(raise_exception=True)
+        ads = serializer.save()
+        return self.bulk_response(ads, HTTP_200_OK)
+
+    async def aprepare_objects(self, ads):
+        if self.action == 'list':
+            return
+        await references.categories.aload(
+            {pk for ad in ads for pk in ad.category_ids})
+        await references.conditions.aload(
+            {ad.condition_id for ad in ads} - {None})
+
+    async def afilter_queryset(self, queryset):
+        await references.aload_references()
+        if FullTextSearchFilter().get_search_terms(self.request):
+            await sync_to_async(trigram_available)(queryset.db)
+        return self.filter_queryset(queryset)
+
+    def get_requested_facets(self):
+        value = self.request.query_params.get(self.facets_query_param)
+        if not value:
+            return ()
+        names = [name for name in value.split(',') if name in FACETS]
+        return names or tuple(FACETS)
+
+    def get_facets(self, queryset, facets):
+        if queryset.query.where:
+            counts = count_facets(queryset)
+        else:
+            counts = unfiltered_facets(queryset.db)
+        return represent_facets(counts, facets)
+
+    def add_facets(self, result, facets):
+        if isinstance(result.data, list):
+            result.data = {'results': result.data}
+        result.data['facets'] = facets
+        return result
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        result = self.paginated_response(queryset, self.get_card_serializer)
+        facets = self.get_requested_facets()
+        if facets:
+            return self.add_facets(result, self.get_facets(queryset, facets))
+        return result
+
+    async def alist(self, request, *args, **kwargs):
+        queryset = await self.afilter_queryset(self.get_queryset())
+        result = await self.apaginated_response(
+            queryset, self.get_card_serializer)
+        facets = self.get_requested_facets()
+        if facets:
+            return self.add_facets(result, await sync_to_async(
+                self.get_facets)(queryset, facets))
+        return result
+
+    @action(detail=True, methods=['get'], url_path='matches')
+    def matches(self, request, pk=None):
+        ad_id = to_pk(pk)
+        if ad_id is None:
+            raise Http404
+        ad = get_object_or_404(
+            Ad.objects.only('id', 'user_id', 'condition_id'), id=ad_id)
+        limit = to_pk(request.query_params.get('limit'))
+        if limit is None or limit <= 0:
+            limit = MATCH_LIMIT
+        matches = find_matches(ad, limit=min(limit, self.matches_max_limit))
+        ads = self.get_queryset().in_bulk([pk for pk, _ in matches])
+        matches = [(ads[pk], score) for pk, score in matches if pk in ads]
+        data = self.get_read_serializer(
+            [match for match, _ in matches], many=True).data
+        return response.Response([
+            {'score': score, 'ad': item}
+            for (_, score), item in zip(matches, data)])
+
+    def get_cache_entry(self, request, pk):
+        entry = get_cached_ad(pk, request)
+        if entry is not None:
+            return entry, None
+        return None, get_version('ads.ad', pk)
+
+    def ad_response(self, request, instance, data, ad_version):
+        entry = cache_ad(instance, data, request, ad_version)
+        if entry is None:
+            return response.Response(data)
+        return self.cached_response(request, entry)
+
+    def retrieve(self, request, *args, **kwargs):
+        entry, ad_version = self.get_cache_entry(request, kwargs['pk'])
+        if entry is not None:
+            return self.cached_response(request, entry)
+        instance = self.get_object()
+        return self.ad_response(request, instance,
+                                self.get_read_serializer(instance).data,
+                                ad_version)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        entry, ad_version = await sync_to_async(self.get_cache_entry)(
+            request, kwargs['pk'])
+        if entry is not None:
+            return self.cached_response(request, entry)
+        await references.aload_references()
+        instance = await self.aget_object()
+        await self.aprepare_objects([instance])
+        return await sync_to_async(self.ad_response)(
+            request, instance, self.get_read_serializer(instance).data,
+            ad_version)
+
+    def cached_response(self, request, entry):
+        headers = {'ETag': entry['etag']}
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        if entry['etag'] in if_none_match or '*' in if_none_match:
+            return response.Response(status=HTTP_304_NOT_MODIFIED,
+                                     headers=headers)
+        return response.Response(entry['data'], headers=headers)
 
     def update(self, request, *args, **kwargs):
         ad = get_object_or_404(Ad, id=kwargs['pk'])
@@ -48,6 +255,22 @@ class AdViewSet(viewsets.ModelViewSet):
         return super().destroy(request, *args, **kwargs)
 
 
+class ImageUploadViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
+    queryset = ImageUpload.objects.all()
+    serializer_class = ImageUploadSerializer
+    permission_classes = (permissions.IsAuthenticated,)
+    parser_classes = (parsers.MultiPartParser, parsers.FileUploadParser)
+
+    def initial(self, request, *args, **kwargs):
+        request._request.upload_handlers = [
+            ImageUploadHandler(request._request)]
+        super().initial(request, *args, **kwargs)
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+        serializer.validated_data['file'].close()
+
+
 class CategoryViewSet(viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
@@ -60,18 +283,20 @@ class ConditionViewSet(viewsets.ModelViewSet):
     permission_classes = (permissions.IsAdminUser,)
 
 
-class ExchangeListViewSet(viewsets.ModelViewSet):
+class ExchangeListViewSet(AsyncReadMixin, viewsets.ModelViewSet):
     queryset = ExchangeProposal.objects.all()
     serializer_class = ExchangeListSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    pagination_class = AsyncLimitOffsetPagination
     filter_backends = (DjangoFilterBackend,)
     filterset_fields = ('ad_sender__user', 'ad_receiver__user', 'status')
+    batch_max_size = 1000
 
     def get_queryset(self):
-        own_ads = Ad.objects.filter(user=self.request.user)
+        proposals = ExchangeProposal.objects.with_ads().order_by(
+            '-created_at', '-id')
         if self.action == 'sended_exchange':
-            queryset = ExchangeProposal.objects.filter(
-                ad_sender_id__in=own_ads.values_list('id'))
+            queryset = proposals.filter(ad_sender__user=self.request.user)
             ad_sender = self.request.query_params.get('ad_sender__user')
             ad_receiver = self.request.query_params.get('ad_receiver__user')
             status = self.request.query_params.get('status')
@@ -83,8 +308,8 @@ class ExchangeListViewSet(viewsets.ModelViewSet):
                 queryset = queryset.filter(status=status)
             return queryset
         elif self.action == 'received_exchange':
-            queryset = ExchangeProposal.objects.filter(
-                ad_receiver_id__in=own_ads.values_list('id'))
+            queryset = proposals.filter(
+                ad_receiver__user=self.request.user)
             status = self.request.query_params.get('status')
             if status:
                 queryset = queryset.filter(status=status)
@@ -92,16 +317,53 @@ class ExchangeListViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'], url_path='sended')
     def sended_exchange(self, request):
-        serializer = ExchangeListSerializer(self.get_queryset(), many=True)
-        return response.Response(serializer.data, status=HTTP_200_OK)
+        return self.paginated_response(
+            self.get_queryset(), CompiledExchangeListSerializer)
 
     @action(detail=False, methods=['get'], url_path='received')
     def received_exchange(self, request):
-        serializer = ExchangeListSerializer(self.get_queryset(), many=True)
-        return response.Response(serializer.data, status=HTTP_200_OK)
+        return self.paginated_response(
+            self.get_queryset(), CompiledExchangeListSerializer)
+
+    async def asended_exchange(self, request):
+        return await self.apaginated_response(
+            self.get_queryset(), CompiledExchangeListSerializer)
+
+    async def areceived_exchange(self, request):
+        return await self.apaginated_response(
+            self.get_queryset(), CompiledExchangeListSerializer)
+
+    def get_cycles(self):
+        return BarterCycle.objects.filter(
+            users__contains=[self.request.user.id]).order_by(
+                '-created_at', '-id')
 
+    @action(detail=False, methods=['get'], url_path='cycles')
+    def cycles(self, request):
+        return self.paginated_response(
+            self.get_cycles(), BarterCycleSerializer)
 
-class ExchangeProposalViewSet(viewsets.ModelViewSet):
+    async def acycles(self, request):
+        return await self.apaginated_response(
+            self.get_cycles(), BarterCycleSerializer)
+
+    @action(detail=False, methods=['get'], url_path='summary')
+    def summary(self, request):
+        return response.Response(exchange_summary(request.user))
+
+    @action(detail=False, methods=['post'], url_path='batch')
+    def batch_transition(self, request):
+        serializer = ExchangeTransitionSerializer(
+            data=request.data, many=True, allow_empty=False,
+            max_length=self.batch_max_size)
+        serializer.is_valid(raise_exception=True)
+        outcomes = transition_exchanges(request.user, [
+            (item['id'], item['status'])
+            for item in serializer.validated_data])
+        return response.Response(outcomes, status=HTTP_200_OK)
+
+
+class ExchangeProposalViewSet(AsyncReadMixin, viewsets.ModelViewSet):
     permission_classes = (permissions.IsAuthenticated,)
 
     def get_serializer_class(self):
@@ -135,18 +397,56 @@ class ExchangeProposalViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get', 'put'], url_path='exchanges')
     def pending_exchanges(self, request, exchange):
-        exchange_detail = get_object_or_404(ExchangeProposal, id=exchange)
-        if request.method == 'GET':
-            serializer = ExchangeListSerializer(exchange_detail)
-            return response.Response(serializer.data)
         if request.method == 'PUT':
-            if request.user.id == exchange_detail.ad_receiver.user.id:
-                ExchangeProposal.objects.filter(id=exchange).update(
-                    status=request.data['status'])
-                serializer = ExchangeListSerializer(exchange_detail)
-                return response.Response(serializer.data,
-                                         status=HTTP_201_CREATED)
-            else:
+            status = (request.data.get('status')
+                      if isinstance(request.data, dict) else None)
+            try:
+                transition_exchange(exchange, request.user, status)
+            except ExchangeProposal.DoesNotExist:
+                raise Http404
+            except InvalidTransition:
+                return response.Response(
+                    {'status': ['Invalid status transition.']},
+                    status=HTTP_400_BAD_REQUEST)
+            except NotReceiver:
                 return response.Response(
                     {'error': 'You may not change status!'},
                     status=HTTP_400_BAD_REQUEST)
+            except TransitionConflict as error:
+                return response.Response(
+                    {'error': f'Exchange is already {error.status}!'},
+                    status=HTTP_409_CONFLICT)
+        exchange_detail = get_object_or_404(
+            ExchangeProposal.objects.with_ads(), id=exchange)
+        serializer = CompiledExchangeListSerializer(exchange_detail)
+        if request.method == 'PUT':
+            return response.Response(serializer.data,
+                                     status=HTTP_201_CREATED)
+        return response.Response(serializer.data)
+
+    async def apending_exchanges(self, request, exchange):
+        try:
+            exchange_detail = await ExchangeProposal.objects.with_ads().aget(
+                id=exchange)
+        except ExchangeProposal.DoesNotExist:
+            raise Http404
+        return response.Response(
+            CompiledExchangeListSerializer(exchange_detail).data)
+
+
+@require_GET
+async def exchange_events(request):
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {'detail': 'Event streams are only served under ASGI.'},
+            status=HTTP_501_NOT_IMPLEMENTED)
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse(
+            {'detail': 'Authentication credentials were not provided.'},
+            status=HTTP_403_FORBIDDEN)
+    response = StreamingHttpResponse(stream_events(user.pk),
+                                     content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
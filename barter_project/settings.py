@@ -100,3 +100,17 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+IMAGE_PROCESSING_WORKERS = int(os.getenv('IMAGE_PROCESSING_WORKERS', 2))
+
+IMAGE_UPLOAD_MAX_SIZE = int(os.getenv('IMAGE_UPLOAD_MAX_SIZE',
+                                      10 * 1024 * 1024))
+
+ASYNC_READ_VIEWS = bool(os.getenv('ASYNC_READ_VIEWS'))
+
+EXCHANGE_EVENTS_BROKER = os.getenv('EXCHANGE_EVENTS_BROKER',
+                                   'ads.events.LocalBroker')
+EXCHANGE_EVENTS_BUFFER_SIZE = int(os.getenv('EXCHANGE_EVENTS_BUFFER_SIZE',
+                                            100))
+
+CYCLE_DETECTION_WORKERS = int(os.getenv('CYCLE_DETECTION_WORKERS', 1))
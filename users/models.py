@@ -1,7 +1,16 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.core.validators import MaxValueValidator, MinValueValidator
 
 class User(AbstractUser):
     username = models.CharField(
         max_length=64, unique=True
     )
+    latitude = models.FloatField(
+        null=True, blank=True,
+        validators=(MinValueValidator(-90), MaxValueValidator(90))
+    )
+    longitude = models.FloatField(
+        null=True, blank=True,
+        validators=(MinValueValidator(-180), MaxValueValidator(180))
+    )
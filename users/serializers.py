@@ -30,3 +30,18 @@ class UserDetailSerialzier(serializers.ModelSerializer):
         model = User
         fields = ('username',)
         read_only_fields = ('username',)
+
+
+class UserLocationSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = User
+        fields = ('latitude', 'longitude')
+        extra_kwargs = {'latitude': {'required': True},
+                        'longitude': {'required': True}}
+
+    def validate(self, attrs):
+        if (attrs['latitude'] is None) != (attrs['longitude'] is None):
+            raise serializers.ValidationError(
+                'Latitude and longitude must be set together.')
+        return attrs
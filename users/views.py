@@ -2,7 +2,7 @@ from django.contrib.auth import get_user_model, login, logout, authenticate
 from rest_framework import viewsets, permissions, response, status
 from rest_framework.decorators import action
 from .serializers import (UserSerializer, UserCreationSerializer,
-                          UserDetailSerialzier)
+                          UserDetailSerialzier, UserLocationSerializer)
 
 User = get_user_model()
 
@@ -46,3 +46,14 @@ class UserViewset(viewsets.ModelViewSet):
     def logout(self, request):
         logout(request)
         return (response.Response(status=status.HTTP_200_OK))
+
+    @action(detail=False, methods=['get', 'put'], url_path='location',
+            permission_classes=(permissions.IsAuthenticated,))
+    def location(self, request):
+        if request.method == 'PUT':
+            serializer = UserLocationSerializer(
+                request.user, data=request.data)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+        return response.Response(
+            UserLocationSerializer(request.user).data)